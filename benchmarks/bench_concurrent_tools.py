@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+并发工具调用基准测试
+
+本地替身服务器每个请求模拟 200ms 的处理时间，通过 FastMCP 的 call_tool 同时发起多个调用，
+对比两种工具实现的吞吐量：
+
+- 同步工具（旧实现）：在工具函数中用 httpx.Client 发出阻塞请求，整个网络请求期间事件循环被占用，
+  并发调用实际上只能逐个执行
+- 原生 async 工具（set_note_privacy）：多个调用可以在同一事件循环中重叠执行
+
+另外给出原生 async 工具逐个调用时的吞吐量作为参照。
+同步工具会阻塞事件循环，替身服务器在单独的线程中运行自己的事件循环。
+
+运行方式：
+    pip install -e .
+    python benchmarks/bench_concurrent_tools.py [调用次数] [服务端延迟秒数]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("MOWEN_API_KEY", "bench")
+# 本地状态写入临时目录，不读写 ~/.mowen-mcp-server 中的真实数据
+os.environ.setdefault("MOWEN_STATE_DIR", tempfile.mkdtemp(prefix="mowen-bench-"))
+# 关闭限频和配额，只测量工具调用本身的并发能力
+os.environ.setdefault("MOWEN_RATE_LIMIT_INTERVAL", "0")
+os.environ.setdefault("MOWEN_QUOTA_ENABLED", "false")
+
+from stub_server import StubMowenServer  # noqa: E402
+
+import mowen_mcp_server.server as server  # noqa: E402
+from mowen_mcp_server.config import Config  # noqa: E402
+
+BLOCKING_TOOL = "set_note_privacy_blocking"
+
+
+@contextmanager
+def stub_in_thread(delay: float) -> Iterator[str]:
+    """在单独的线程中运行替身服务器，返回其地址"""
+    started = threading.Event()
+    state = {}
+
+    async def serve() -> None:
+        async with StubMowenServer(handshake_delay=0, response_delay=delay) as stub:
+            state["url"] = stub.base_url
+            state["loop"] = asyncio.get_running_loop()
+            state["stop"] = asyncio.Event()
+            started.set()
+            await state["stop"].wait()
+
+    thread = threading.Thread(target=asyncio.run, args=(serve(),), daemon=True)
+    thread.start()
+    started.wait()
+    try:
+        yield state["url"]
+    finally:
+        state["loop"].call_soon_threadsafe(state["stop"].set)
+        thread.join()
+
+
+def register_blocking_tool(base_url: str) -> httpx.Client:
+    """注册一个按旧实现方式编写的同步工具：在事件循环线程中发出阻塞的HTTP请求"""
+    client = httpx.Client(base_url=base_url, headers={"Authorization": "Bearer bench"})
+
+    def set_note_privacy_blocking(note_id: str, privacy_type: str) -> str:
+        response = client.post(
+            server.API_PREFIX + "note/set",
+            json={"noteId": note_id, "section": 1, "settings": {"privacy": {"type": privacy_type}}},
+        )
+        response.raise_for_status()
+        return response.text
+
+    server.mcp.add_tool(set_note_privacy_blocking, name=BLOCKING_TOOL)
+    return client
+
+
+async def call(tool: str, index: int) -> None:
+    await server.mcp.call_tool(tool, {"note_id": f"note-{index}", "privacy_type": "public"})
+
+
+async def timed(coro) -> float:
+    start = time.perf_counter()
+    await coro
+    return time.perf_counter() - start
+
+
+async def sequential(tool: str, calls: int) -> None:
+    for i in range(calls):
+        await call(tool, i)
+
+
+async def main() -> None:
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+
+    with stub_in_thread(delay) as base_url:
+        with register_blocking_tool(base_url):
+            blocking = await timed(asyncio.gather(*(call(BLOCKING_TOOL, i) for i in range(calls))))
+        async with server.MowenAPI("bench", base_url, Config()) as api:
+            server.mowen_api = api
+            one_by_one = await timed(sequential("set_note_privacy", calls))
+            concurrent = await timed(asyncio.gather(*(call("set_note_privacy", i) for i in range(calls))))
+
+    print(f"并发调用同步工具（旧实现）:  {calls / blocking:6.1f} 次/秒, 总耗时 {blocking:.2f}s")
+    print(f"逐个调用原生async工具:       {calls / one_by_one:6.1f} 次/秒, 总耗时 {one_by_one:.2f}s")
+    print(f"并发调用原生async工具:       {calls / concurrent:6.1f} 次/秒, 总耗时 {concurrent:.2f}s")
+
+
+if __name__ == "__main__":
+    import logging
+    logging.disable(logging.INFO)
+    asyncio.run(main())
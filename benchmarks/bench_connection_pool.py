@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+连接池基准测试：每次调用新建 AsyncClient 与 MowenAPI 共享连接池的对比
+
+使用本地替身服务器模拟每个新连接 50ms 的握手耗时（TCP + TLS），
+分别统计两种方式下每次调用的平均延迟。
+
+运行方式：
+    pip install -e .
+    python benchmarks/bench_connection_pool.py [调用次数] [握手延迟秒数]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("MOWEN_API_KEY", "bench")
+# 本地状态写入临时目录，不读写 ~/.mowen-mcp-server 中的真实数据
+os.environ.setdefault("MOWEN_STATE_DIR", tempfile.mkdtemp(prefix="mowen-bench-"))
+# 关闭限频，只测量连接开销
+os.environ.setdefault("MOWEN_RATE_LIMIT_INTERVAL", "0")
+
+from stub_server import StubMowenServer  # noqa: E402
+
+import httpx  # noqa: E402
+from mowen_mcp_server.config import Config  # noqa: E402
+from mowen_mcp_server.server import MowenAPI  # noqa: E402
+
+BODY = {"type": "doc", "content": [{"type": "paragraph", "content": [{"type": "text", "text": "bench"}]}]}
+
+
+async def per_call_client(base_url: str, calls: int) -> float:
+    """旧实现：每次调用新建客户端"""
+    start = time.perf_counter()
+    for _ in range(calls):
+        async with httpx.AsyncClient() as client:
+            response = await client.post(f"{base_url}/api/open/api/v1/note/edit", json={"noteId": "n", "body": BODY})
+            response.json()
+    return time.perf_counter() - start
+
+
+async def pooled_client(base_url: str, calls: int) -> float:
+    """新实现：MowenAPI 共享连接池"""
+    async with MowenAPI("bench", base_url, Config()) as api:
+        start = time.perf_counter()
+        for _ in range(calls):
+            await api.edit_note("n", BODY)
+        return time.perf_counter() - start
+
+
+async def main() -> None:
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    handshake = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+
+    async with StubMowenServer(handshake_delay=handshake) as server:
+        elapsed = await per_call_client(server.base_url, calls)
+        old_conns = server.connections
+        print(f"每次新建客户端: {elapsed / calls * 1000:.2f} ms/次, 新建连接 {old_conns} 个")
+
+        server.connections = 0
+        elapsed_pooled = await pooled_client(server.base_url, calls)
+        print(f"共享连接池:     {elapsed_pooled / calls * 1000:.2f} ms/次, 新建连接 {server.connections} 个")
+        print(f"每次调用节省:   {(elapsed - elapsed_pooled) / calls * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    import logging
+    logging.disable(logging.INFO)
+    asyncio.run(main())
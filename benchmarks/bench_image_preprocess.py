@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+图片预处理基准测试
+
+生成若干张接近手机照片尺寸的图片，统计：
+- 预处理前后的总字节数（即上传字节数）
+- 在事件循环中逐张处理（旧做法若要处理只能如此）与 ImagePreprocessor 进程池并发处理的耗时
+
+按给定上行带宽估算原图与处理后图片的上传时间。
+
+运行方式：
+    pip install -e '.[images]'
+    python benchmarks/bench_image_preprocess.py [图片数] [上行带宽Mbps]
+"""
+
+import asyncio
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from mowen_mcp_server.imageprep import ImageOptions, ImagePreprocessor, transform_image
+
+
+def make_photo(path: Path, seed: int) -> None:
+    """4032x3024 的渐变加噪点图片，以高质量 JPEG 保存（与手机照片的大小接近）"""
+    base = Image.linear_gradient("L").resize((4032, 3024)).convert("RGB")
+    noise = Image.effect_noise((4032, 3024), 20 + seed % 10).convert("RGB")
+    Image.blend(base, noise, 0.3).save(path, "JPEG", quality=98)
+
+
+async def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    mbps = float(sys.argv[2]) if len(sys.argv) > 2 else 20.0
+    options = ImageOptions()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        photos = []
+        for i in range(count):
+            path = tmp_dir / f"photo-{i}.jpg"
+            make_photo(path, i)
+            photos.append(path)
+        original = sum(path.stat().st_size for path in photos)
+
+        start = time.perf_counter()
+        for i, path in enumerate(photos):
+            transform_image(str(path), str(tmp_dir / f"serial-{i}.webp"), options)
+        serial = time.perf_counter() - start
+
+        preprocessor = ImagePreprocessor(tmp_dir / "cache", options, workers=os.cpu_count() or 1)
+        hashes = [hashlib.sha256(path.read_bytes()).hexdigest() for path in photos]
+        start = time.perf_counter()
+        results = await asyncio.gather(*(
+            preprocessor.prepare(str(path), digest, path.stat().st_size)
+            for path, digest in zip(photos, hashes)
+        ))
+        pooled = time.perf_counter() - start
+        preprocessor.shutdown()
+        processed = sum((result or path).stat().st_size for result, path in zip(results, photos))
+
+    bytes_per_second = mbps * 1024 * 1024 / 8
+    print(f"图片数: {count}，CPU核心数: {os.cpu_count()}，上行带宽: {mbps:.0f}Mbps")
+    print(f"上传字节数: {original / 1024 / 1024:.1f}MB -> {processed / 1024 / 1024:.1f}MB "
+          f"（{original / max(1, processed):.1f}倍）")
+    print(f"预处理耗时: 逐张 {serial:.2f}s，进程池 {pooled:.2f}s")
+    print(f"估算上传耗时: 原图 {original / bytes_per_second:.1f}s，"
+          f"预处理后 {pooled + processed / bytes_per_second:.1f}s（含预处理）")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
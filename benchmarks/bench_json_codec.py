@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+JSON编解码基准测试
+
+构造一篇包含大量文本节点的 NoteAtom 文档，对比各编解码器：
+- 编码：请求体 -> bytes（标准库 json 与 httpx 默认的 json= 编码方式相同）
+- 解码：响应 bytes -> dict（标准库一列对应旧实现的 response.json()，包含文本解码）
+
+未安装的编解码器会被跳过，安装方式：pip install orjson msgspec
+
+运行方式：
+    pip install -e .
+    python benchmarks/bench_json_codec.py [段落数] [重复次数]
+"""
+
+import sys
+import time
+
+from mowen_mcp_server.codec import CODEC_PREFERENCE, get_codec
+
+
+def build_payload(paragraphs: int) -> dict:
+    content = []
+    for i in range(paragraphs):
+        content.append({
+            "type": "paragraph",
+            "content": [
+                {"type": "text", "text": f"第{i}段的普通文本，包含一些中文内容"},
+                {"type": "text", "text": "加粗", "marks": [{"type": "bold"}]},
+                {"type": "text", "text": "高亮", "marks": [{"type": "highlight"}]},
+                {"type": "text", "text": "链接", "marks": [{"type": "link", "attrs": {"href": "https://example.com"}}]},
+            ],
+        })
+    return {"body": {"type": "doc", "content": content}, "settings": {"autoPublish": False, "tags": ["bench"]}}
+
+
+def measure(func, arg, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(arg)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    paragraphs = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    payload = build_payload(paragraphs)
+
+    codecs = []
+    for name in CODEC_PREFERENCE:
+        codec = get_codec(name)
+        if codec.name == name:
+            codecs.append(codec)
+        else:
+            print(f"跳过未安装的 {name}")
+
+    baseline = get_codec("json")
+    body = baseline.dumps(payload)
+    print(f"段落数 {paragraphs}（{paragraphs * 4} 个文本节点），请求体 {len(body) / 1024:.0f} KB")
+    print(f"{'编解码器':>8} | {'编码 ms':>9} | {'解码 ms':>9} | {'编码加速':>8} | {'解码加速':>8}")
+    base_encode = measure(baseline.dumps, payload, repeat)
+    # 旧实现解码前需要先把响应解码为文本
+    base_decode = measure(lambda data: baseline.loads(data.decode("utf-8")), body, repeat)
+    for codec in codecs:
+        encode_ms = measure(codec.dumps, payload, repeat)
+        decode_ms = measure(codec.loads, body, repeat)
+        print(
+            f"{codec.name:>8} | {encode_ms:>9.2f} | {decode_ms:>9.2f} | "
+            f"{base_encode / encode_ms:>7.1f}x | {base_decode / decode_ms:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
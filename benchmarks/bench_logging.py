@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+请求热路径日志开销基准测试
+
+构造一篇包含大量文本节点的笔记，对比：
+- 旧实现：INFO 级别下用 json.dumps(indent=2) 美化输出完整请求体（API客户端和工具各输出一次）
+- 新实现：INFO 级别只输出一条 key=value 摘要，完整请求体仅在 DEBUG 级别延迟序列化
+
+日志写入内存中的 StringIO，只统计格式化和写入的CPU开销。
+
+运行方式：
+    pip install -e .
+    python benchmarks/bench_logging.py [段落数] [重复次数]
+"""
+
+import io
+import json
+import logging
+import sys
+import time
+
+from mowen_mcp_server.logutil import LazyJSON, log_event
+
+
+def build_payload(paragraphs: int) -> dict:
+    content = []
+    for i in range(paragraphs):
+        content.append({
+            "type": "paragraph",
+            "content": [
+                {"type": "text", "text": f"第{i}段的普通文本，包含一些中文内容"},
+                {"type": "text", "text": "加粗", "marks": [{"type": "bold"}]},
+                {"type": "text", "text": "链接", "marks": [{"type": "link", "attrs": {"href": "https://example.com"}}]},
+            ],
+        })
+    return {"body": {"type": "doc", "content": content}, "settings": {"autoPublish": False, "tags": []}}
+
+
+def old_style(logger: logging.Logger, payload: dict) -> None:
+    logger.info(f"Payload: {json.dumps(payload, indent=2, ensure_ascii=False)}")
+    logger.info(f"Body: {json.dumps(payload['body'], indent=2, ensure_ascii=False)}")
+
+
+def new_style(logger: logging.Logger, payload: dict) -> None:
+    logger.debug("Payload: %s", LazyJSON(payload))
+    logger.debug("Body: %s", LazyJSON(payload["body"]))
+    log_event(logger, logging.INFO, "📊 note.build", built=len(payload["body"]["content"]))
+    log_event(logger, logging.INFO, "📥 api.response", op="创建笔记", status=200, elapsed_ms=12.3, bytes=64)
+
+
+def measure(func, logger: logging.Logger, payload: dict, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(logger, payload)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    paragraphs = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    payload = build_payload(paragraphs)
+
+    stream = io.StringIO()
+    logger = logging.getLogger("bench-logging")
+    logger.addHandler(logging.StreamHandler(stream))
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+
+    old_ms = measure(old_style, logger, payload, repeat)
+    new_ms = measure(new_style, logger, payload, repeat)
+    print(f"段落数 {paragraphs}，INFO级别每次请求的日志开销：")
+    print(f"  旧实现（美化输出完整请求体）: {old_ms:8.3f} ms")
+    print(f"  新实现（key=value摘要）:      {new_ms:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+NoteAtom 构建基准测试
+
+对比：
+- 旧实现：validate_rich_note_paragraphs 完整遍历一次，再逐个文本节点调用
+  NoteAtomBuilder.create_bold_mark()/create_highlight_mark() 新建标记字典并构建
+- 新实现：compile_paragraphs 一次遍历完成校验和构建，标记对象共享
+
+统计每次构建的耗时和 tracemalloc 记录的峰值内存，段落数翻倍时两者都应大致线性增长。
+
+运行方式：
+    pip install -e .
+    python benchmarks/bench_noteatom.py [段落数 ...]
+"""
+
+import sys
+import time
+import tracemalloc
+
+from mowen_mcp_server.noteatom import NoteAtomBuilder, compile_paragraphs
+
+
+def build_paragraphs(count: int) -> list:
+    paragraphs = []
+    for i in range(count):
+        if i % 10 == 9:
+            paragraphs.append({"type": "quote", "texts": [{"text": f"引用{i}", "highlight": True}]})
+            continue
+        paragraphs.append({"texts": [
+            {"text": f"第{i}段的普通文本"},
+            {"text": "加粗", "bold": True},
+            {"text": "加粗高亮", "bold": True, "highlight": True},
+            {"text": "链接", "link": "https://example.com"},
+        ]})
+    return paragraphs
+
+
+def legacy_validate(paragraphs: list) -> bool:
+    """旧版 validate_rich_note_paragraphs 的文本段落部分"""
+    for para in paragraphs:
+        if "texts" not in para:
+            return False
+        for text in para["texts"]:
+            if "text" not in text or not isinstance(text["text"], str):
+                return False
+            if "bold" in text and not isinstance(text["bold"], bool):
+                return False
+            if "highlight" in text and not isinstance(text["highlight"], bool):
+                return False
+            if "link" in text and not isinstance(text["link"], str):
+                return False
+    return True
+
+
+def legacy_build(paragraphs: list) -> list:
+    """旧版 create_note/edit_note 中复制的构建循环"""
+    assert legacy_validate(paragraphs)
+    built = []
+    for para_data in paragraphs:
+        para_type = para_data.get("type", "paragraph")
+        texts = []
+        for text_data in para_data["texts"]:
+            marks = []
+            if text_data.get("bold"):
+                marks.append(NoteAtomBuilder.create_bold_mark())
+            if text_data.get("highlight"):
+                marks.append(NoteAtomBuilder.create_highlight_mark())
+            if text_data.get("link"):
+                marks.append(NoteAtomBuilder.create_link_mark(text_data["link"]))
+            texts.append(NoteAtomBuilder.create_text(text_data["text"], marks if marks else None))
+        if para_type == "quote":
+            built.append(NoteAtomBuilder.create_quote(texts))
+        else:
+            built.append(NoteAtomBuilder.create_paragraph(texts))
+    return built
+
+
+def measure(func, paragraphs: list, repeat: int = 5) -> tuple:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(paragraphs)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func(paragraphs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best * 1000, peak / 1024 / 1024
+
+
+def main() -> None:
+    counts = [int(arg) for arg in sys.argv[1:]] or [2500, 5000, 10000, 20000]
+    print(f"{'段落数':>8} | {'旧实现 ms':>10} | {'新实现 ms':>10} | {'旧峰值 MB':>10} | {'新峰值 MB':>10}")
+    for count in counts:
+        paragraphs = build_paragraphs(count)
+        assert legacy_build(paragraphs) == [
+            {**node, "content": [dict(text, marks=list(text["marks"])) if "marks" in text else text
+                                 for text in node["content"]]}
+            for node in compile_paragraphs(paragraphs)
+        ]
+        old_ms, old_mb = measure(legacy_build, paragraphs)
+        new_ms, new_mb = measure(compile_paragraphs, paragraphs)
+        print(f"{count:>8} | {old_ms:>10.2f} | {new_ms:>10.2f} | {old_mb:>10.2f} | {new_mb:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
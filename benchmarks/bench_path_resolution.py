@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+本地路径解析基准测试
+
+模拟网络文件系统：每次 stat/lstat 调用额外阻塞固定的时间，统计解析一批附件路径时
+事件循环被阻塞的总时间和文件系统调用次数。
+
+- 旧实现：在事件循环中逐个调用 validate_file_path，再调用一次 normalize_file_path 取标准化路径
+  （标准化、exists、is_file、stat 各自访问文件系统）
+- 新实现：PathResolver 在线程池中解析，标准化之后只 stat 一次，相同路径只解析一次
+
+运行方式：
+    pip install -e .
+    python benchmarks/bench_path_resolution.py [附件数] [每次系统调用延迟毫秒]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+from mowen_mcp_server.paths import PathResolver, normalize_file_path, validate_file_path
+
+
+def slow_fs(delay: float, counter: list):
+    """给 os.stat/os.lstat 加上固定延迟，并统计调用次数"""
+    real_stat, real_lstat = os.stat, os.lstat
+
+    def wrap(func):
+        def slow(*args, **kwargs):
+            counter[0] += 1
+            time.sleep(delay)
+            return func(*args, **kwargs)
+        return slow
+
+    return mock.patch.multiple(os, stat=wrap(real_stat), lstat=wrap(real_lstat))
+
+
+def legacy_resolve(path: str) -> str:
+    """旧版 process_file_upload 中的路径处理"""
+    is_valid, error_msg = validate_file_path(path)
+    if not is_valid:
+        raise ValueError(error_msg)
+    return normalize_file_path(path)
+
+
+async def measure_loop_blocking(work) -> tuple:
+    """返回 (总耗时, 事件循环最长一次被阻塞的时间)"""
+    loop = asyncio.get_running_loop()
+    worst = 0.0
+    stop = False
+
+    async def heartbeat() -> None:
+        nonlocal worst
+        last = loop.time()
+        while not stop:
+            await asyncio.sleep(0.001)
+            now = loop.time()
+            worst = max(worst, now - last - 0.001)
+            last = now
+
+    beat = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await work()
+    elapsed = time.perf_counter() - start
+    stop = True
+    await beat
+    return elapsed, worst
+
+
+async def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    delay = (float(sys.argv[2]) if len(sys.argv) > 2 else 5.0) / 1000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 一半的段落引用重复的文件
+        paths = []
+        for i in range(count):
+            path = os.path.join(tmp, f"image-{i % max(1, count // 2)}.png")
+            if not os.path.exists(path):
+                with open(path, "wb") as f:
+                    f.write(b"\x89PNG\r\n\x1a\n")
+            paths.append(path)
+
+        legacy_calls = [0]
+
+        async def legacy() -> None:
+            for path in paths:
+                legacy_resolve(path)
+
+        with slow_fs(delay, legacy_calls):
+            old_elapsed, old_block = await measure_loop_blocking(legacy)
+
+        new_calls = [0]
+
+        async def resolver() -> None:
+            resolver = PathResolver()
+            await asyncio.gather(*(resolver.resolve(path) for path in paths))
+
+        with slow_fs(delay, new_calls):
+            new_elapsed, new_block = await measure_loop_blocking(resolver)
+
+    print(f"附件数: {count}，每次系统调用延迟: {delay * 1000:.1f}ms")
+    print(f"{'':>6} | {'总耗时 ms':>10} | {'最长阻塞 ms':>11} | {'stat 次数':>9}")
+    print(f"{'旧实现':>6} | {old_elapsed * 1000:>10.1f} | {old_block * 1000:>11.1f} | {legacy_calls[0]:>9}")
+    print(f"{'新实现':>6} | {new_elapsed * 1000:>10.1f} | {new_block * 1000:>11.1f} | {new_calls[0]:>9}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+跨进程限频基准测试
+
+模拟同一个API密钥被多个服务器进程同时使用：每个进程各自创建限频器，连续向同一个端点发送请求，
+记录每次获得发送时隙的时间。统计所有进程合计的：
+
+- 违规次数：与上一次发送的间隔小于服务端限制（真实环境中会收到 429 RATELIMIT）。
+  与默认配置（间隔1.05秒，墨问限制每秒1次）一样，服务端限制按间隔的 1/1.05 计算，留出调度抖动的余量
+- 总吞吐量：每秒发送的请求数（上限为 1 / 间隔）
+
+分别使用进程内限频器（EndpointRateLimiter）和共享限频器（SharedEndpointRateLimiter）。
+
+运行方式：
+    pip install -e .
+    python benchmarks/bench_shared_rate_limit.py [进程数] [每个进程的请求数] [间隔秒]
+"""
+
+import asyncio
+import multiprocessing
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from mowen_mcp_server.ratelimit import EndpointRateLimiter, SharedEndpointRateLimiter
+
+ENDPOINT = "note/edit"
+
+
+def worker(shared: bool, db_path: str, requests: int, interval: float, start_at: float, queue) -> None:
+    async def run() -> list:
+        if shared:
+            limiter = SharedEndpointRateLimiter(Path(db_path), "bench-account", interval=interval)
+        else:
+            limiter = EndpointRateLimiter(interval=interval)
+        await asyncio.sleep(max(0.0, start_at - time.time()))
+        sent = []
+        for _ in range(requests):
+            await limiter.acquire(ENDPOINT)
+            sent.append(time.time())
+        return sent
+
+    queue.put(asyncio.run(run()))
+
+
+def measure(shared: bool, processes: int, requests: int, interval: float) -> tuple:
+    """返回 (违规次数, 每秒请求数)"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = str(Path(tmp) / "cache.sqlite3")
+        if shared:
+            # 先建表，避免各进程同时建表
+            SharedEndpointRateLimiter(Path(db_path), "bench-account", interval=interval).close()
+        queue = multiprocessing.Queue()
+        start_at = time.time() + 1.0
+        workers = [
+            multiprocessing.Process(target=worker, args=(shared, db_path, requests, interval, start_at, queue))
+            for _ in range(processes)
+        ]
+        for process in workers:
+            process.start()
+        sent = sorted(t for _ in workers for t in queue.get())
+        for process in workers:
+            process.join()
+    violations = sum(1 for a, b in zip(sent, sent[1:]) if b - a < interval / 1.05)
+    throughput = (len(sent) - 1) / (sent[-1] - sent[0])
+    return violations, throughput
+
+
+def main() -> None:
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    interval = float(sys.argv[3]) if len(sys.argv) > 3 else 0.5
+
+    print(f"进程数: {processes}，每个进程请求数: {requests}，限频间隔: {interval}s（上限 {1 / interval:.1f} 次/秒）")
+    print(f"{'':>8} | {'违规次数':>8} | {'次/秒':>6}")
+    for name, shared in (("进程内", False), ("跨进程", True)):
+        violations, throughput = measure(shared, processes, requests, interval)
+        print(f"{name:>8} | {violations:>8} | {throughput:>6.1f}")
+
+
+if __name__ == "__main__":
+    main()
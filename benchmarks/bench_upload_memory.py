@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+本地文件上传内存基准测试：整体读入内存 与 流式上传 的峰值RSS对比
+
+每种方式、每种文件大小都在独立子进程中运行，上传到本地替身服务器，
+统计子进程的峰值RSS（仅支持 Linux/macOS）。
+
+运行方式：
+    pip install -e .
+    python benchmarks/bench_upload_memory.py [文件大小MB ...]
+"""
+
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("MOWEN_API_KEY", "bench")
+# 本地状态写入临时目录（子进程继承同一个目录），不读写 ~/.mowen-mcp-server 中的真实数据
+os.environ.setdefault("MOWEN_STATE_DIR", tempfile.mkdtemp(prefix="mowen-bench-"))
+os.environ.setdefault("MOWEN_RATE_LIMIT_INTERVAL", "0")
+os.environ.setdefault("MOWEN_QUOTA_ENABLED", "false")
+
+
+def peak_rss_mb() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为KB，macOS 单位为字节
+    return usage / 1024 / 1024 if sys.platform == "darwin" else usage / 1024
+
+
+async def run_child(mode: str, file_path: str) -> None:
+    import logging
+    logging.disable(logging.INFO)
+
+    import aiofiles
+    import httpx
+    from stub_server import StubMowenServer
+    from mowen_mcp_server.config import Config
+    from mowen_mcp_server.server import MowenAPI
+
+    async with StubMowenServer(handshake_delay=0) as server:
+        auth_info = {"form": {"endpoint": f"{server.base_url}/oss", "key": "bench"}}
+        baseline = peak_rss_mb()
+        if mode == "buffered":
+            # 旧实现：整体读入内存后交给 httpx 构建 multipart 请求体
+            async with aiofiles.open(file_path, "rb") as f:
+                content = await f.read()
+            async with httpx.AsyncClient(timeout=300) as client:
+                await client.post(auth_info["form"]["endpoint"], data={"key": "bench"},
+                                  files={"file": ("bench.pdf", content)})
+        else:
+            async with MowenAPI("bench", server.base_url, Config()) as api:
+                await api.upload_file_local(auth_info, file_path)
+        print(f"{baseline:.1f} {peak_rss_mb():.1f}")
+
+
+def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        asyncio.run(run_child(sys.argv[2], sys.argv[3]))
+        return
+
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10, 50, 100, 200]
+    print(f"{'文件大小':>8} | {'整体读入 峰值RSS':>16} | {'流式上传 峰值RSS':>16}")
+    for size_mb in sizes:
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+            f.truncate(size_mb * 1024 * 1024)
+            path = f.name
+        try:
+            results = []
+            for mode in ("buffered", "streaming"):
+                output = subprocess.check_output([sys.executable, __file__, "--child", mode, path], text=True)
+                baseline, peak = map(float, output.split())
+                results.append(f"{peak:>8.1f}MB (+{peak - baseline:.1f})")
+            print(f"{size_mb:>6}MB | {results[0]:>16} | {results[1]:>16}")
+        finally:
+            os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+墨问开放API的本地替身服务器（用于基准测试和 tests/ 中的测试）
+
+特点：
+- 纯 asyncio 实现的 HTTP/1.1 服务，支持 keep-alive
+- 每个新连接建立时模拟一次握手延迟（TCP + TLS），便于观察连接复用的收益
+- 对所有 POST 请求返回固定的成功响应，上传请求的请求体会被读取后丢弃
+- 可以按路径预设错误响应（failures），并记录收到的每个请求的路径（paths）
+"""
+
+import asyncio
+import json
+from typing import Dict, List, Optional
+
+
+class StubMowenServer:
+    """本地替身服务器"""
+
+    def __init__(self, handshake_delay: float = 0.05, response_delay: float = 0.0):
+        self.handshake_delay = handshake_delay
+        self.response_delay = response_delay
+        self.connections = 0
+        self.requests = 0
+        self.paths: List[str] = []
+        # 路径后缀 -> 依次返回的错误状态码（用完后恢复正常响应），例如 {"note/create": [503, 503]}
+        self.failures: Dict[str, List[int]] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def __aenter__(self) -> "StubMowenServer":
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    def response_body(self, path: str) -> dict:
+        """根据路径返回模拟的接口响应"""
+        if path.endswith("/upload/prepare"):
+            return {"form": {"endpoint": f"{self.base_url}/oss", "key": "stub"}}
+        if path.endswith("/upload/url") or path.endswith("/oss"):
+            return {"file": {"fileId": "stub-file-id"}}
+        if path.endswith("/auth/key/reset"):
+            return {"apiKey": "stub-api-key"}
+        return {"noteId": "stub-note-id"}
+
+    def count(self, suffix: str) -> int:
+        """收到的路径以 suffix 结尾的请求数"""
+        return sum(1 for path in self.paths if path.endswith(suffix))
+
+    def _next_failure(self, path: str) -> Optional[int]:
+        for suffix, statuses in self.failures.items():
+            if path.endswith(suffix) and statuses:
+                return statuses.pop(0)
+        return None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        # 模拟握手耗时
+        await asyncio.sleep(self.handshake_delay)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path = [part.decode() for part in request_line.split()[:2]]
+                content_length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    if name.strip().lower() == "content-length":
+                        content_length = int(value.strip())
+                # 分块读取并丢弃请求体，避免替身服务器本身占用大量内存
+                remaining = content_length
+                while remaining > 0:
+                    chunk = await reader.read(min(remaining, 1024 * 1024))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+
+                self.requests += 1
+                self.paths.append(path)
+                if self.response_delay:
+                    await asyncio.sleep(self.response_delay)
+                status = self._next_failure(path)
+                if status is None:
+                    status, body = 200, json.dumps(self.response_body(path)).encode()
+                else:
+                    body = json.dumps({"code": status, "reason": "STUB", "message": "替身服务器预设的错误"}).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'STUB'}\r\n".encode()
+                    + b"Content-Type: application/json\r\n"
+                    + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                    + (b"" if method == "HEAD" else body)
+                )
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
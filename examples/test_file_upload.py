@@ -87,7 +87,7 @@ async def test_file_upload():
         })
         
         # 处理文件上传
-        processed_paragraphs = await process_paragraphs_with_files(paragraphs)
+        processed_paragraphs = await process_paragraphs_with_files(api, paragraphs)
         
         # 构建笔记内容
         note_content = []
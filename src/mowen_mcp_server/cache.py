@@ -0,0 +1,252 @@
+"""
+上传结果缓存模块
+
+同一个文件（按内容哈希区分）上传到同一账户后会得到一个 fileId，之后再次引用同一文件时
+直接复用缓存的 fileId，不再调用 upload/prepare 和上传端点。
+远程URL上传同理，按 URL 和文件类型缓存墨问返回的 fileId，可选地通过 HEAD 请求的
+ETag/Last-Modified/Content-Length 判断远程文件是否变化。
+缓存保存在本地SQLite数据库中，按创建时间过期，超过条目上限时淘汰最久未使用的条目。
+"""
+
+import hashlib
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from .storage import connect
+
+logger = logging.getLogger("mowen-mcp-server")
+
+# 计算文件哈希时每次读取的块大小
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path: str) -> str:
+    """计算文件内容的SHA-256（阻塞调用，应放到线程池中执行）"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadCache:
+    """内容哈希 -> fileId 的持久化缓存"""
+
+    def __init__(self, path: Path, ttl: float = 7 * 24 * 3600, max_entries: int = 10000):
+        """
+        参数:
+        - path: SQLite数据库文件路径
+        - ttl: 缓存有效期（秒）
+        - max_entries: 最大缓存条目数
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._conn = connect(path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS file_uploads (
+                account TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                file_type INTEGER NOT NULL,
+                file_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (account, content_hash, file_type)
+            )
+            """
+        )
+
+    def get(self, account: str, content_hash: str, file_type: int) -> Optional[str]:
+        """查找缓存的fileId，未命中或已过期时返回None"""
+        now = time.time()
+        row = self._conn.execute(
+            "SELECT file_id, created_at FROM file_uploads WHERE account=? AND content_hash=? AND file_type=?",
+            (account, content_hash, file_type),
+        ).fetchone()
+        if row is None:
+            return None
+        file_id, created_at = row
+        if now - created_at > self.ttl:
+            self._conn.execute(
+                "DELETE FROM file_uploads WHERE account=? AND content_hash=? AND file_type=?",
+                (account, content_hash, file_type),
+            )
+            return None
+        self._conn.execute(
+            "UPDATE file_uploads SET last_used=? WHERE account=? AND content_hash=? AND file_type=?",
+            (now, account, content_hash, file_type),
+        )
+        return file_id
+
+    def put(self, account: str, content_hash: str, file_type: int, file_id: str) -> None:
+        """记录上传结果"""
+        now = time.time()
+        try:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO file_uploads VALUES (?, ?, ?, ?, ?, ?)",
+                (account, content_hash, file_type, file_id, now, now),
+            )
+            self.evict()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ 上传缓存写入失败: {e}")
+
+    def evict(self) -> None:
+        """删除过期条目，并在超过上限时淘汰最久未使用的条目"""
+        self._conn.execute("DELETE FROM file_uploads WHERE created_at < ?", (time.time() - self.ttl,))
+        count = self._conn.execute("SELECT COUNT(*) FROM file_uploads").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM file_uploads WHERE rowid IN "
+                "(SELECT rowid FROM file_uploads ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+# 用于判断远程文件是否变化的响应头
+VALIDATOR_HEADERS = ("etag", "last-modified", "content-length")
+
+
+@dataclass
+class UrlCacheEntry:
+    """远程URL上传缓存条目"""
+    file_id: str
+    validators: Dict[str, str]
+    created_at: float
+    validated_at: float
+
+    def matches(self, validators: Dict[str, str]) -> bool:
+        """远程文件的校验头与缓存时一致（双方都提供的头才参与比较）"""
+        common = [name for name in VALIDATOR_HEADERS if name in validators and name in self.validators]
+        if not common:
+            return False
+        return all(validators[name] == self.validators[name] for name in common)
+
+
+class UrlUploadCache:
+    """
+    URL + 文件类型 -> fileId 的持久化缓存
+
+    热点条目同时保存在进程内的LRU中，命中时无需访问SQLite。
+    """
+
+    def __init__(self, path: Path, max_age: float = 24 * 3600, max_entries: int = 5000, memory_entries: int = 1024):
+        """
+        参数:
+        - path: SQLite数据库文件路径
+        - max_age: 缓存有效期（秒）
+        - max_entries: 最大缓存条目数
+        - memory_entries: 进程内LRU的最大条目数
+        """
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[Tuple[str, str, int], UrlCacheEntry]" = OrderedDict()
+        self._conn = connect(path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS url_uploads (
+                account TEXT NOT NULL,
+                url TEXT NOT NULL,
+                file_type INTEGER NOT NULL,
+                file_id TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                content_length TEXT,
+                created_at REAL NOT NULL,
+                validated_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (account, url, file_type)
+            )
+            """
+        )
+
+    def _remember(self, key: Tuple[str, str, int], entry: UrlCacheEntry) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, account: str, url: str, file_type: int) -> Optional[UrlCacheEntry]:
+        """查找缓存条目，未命中或已过期时返回None"""
+        key = (account, url, file_type)
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is None:
+            row = self._conn.execute(
+                "SELECT file_id, etag, last_modified, content_length, created_at, validated_at "
+                "FROM url_uploads WHERE account=? AND url=? AND file_type=?",
+                key,
+            ).fetchone()
+            if row is None:
+                return None
+            validators = {
+                name: value for name, value in zip(VALIDATOR_HEADERS, row[1:4]) if value is not None
+            }
+            entry = UrlCacheEntry(row[0], validators, row[4], row[5])
+            self._conn.execute(
+                "UPDATE url_uploads SET last_used=? WHERE account=? AND url=? AND file_type=?",
+                (now,) + key,
+            )
+        if now - entry.created_at > self.max_age:
+            self.invalidate(account, url, file_type)
+            return None
+        self._remember(key, entry)
+        return entry
+
+    def put(self, account: str, url: str, file_type: int, file_id: str, validators: Optional[Dict[str, str]] = None) -> None:
+        """记录上传结果及远程文件的校验头"""
+        now = time.time()
+        validators = validators or {}
+        entry = UrlCacheEntry(file_id, validators, now, now)
+        self._remember((account, url, file_type), entry)
+        try:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO url_uploads VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (account, url, file_type, file_id)
+                + tuple(validators.get(name) for name in VALIDATOR_HEADERS)
+                + (now, now, now),
+            )
+            self.evict()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ URL上传缓存写入失败: {e}")
+
+    def mark_validated(self, account: str, url: str, file_type: int) -> None:
+        """远程文件未变化，更新校验时间"""
+        now = time.time()
+        entry = self._memory.get((account, url, file_type))
+        if entry is not None:
+            entry.validated_at = now
+        self._conn.execute(
+            "UPDATE url_uploads SET validated_at=? WHERE account=? AND url=? AND file_type=?",
+            (now, account, url, file_type),
+        )
+
+    def invalidate(self, account: str, url: str, file_type: int) -> None:
+        """删除缓存条目"""
+        self._memory.pop((account, url, file_type), None)
+        self._conn.execute(
+            "DELETE FROM url_uploads WHERE account=? AND url=? AND file_type=?",
+            (account, url, file_type),
+        )
+
+    def evict(self) -> None:
+        """删除过期条目，并在超过上限时淘汰最久未使用的条目"""
+        self._conn.execute("DELETE FROM url_uploads WHERE created_at < ?", (time.time() - self.max_age,))
+        count = self._conn.execute("SELECT COUNT(*) FROM url_uploads").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM url_uploads WHERE rowid IN "
+                "(SELECT rowid FROM url_uploads ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,160 @@
+"""
+edit_note 合并发送
+
+edit_note 每次都会替换整篇笔记，智能体修改文字时经常在几秒内对同一篇笔记连续调用多次，
+每次都消耗一次编辑配额并占用一个限频名额。开启合并窗口后，同一篇笔记的编辑在窗口内只发送最后一次：
+
+- 每次新的编辑都会把发送时间推迟到 window 秒之后，但距离第一次编辑最多等待 max_wait 秒
+- 被覆盖的编辑不会上传文件，也不会发出请求，调用方和最后一次编辑一起拿到发送结果
+- 同一篇笔记的发送按顺序进行（不开启合并时也是如此），前一批发送期间到达的编辑组成下一批
+
+合并只在当前进程内进行，窗口期间进程退出时尚未发送的编辑会丢失。
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .logutil import log_event
+
+logger = logging.getLogger("mowen-mcp-server")
+
+
+@dataclass
+class _EditBatch:
+    """同一篇笔记在一个合并窗口内的编辑"""
+    first_at: float
+    last_at: float
+    send: Callable[[], Awaitable[Any]]
+    waiters: List["asyncio.Future[Any]"] = field(default_factory=list)
+    task: Optional[asyncio.Task] = None
+    # 设置后不再等待窗口结束，立即发送
+    flush_now: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class EditCoalescer:
+    """按笔记ID合并短时间内的连续编辑"""
+
+    def __init__(self, window: float = 0.0, max_wait: float = 10.0):
+        """
+        参数:
+        - window: 合并窗口（秒），0 表示不合并，每次编辑立即发送
+        - max_wait: 从第一次编辑开始最多等待的时间（秒），避免持续编辑时一直不发送
+        """
+        self.window = window
+        self.max_wait = max(window, max_wait)
+        self._batches: Dict[str, _EditBatch] = {}
+        # 笔记ID -> (发送锁, 正在发送或等待发送的批次数)
+        self._locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+    async def submit(self, note_id: str, send: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        提交一次编辑
+
+        参数:
+        - note_id: 笔记ID
+        - send: 实际发送这次编辑的协程函数，被之后的编辑覆盖时不会被调用
+
+        返回: (最终发送的结果, 这次编辑是否被之后的编辑覆盖)
+        """
+        if self.window <= 0:
+            async with self._hold(note_id):
+                return await send(), False
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        batch = self._batches.get(note_id)
+        if batch is None:
+            batch = _EditBatch(first_at=now, last_at=now, send=send)
+            self._batches[note_id] = batch
+            batch.task = asyncio.create_task(self._flush(note_id, batch))
+        else:
+            batch.last_at = now
+            batch.send = send
+        waiter = loop.create_future()
+        batch.waiters.append(waiter)
+        result = await waiter
+        return result, waiter is not batch.waiters[-1]
+
+    async def _flush(self, note_id: str, batch: _EditBatch) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                due = min(batch.last_at + self.window, batch.first_at + self.max_wait)
+                delay = due - loop.time()
+                if delay <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(batch.flush_now.wait(), delay)
+                    break
+                except asyncio.TimeoutError:
+                    continue
+        finally:
+            # 从这里开始到达的编辑组成下一批
+            if self._batches.get(note_id) is batch:
+                del self._batches[note_id]
+
+        try:
+            async with self._hold(note_id):
+                if len(batch.waiters) > 1:
+                    log_event(logger, logging.INFO, "🧩 note.coalesce", note_id=note_id, merged=len(batch.waiters))
+                result = await batch.send()
+        except BaseException as e:
+            for waiter in batch.waiters:
+                if waiter.done():
+                    continue
+                if isinstance(e, asyncio.CancelledError):
+                    waiter.cancel()
+                else:
+                    waiter.set_exception(e)
+                    waiter.exception()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        else:
+            for waiter in batch.waiters:
+                if not waiter.done():
+                    waiter.set_result(result)
+
+    @asynccontextmanager
+    async def _hold(self, note_id: str) -> AsyncIterator[None]:
+        """按顺序独占一篇笔记的发送"""
+        lock, users = self._locks.get(note_id, (None, 0))
+        lock = lock or asyncio.Lock()
+        self._locks[note_id] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[note_id]
+            if users > 1:
+                self._locks[note_id] = (lock, users - 1)
+            else:
+                del self._locks[note_id]
+
+    @asynccontextmanager
+    async def exclusive(self, note_id: str) -> AsyncIterator[None]:
+        """
+        先发送这篇笔记在合并窗口中的编辑，再独占它的发送
+        
+        用于基于上一次发送内容计算新内容的修改（追加、插入、替换段落），
+        这类修改不能与其他编辑合并，否则先到的修改会被覆盖。
+        """
+        batch = self._batches.get(note_id)
+        if batch is not None and batch.task is not None:
+            batch.flush_now.set()
+            await asyncio.gather(batch.task, return_exceptions=True)
+        async with self._hold(note_id):
+            yield
+
+    @property
+    def idle(self) -> bool:
+        """没有等待中或正在发送的编辑"""
+        return not self._batches and not self._locks
+
+    async def drain(self) -> None:
+        """立即发送所有等待中的编辑（服务器退出前调用）"""
+        batches = list(self._batches.values())
+        for batch in batches:
+            batch.flush_now.set()
+        await asyncio.gather(*(batch.task for batch in batches if batch.task), return_exceptions=True)
@@ -0,0 +1,86 @@
+"""
+JSON编解码模块
+
+请求体在发送前一次性编码为 bytes（重试时直接复用），响应直接从 bytes 解析，
+成功路径上不再把响应解码为文本。安装了 orjson 或 msgspec 时自动使用，
+否则回退到标准库 json，三者的输出都是紧凑的 UTF-8 JSON。
+"""
+
+import json
+import logging
+from typing import Any, Callable, Optional, Union
+
+logger = logging.getLogger("mowen-mcp-server")
+
+# auto 模式下的尝试顺序
+CODEC_PREFERENCE = ("orjson", "msgspec", "json")
+
+
+class JSONCodec:
+    """一组 dumps/loads 实现，dumps 返回 bytes，loads 接受 bytes 或 str"""
+
+    __slots__ = ("name", "dumps", "loads")
+
+    def __init__(self, name: str, dumps: Callable[[Any], bytes], loads: Callable[[Union[bytes, str]], Any]):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+
+    def __repr__(self) -> str:
+        return f"JSONCodec({self.name!r})"
+
+
+def _stdlib_codec() -> JSONCodec:
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), allow_nan=False)
+
+    def dumps(obj: Any) -> bytes:
+        return encoder.encode(obj).encode("utf-8")
+
+    return JSONCodec("json", dumps, json.loads)
+
+
+def _orjson_codec() -> Optional[JSONCodec]:
+    try:
+        import orjson
+    except ImportError:
+        return None
+    return JSONCodec("orjson", orjson.dumps, orjson.loads)
+
+
+def _msgspec_codec() -> Optional[JSONCodec]:
+    try:
+        import msgspec
+    except ImportError:
+        return None
+    encoder = msgspec.json.Encoder()
+    decoder = msgspec.json.Decoder()
+    return JSONCodec("msgspec", encoder.encode, decoder.decode)
+
+
+_FACTORIES = {
+    "orjson": _orjson_codec,
+    "msgspec": _msgspec_codec,
+    "json": _stdlib_codec,
+}
+
+
+def get_codec(name: str = "auto") -> JSONCodec:
+    """
+    按名称获取编解码器
+
+    参数:
+    - name: auto/orjson/msgspec/json，指定的库未安装时回退到 auto 的选择顺序
+    """
+    name = (name or "auto").strip().lower()
+    if name in _FACTORIES:
+        codec = _FACTORIES[name]()
+        if codec is not None:
+            return codec
+        logger.warning(f"⚠️ JSON编解码器 {name} 未安装，改为自动选择")
+    elif name != "auto":
+        logger.warning(f"⚠️ 未知的JSON编解码器 {name}，改为自动选择")
+    for candidate in CODEC_PREFERENCE:
+        codec = _FACTORIES[candidate]()
+        if codec is not None:
+            return codec
+    return _stdlib_codec()
@@ -1,21 +1,175 @@
 """配置管理模块"""
 
+import json
 import os
-from typing import Optional
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# 支持的传输方式
+TRANSPORTS = ("stdio", "streamable-http", "sse")
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    """读取布尔类型的环境变量（1/true/yes/on 视为真）"""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_int(name: str, default: int) -> int:
+    """读取整数类型的环境变量，格式错误时使用默认值"""
+    try:
+        return int(os.getenv(name, ""))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    """读取浮点类型的环境变量，格式错误时使用默认值"""
+    try:
+        return float(os.getenv(name, ""))
+    except ValueError:
+        return default
+
+
+def _env_json(name: str, default: Dict[str, Any]) -> Dict[str, Any]:
+    """读取JSON对象类型的环境变量，格式错误时使用默认值"""
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        parsed = json.loads(value)
+    except ValueError:
+        return default
+    return parsed if isinstance(parsed, dict) else default
+
+
+def _env_list(name: str) -> List[str]:
+    """读取逗号分隔的列表类型的环境变量，忽略空白项"""
+    return [item.strip() for item in os.getenv(name, "").split(",") if item.strip()]
+
 
 class Config:
     """配置类"""
-    
+
     def __init__(self):
         self.api_key: Optional[str] = os.getenv("MOWEN_API_KEY")
         self.base_url: str = os.getenv("MOWEN_BASE_URL", "https://open.mowen.cn")
-        
+
+        # HTTP连接池配置
+        self.http2: bool = _env_bool("MOWEN_HTTP2", False)
+        self.max_connections: int = _env_int("MOWEN_MAX_CONNECTIONS", 10)
+        self.max_keepalive_connections: int = _env_int("MOWEN_MAX_KEEPALIVE_CONNECTIONS", 5)
+        self.keepalive_expiry: float = _env_float("MOWEN_KEEPALIVE_EXPIRY", 30.0)
+        self.request_timeout: float = _env_float("MOWEN_REQUEST_TIMEOUT", 30.0)
+        self.upload_timeout: float = _env_float("MOWEN_UPLOAD_TIMEOUT", 300.0)
+        # 同一篇笔记中同时向上传端点投递的文件数
+        self.upload_concurrency: int = _env_int("MOWEN_UPLOAD_CONCURRENCY", 4)
+        # 上传前检查本地文件头，格式与扩展名不符时直接在本地报错
+        self.upload_preflight: bool = _env_bool("MOWEN_UPLOAD_PREFLIGHT", True)
+
+        # 图片预处理（需要 Pillow）：缩小到最长边 image_max_dimension、去除元数据并重新编码为 webp/jpeg，
+        # 只处理大于 image_min_bytes 的图片，进程池大小 0 表示CPU核心数
+        self.image_preprocess: bool = _env_bool("MOWEN_IMAGE_PREPROCESS", False)
+        self.image_max_dimension: int = _env_int("MOWEN_IMAGE_MAX_DIMENSION", 2560)
+        self.image_format: str = os.getenv("MOWEN_IMAGE_FORMAT", "webp").lower()
+        self.image_quality: int = _env_int("MOWEN_IMAGE_QUALITY", 82)
+        self.image_min_bytes: int = _env_int("MOWEN_IMAGE_MIN_BYTES", 1024 * 1024)
+        self.image_workers: int = _env_int("MOWEN_IMAGE_WORKERS", 0)
+        # 请求体/响应的JSON编解码器：auto/orjson/msgspec/json
+        self.json_codec: str = os.getenv("MOWEN_JSON_CODEC", "auto")
+        # 发送前合并相同标记的相邻文本、删除空文本（不改变显示效果）
+        self.optimize_payload: bool = _env_bool("MOWEN_OPTIMIZE_PAYLOAD", True)
+        # 同时合并连续的空段落、删除末尾的空段落（会去掉有意留出的空行，默认关闭）
+        self.collapse_empty_paragraphs: bool = _env_bool("MOWEN_COLLAPSE_EMPTY_PARAGRAPHS", False)
+
+        # 后台任务（create_note/edit_note 的 background 模式）：worker 数量和保留的已完成任务数
+        self.job_workers: int = _env_int("MOWEN_JOB_WORKERS", 2)
+        self.job_max_retained: int = _env_int("MOWEN_JOB_MAX_RETAINED", 200)
+
+        # 笔记写入的本地待发送队列：进程退出或网络中断后自动重发，以及重发检查间隔（秒）
+        self.outbox_enabled: bool = _env_bool("MOWEN_OUTBOX_ENABLED", True)
+        self.outbox_flush_interval: float = _env_float("MOWEN_OUTBOX_FLUSH_INTERVAL", 30.0)
+
+        # create_note 幂等有效期（秒）：有效期内相同的请求只创建一次笔记，0 表示关闭
+        self.idempotency_window: float = _env_float("MOWEN_IDEMPOTENCY_WINDOW", 600.0)
+
+        # edit_note 合并窗口（秒）：窗口内对同一篇笔记的连续编辑只发送最后一次，0 表示关闭；以及最长等待时间
+        self.edit_coalesce_window: float = _env_float("MOWEN_EDIT_COALESCE_WINDOW", 0.0)
+        self.edit_coalesce_max_wait: float = _env_float("MOWEN_EDIT_COALESCE_MAX_WAIT", 10.0)
+
+        # 笔记本地副本：append_to_note 等修改工具的基础内容，以及最多保存的笔记数
+        self.mirror_enabled: bool = _env_bool("MOWEN_MIRROR_ENABLED", True)
+        self.mirror_max_entries: int = _env_int("MOWEN_MIRROR_MAX_ENTRIES", 500)
+
+        # 限频配置：墨问每个API每秒允许1次请求，默认间隔略大于1秒留出网络抖动余量
+        self.rate_limit_interval: float = _env_float("MOWEN_RATE_LIMIT_INTERVAL", 1.05)
+        self.rate_limit_burst: int = _env_int("MOWEN_RATE_LIMIT_BURST", 1)
+
+        # 限频的发送时间表保存在 state_dir 下的SQLite中，本机使用同一密钥的所有进程共同排队
+        self.shared_rate_limit: bool = _env_bool("MOWEN_SHARED_RATE_LIMIT", True)
+
+        # 重试配置：指数退避参数、全局重试预算以及按端点的策略覆盖
+        self.retry_max_attempts: int = _env_int("MOWEN_RETRY_MAX_ATTEMPTS", 3)
+        self.retry_base_delay: float = _env_float("MOWEN_RETRY_BASE_DELAY", 0.5)
+        self.retry_max_delay: float = _env_float("MOWEN_RETRY_MAX_DELAY", 8.0)
+        self.retry_budget_ratio: float = _env_float("MOWEN_RETRY_BUDGET_RATIO", 0.1)
+        self.retry_budget_max: float = _env_float("MOWEN_RETRY_BUDGET_MAX", 10.0)
+        # 例如 {"note/edit": {"max_attempts": 5}, "upload/url": {"max_attempts": 1}}
+        self.retry_policies: Dict[str, Dict[str, Any]] = _env_json("MOWEN_RETRY_POLICIES", {})
+
+        # 传输方式：stdio 由MCP客户端按会话启动；streamable-http/sse 作为常驻网络服务运行
+        self.transport: str = os.getenv("MOWEN_TRANSPORT", "stdio")
+        self.host: str = os.getenv("MOWEN_HOST", "127.0.0.1")
+        self.port: int = _env_int("MOWEN_PORT", 8000)
+        # HTTP传输的worker进程数，多于1个时使用无状态会话（任意worker都能处理同一会话的请求）
+        self.workers: int = _env_int("MOWEN_WORKERS", 1)
+        self.http_stateless: bool = _env_bool("MOWEN_HTTP_STATELESS", False)
+        # 收到退出信号后等待进行中的请求完成的最长时间（秒）
+        self.shutdown_timeout: int = _env_int("MOWEN_SHUTDOWN_TIMEOUT", 30)
+        # HTTP传输的访问令牌：设置后每个请求都要携带 Authorization: Bearer <令牌>（单租户模式）。
+        # 单租户模式下所有请求都使用 MOWEN_API_KEY，监听非本机地址时必须设置
+        self.http_token: Optional[str] = os.getenv("MOWEN_HTTP_TOKEN") or None
+        # 允许的 Host 请求头（防御DNS重绑定），例如 notes.example.com,10.0.0.5:8000；本机地址总是允许
+        self.http_allowed_hosts: List[str] = _env_list("MOWEN_HTTP_ALLOWED_HOSTS")
+
+        # 多租户模式：API密钥来自每个请求的HTTP请求头（需要HTTP传输），按密钥保留最多 tenant_max 个客户端，
+        # 空闲超过 tenant_idle_ttl 秒的租户被关闭
+        self.multi_tenant: bool = _env_bool("MOWEN_MULTI_TENANT", False)
+        self.tenant_max: int = _env_int("MOWEN_TENANT_MAX", 32)
+        self.tenant_idle_ttl: float = _env_float("MOWEN_TENANT_IDLE_TTL", 900.0)
+
+        # 本地状态目录（配额统计、缓存等）
+        self.state_dir: Path = Path(os.getenv("MOWEN_STATE_DIR") or Path.home() / ".mowen-mcp-server")
+
+        # 每日配额：本地统计并在请求前拦截，low优先级调用在剩余配额低于预留比例时被拒绝
+        self.quota_enabled: bool = _env_bool("MOWEN_QUOTA_ENABLED", True)
+        self.quota_low_priority_reserve: float = _env_float("MOWEN_QUOTA_LOW_PRIORITY_RESERVE", 0.1)
+        # 覆盖文档中的默认配额，例如 {"note/edit": 500}
+        self.quota_limits: Dict[str, int] = _env_json("MOWEN_QUOTA_LIMITS", {})
+
+        # 本地文件上传缓存：按内容哈希复用已上传文件的fileId
+        self.upload_cache_enabled: bool = _env_bool("MOWEN_UPLOAD_CACHE_ENABLED", True)
+        self.upload_cache_ttl: float = _env_float("MOWEN_UPLOAD_CACHE_TTL", 7 * 24 * 3600)
+        self.upload_cache_max_entries: int = _env_int("MOWEN_UPLOAD_CACHE_MAX_ENTRIES", 10000)
+
+        # 远程URL上传缓存：按URL和文件类型复用fileId，可选通过HEAD请求校验远程文件是否变化
+        self.url_cache_enabled: bool = _env_bool("MOWEN_URL_CACHE_ENABLED", True)
+        self.url_cache_max_age: float = _env_float("MOWEN_URL_CACHE_MAX_AGE", 24 * 3600)
+        self.url_cache_max_entries: int = _env_int("MOWEN_URL_CACHE_MAX_ENTRIES", 5000)
+        self.url_cache_revalidate: bool = _env_bool("MOWEN_URL_CACHE_REVALIDATE", False)
+        # 距上次校验超过该时间（秒）才重新发HEAD请求校验
+        self.url_cache_revalidate_after: float = _env_float("MOWEN_URL_CACHE_REVALIDATE_AFTER", 300.0)
+
     def validate(self) -> bool:
-        """验证配置是否有效"""
+        """验证配置是否有效（多租户模式下API密钥来自请求，不需要MOWEN_API_KEY）"""
+        if self.multi_tenant:
+            return True
         return self.api_key is not None and len(self.api_key.strip()) > 0
-    
+
     def get_error_message(self) -> str:
         """获取配置错误信息"""
         if not self.api_key:
             return "未设置MOWEN_API_KEY环境变量，请先获取墨问API密钥并设置环境变量"
-        return "配置验证失败" 
\ No newline at end of file
+        return "配置验证失败"
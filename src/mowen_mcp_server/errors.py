@@ -0,0 +1,11 @@
+"""墨问MCP服务器异常定义"""
+
+
+class MowenAPIError(Exception):
+    """墨问API异常类"""
+    def __init__(self, status_code: int, reason: str = "", message: str = "", response_text: str = ""):
+        self.status_code = status_code
+        self.reason = reason
+        self.message = message
+        self.response_text = response_text
+        super().__init__(f"API调用失败 [{status_code}] {reason}: {message}")
@@ -0,0 +1,154 @@
+"""
+create_note 的幂等处理
+
+MCP客户端在工具调用超时后经常自动重试，每次重试都会再创建一篇草稿笔记并消耗当天的创建配额。
+这里为每次创建请求确定一个幂等键（调用方显式传入，或者按段落内容和笔记设置的规范化哈希计算），
+在有效期内：
+
+- 已经创建成功的重复请求直接返回原来的 noteId，不再调用API
+- 原请求仍在进行中时，重复请求等待原请求的结果，而不是再发出一次网络请求
+- 原请求因网络问题进入本地待发送队列时，重复请求不再重复排队
+
+已完成的记录保存在本地SQLite中，多个进程共享；进行中的请求只在当前进程内合并。
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .storage import connect
+
+logger = logging.getLogger("mowen-mcp-server")
+
+
+def derive_key(paragraphs: List[Dict[str, Any]], settings: Optional[Dict[str, Any]]) -> str:
+    """按段落内容和笔记设置的规范化JSON计算幂等键"""
+    canonical = json.dumps(
+        {"paragraphs": paragraphs, "settings": settings or {}},
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class IdempotencyRecord:
+    """一次已处理的创建请求"""
+    key: str
+    note_id: Optional[str]
+    # 请求进入本地待发送队列时对应的记录ID
+    entry_id: Optional[str]
+    created_at: float
+
+
+class IdempotencyStore:
+    """幂等键 -> 创建结果的持久化记录，以及当前进程内进行中的请求"""
+
+    def __init__(self, path: Path, window: float = 600.0):
+        """
+        参数:
+        - path: SQLite数据库文件路径
+        - window: 幂等有效期（秒），超过后相同的请求会重新创建笔记
+        """
+        self.window = window
+        self._inflight: Dict[Tuple[str, str], "asyncio.Future[Any]"] = {}
+        self._conn = connect(path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS note_idempotency (
+                account TEXT NOT NULL,
+                key TEXT NOT NULL,
+                note_id TEXT,
+                entry_id TEXT,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (account, key)
+            )
+            """
+        )
+
+    def lookup(self, account: str, key: str) -> Optional[IdempotencyRecord]:
+        """查找有效期内的记录，未命中或已过期时返回None"""
+        row = self._conn.execute(
+            "SELECT note_id, entry_id, created_at FROM note_idempotency WHERE account=? AND key=?",
+            (account, key),
+        ).fetchone()
+        if row is None or time.time() - row[2] > self.window:
+            return None
+        return IdempotencyRecord(key, *row)
+
+    def record(
+        self,
+        account: str,
+        key: str,
+        note_id: Optional[str] = None,
+        entry_id: Optional[str] = None,
+    ) -> None:
+        """记录创建结果（成功时的 noteId，或进入待发送队列时的记录ID）"""
+        try:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO note_idempotency VALUES (?, ?, ?, ?, ?)",
+                (account, key, note_id, entry_id, time.time()),
+            )
+            self.evict()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ 幂等记录写入失败: {e}")
+
+    def resolve_entry(self, entry_id: str, note_id: str) -> None:
+        """待发送队列中的请求发送成功后，补上对应记录的 noteId"""
+        try:
+            self._conn.execute(
+                "UPDATE note_idempotency SET note_id=? WHERE entry_id=?", (note_id, entry_id)
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ 幂等记录写入失败: {e}")
+
+    def discard_entry(self, entry_id: str) -> None:
+        """待发送队列中的请求最终失败后删除对应记录，之后的相同请求重新创建笔记"""
+        try:
+            self._conn.execute("DELETE FROM note_idempotency WHERE entry_id=?", (entry_id,))
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ 幂等记录写入失败: {e}")
+
+    def inflight(self, account: str, key: str) -> Optional["asyncio.Future[Any]"]:
+        """当前进程中正在进行的相同请求"""
+        return self._inflight.get((account, key))
+
+    def begin(self, account: str, key: str) -> "asyncio.Future[Any]":
+        """登记一个进行中的请求，重复请求可以等待返回的 Future"""
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[(account, key)] = future
+        return future
+
+    def finish(
+        self,
+        account: str,
+        key: str,
+        result: Any = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        """结束进行中的请求，把结果或异常传给正在等待的重复请求"""
+        future = self._inflight.pop((account, key), None)
+        if future is None or future.done():
+            return
+        if isinstance(error, asyncio.CancelledError):
+            future.cancel()
+        elif error is not None:
+            future.set_exception(error)
+            # 没有重复请求等待时避免 "exception was never retrieved" 警告
+            future.exception()
+        else:
+            future.set_result(result)
+
+    def evict(self) -> None:
+        """删除超过有效期的记录"""
+        self._conn.execute(
+            "DELETE FROM note_idempotency WHERE created_at<?", (time.time() - self.window,)
+        )
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,177 @@
+"""
+图片上传前的预处理
+
+智能体附加的手机照片和截图经常有 10~40MB，接近图片50MB的上限，原样上传既慢又占带宽。
+开启预处理后，较大的图片在上传前先：
+
+- 按 EXIF 方向旋转后缩小到最长边不超过 max_dimension
+- 去掉 EXIF/ICC 等元数据
+- 重新编码为 WebP 或限制质量的 JPEG
+
+图片编解码是CPU密集型操作，在进程池中执行，可以用满所有CPU核心且不阻塞事件循环。
+工作进程用 spawn 方式启动：服务器进程中已经有事件循环、SQLite连接和后台线程，fork 出的子进程会继承
+这些状态（以及其他线程持有的锁），可能死锁或破坏数据库连接。
+结果按“源文件内容哈希 + 处理参数”缓存在本地目录中，同一张图片只处理一次。
+处理后没有变小的图片（例如已经压缩过的小图）原样上传。
+
+需要安装可选依赖 Pillow（pip install 'mowen-mcp-server[images]'）。
+"""
+
+import asyncio
+import importlib.util
+import logging
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger("mowen-mcp-server")
+
+# 输出格式 -> (Pillow 格式名, 扩展名)
+OUTPUT_FORMATS = {
+    "webp": ("WEBP", ".webp"),
+    "jpeg": ("JPEG", ".jpg"),
+}
+
+
+def pillow_available() -> bool:
+    """是否安装了 Pillow"""
+    return importlib.util.find_spec("PIL") is not None
+
+
+@dataclass(frozen=True)
+class ImageOptions:
+    """图片预处理参数"""
+    max_dimension: int = 2560
+    format: str = "webp"
+    quality: int = 82
+
+    @property
+    def extension(self) -> str:
+        return OUTPUT_FORMATS[self.format][1]
+
+    @property
+    def key(self) -> str:
+        """参与缓存键的参数摘要，参数变化后不会复用旧的处理结果"""
+        return f"{self.format}-{self.max_dimension}-q{self.quality}"
+
+
+def transform_image(source: str, target: str, options: ImageOptions) -> bool:
+    """
+    缩放、去除元数据并重新编码图片（在子进程中执行）
+
+    返回: 处理结果是否写入了 target（结果没有比源文件小时不写入，返回False）
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((options.max_dimension, options.max_dimension), Image.Resampling.LANCZOS)
+        pil_format = OUTPUT_FORMATS[options.format][0]
+        if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        # 只写入像素数据，不传 exif/icc_profile，原图的元数据不会保留
+        tmp = f"{target}.{uuid.uuid4().hex[:8]}.tmp"
+        image.save(tmp, pil_format, quality=options.quality, optimize=True)
+    if os.path.getsize(tmp) >= os.path.getsize(source):
+        os.remove(tmp)
+        return False
+    os.replace(tmp, target)
+    return True
+
+
+class ImagePreprocessor:
+    """图片预处理进程池和结果缓存"""
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        options: ImageOptions,
+        min_bytes: int = 1024 * 1024,
+        workers: int = 0,
+        max_entries: int = 500,
+    ):
+        """
+        参数:
+        - cache_dir: 处理结果的缓存目录
+        - options: 预处理参数
+        - min_bytes: 只处理大于这个大小的图片（字节）
+        - workers: 进程池大小，0 表示CPU核心数
+        - max_entries: 缓存目录中最多保留的文件数
+        """
+        self.cache_dir = cache_dir
+        self.options = options
+        self.min_bytes = min_bytes
+        self.workers = workers or None
+        self.max_entries = max_entries
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def should_process(self, path: str, size: int) -> bool:
+        """是否需要预处理：只处理超过 min_bytes 的图片，GIF 可能是动图，保持原样"""
+        return size >= self.min_bytes and Path(path).suffix.lower() != ".gif"
+
+    def _cache_path(self, content_hash: str, suffix: str) -> Path:
+        return self.cache_dir / f"{content_hash}-{self.options.key}{suffix}"
+
+    async def prepare(self, source: str, content_hash: str, size: int) -> Optional[Path]:
+        """
+        预处理一张图片
+
+        参数:
+        - source: 源文件路径
+        - content_hash: 源文件内容哈希
+        - size: 源文件大小（字节）
+
+        返回: 处理后的文件路径；处理后没有变小或处理失败时返回None（上传原图）
+        """
+        target = self._cache_path(content_hash, self.options.extension)
+        skipped = self._cache_path(content_hash, ".skip")
+        if target.exists():
+            logger.info(f"♻️ 命中图片预处理缓存: {Path(source).name}")
+            return target
+        if skipped.exists():
+            return None
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        loop = asyncio.get_running_loop()
+        try:
+            written = await loop.run_in_executor(
+                self._executor, transform_image, source, str(target), self.options
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ 图片预处理失败，上传原图: {Path(source).name}: {e}")
+            return None
+        if not written:
+            # 记录下来，下次不再重复处理
+            skipped.touch()
+            return None
+        logger.info(
+            f"🖼️ 图片预处理完成: {Path(source).name} {size / 1024 / 1024:.1f}MB -> "
+            f"{target.stat().st_size / 1024 / 1024:.1f}MB"
+        )
+        self.evict()
+        return target
+
+    def evict(self) -> None:
+        """缓存文件超过上限时删除最早的文件"""
+        try:
+            entries = sorted(self.cache_dir.iterdir(), key=lambda path: path.stat().st_mtime)
+            for path in entries[: max(0, len(entries) - self.max_entries)]:
+                path.unlink()
+        except OSError as e:
+            logger.warning(f"⚠️ 清理图片预处理缓存失败: {e}")
+
+    def shutdown(self) -> None:
+        """关闭进程池"""
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
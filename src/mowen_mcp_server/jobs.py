@@ -0,0 +1,205 @@
+"""
+后台任务模块
+
+包含大文件的笔记创建/编辑可能需要几分钟，MCP客户端经常因此超时。
+异步模式下工具只做参数校验，把实际工作放入进程内任务队列后立即返回任务ID，
+由固定数量的后台worker依次执行；调用方通过 get_job_status 查询每个文件的上传进度和最终结果。
+
+任务只保存在内存中，进程退出后任务状态会丢失；未完成的笔记写入由本地待发送队列（outbox）在下次启动时继续执行。
+写入暂时失败、已经转入待发送队列的任务标记为 deferred 并记录队列中的记录ID，之后由队列自动重发。
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from .outbox import NoteDeferredError
+
+logger = logging.getLogger("mowen-mcp-server")
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+# 写入已转入本地待发送队列，等待自动重发
+JOB_DEFERRED = "deferred"
+
+# 文件上传状态
+FILE_PENDING = "pending"
+FILE_UPLOADING = "uploading"
+FILE_DONE = "done"
+FILE_FAILED = "failed"
+
+
+@dataclass
+class FileProgress:
+    """单个文件段落的上传进度"""
+    index: int
+    source_path: str
+    state: str = FILE_PENDING
+    error: Optional[str] = None
+
+
+@dataclass
+class Job:
+    """一个后台任务"""
+    job_id: str
+    kind: str
+    description: str
+    status: str = JOB_QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    files: Dict[int, FileProgress] = field(default_factory=dict)
+    note_id: Optional[str] = None
+    message: Optional[str] = None
+    error: Optional[str] = None
+    # 提交任务的账户标识（多租户模式下各租户只能看到自己的任务）
+    owner: Optional[str] = None
+    # 转入待发送队列时的记录ID
+    outbox_entry_id: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        """worker 已经处理完（转入待发送队列的任务由队列继续发送）"""
+        return self.status in (JOB_SUCCEEDED, JOB_FAILED, JOB_DEFERRED)
+
+    def track_file(self, index: int, source_path: str) -> None:
+        """登记一个待上传的文件段落"""
+        self.files[index] = FileProgress(index, source_path)
+
+    def update_file(self, index: int, state: str, error: Optional[str] = None) -> None:
+        """更新文件段落的上传状态（作为上传流程的进度回调）"""
+        progress = self.files.get(index)
+        if progress is not None:
+            progress.state = state
+            progress.error = error
+
+
+# 任务执行函数：接收任务对象（用于上报进度），返回写入任务的 noteId
+JobRunner = Callable[[Job], Awaitable[Optional[str]]]
+
+
+class JobManager:
+    """
+    进程内任务队列和worker池
+
+    worker 在第一次提交任务时于当前事件循环中启动；已完成的任务最多保留 max_retained 个，
+    超出后按完成顺序淘汰最早的任务。
+    """
+
+    def __init__(self, workers: int = 2, max_retained: int = 200):
+        self.workers = max(1, workers)
+        self.max_retained = max(1, max_retained)
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._runners: Dict[str, JobRunner] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_workers(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._tasks:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        # 之前的事件循环中排队的任务重新入队，执行到一半的任务无法恢复
+        for job in self._jobs.values():
+            if job.status == JOB_QUEUED:
+                self._queue.put_nowait(job.job_id)
+            elif job.status == JOB_RUNNING:
+                job.status = JOB_FAILED
+                job.error = "任务所在的事件循环已结束"
+                job.finished_at = time.time()
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+
+    def submit(
+        self,
+        kind: str,
+        description: str,
+        runner: JobRunner,
+        note_id: Optional[str] = None,
+        owner: Optional[str] = None,
+    ) -> Job:
+        """提交任务，立即返回任务对象（编辑任务可以预先带上 note_id）"""
+        self._ensure_workers()
+        job = Job(
+            job_id=uuid.uuid4().hex[:16], kind=kind, description=description, note_id=note_id, owner=owner
+        )
+        self._jobs[job.job_id] = job
+        self._runners[job.job_id] = runner
+        self._queue.put_nowait(job.job_id)
+        logger.info(f"📨 已提交后台任务 {job.job_id}: {description}")
+        return job
+
+    def get(self, job_id: str, owner: Optional[str] = None) -> Optional[Job]:
+        """按ID查询任务；指定 owner 时只返回该账户提交的任务"""
+        job = self._jobs.get(job_id)
+        if job is None or (owner is not None and job.owner != owner):
+            return None
+        return job
+
+    def jobs(self, owner: Optional[str] = None) -> List[Job]:
+        """所有任务（按提交顺序）；指定 owner 时只返回该账户提交的任务"""
+        return [job for job in self._jobs.values() if owner is None or job.owner == owner]
+
+    def pending(self, owner: Optional[str] = None) -> int:
+        """排队中和执行中的任务数"""
+        return sum(1 for job in self.jobs(owner) if not job.done)
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        job = self._jobs.get(job_id)
+        runner = self._runners.pop(job_id, None)
+        if job is None or runner is None:
+            return
+        job.status = JOB_RUNNING
+        job.started_at = time.time()
+        try:
+            note_id = await runner(job)
+        except asyncio.CancelledError:
+            job.status = JOB_FAILED
+            job.error = "服务器关闭，任务已取消"
+            raise
+        except NoteDeferredError as e:
+            job.status = JOB_DEFERRED
+            job.outbox_entry_id = e.entry_id
+            logger.warning(f"📮 后台任务 {job_id} 的写入已转入待发送队列 {e.entry_id}")
+        except Exception as e:
+            job.status = JOB_FAILED
+            job.error = str(e)
+            logger.error(f"❌ 后台任务 {job_id} 失败: {e}")
+        else:
+            job.status = JOB_SUCCEEDED
+            if note_id:
+                job.note_id = note_id
+            logger.info(f"✅ 后台任务 {job_id} 完成，笔记ID: {job.note_id}")
+        finally:
+            job.finished_at = time.time()
+            self._evict()
+
+    def _evict(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[: max(0, len(finished) - self.max_retained)]:
+            del self._jobs[job_id]
+
+    async def aclose(self) -> None:
+        """停止所有worker，执行中的任务被标记为失败"""
+        tasks, self._tasks = self._tasks, []
+        self._loop = None
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
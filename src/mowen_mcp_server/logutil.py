@@ -0,0 +1,59 @@
+"""
+结构化日志工具
+
+- log_event: 以紧凑的 key=value 形式输出一条记录，日志级别未开启时不做任何格式化
+- LazyJSON: 作为日志参数传入，只有真正输出时才序列化（用于只在DEBUG级别输出的大请求体）
+- redact_headers: 输出请求头前隐藏 Authorization 等敏感信息
+"""
+
+import json
+import logging
+from typing import Any, Dict, Mapping
+
+# 输出日志前需要隐藏的请求头（小写）
+SENSITIVE_HEADERS = {"authorization", "cookie", "x-mowen-api-key"}
+
+
+def resolve_level(name: str, default: int = logging.INFO) -> int:
+    """把 DEBUG/INFO 等级别名称转换为数值，无效名称返回默认值"""
+    level = logging.getLevelName(name.strip().upper()) if name else default
+    return level if isinstance(level, int) else default
+
+
+def _format_value(value: Any) -> str:
+    text = str(value)
+    if not text or any(ch in text for ch in ' ="\n'):
+        return json.dumps(text, ensure_ascii=False)
+    return text
+
+
+def format_fields(fields: Mapping[str, Any]) -> str:
+    """把字段格式化为 key=value 序列，None 值会被省略"""
+    return " ".join(f"{key}={_format_value(value)}" for key, value in fields.items() if value is not None)
+
+
+def log_event(logger: logging.Logger, level: int, event: str, **fields: Any) -> None:
+    """输出一条 key=value 结构的日志记录"""
+    if logger.isEnabledFor(level):
+        logger.log(level, "%s %s", event, format_fields(fields))
+
+
+class LazyJSON:
+    """延迟序列化的JSON日志参数"""
+
+    __slots__ = ("obj", "indent")
+
+    def __init__(self, obj: Any, indent: int = 2):
+        self.obj = obj
+        self.indent = indent
+
+    def __str__(self) -> str:
+        return json.dumps(self.obj, ensure_ascii=False, indent=self.indent, default=str)
+
+
+def redact_headers(headers: Mapping[str, str]) -> Dict[str, str]:
+    """返回隐藏了敏感字段的请求头副本"""
+    return {
+        key: ("***" if key.lower() in SENSITIVE_HEADERS else value)
+        for key, value in headers.items()
+    }
@@ -0,0 +1,93 @@
+"""
+笔记内容的本地副本
+
+墨问的编辑API只支持整篇替换，为了追加一个段落，智能体也必须重新生成并发送整篇笔记。
+这里保存每篇笔记最近一次通过本服务器成功发送的 NoteAtom 文档（编码后的字节和摘要）：
+
+- append_to_note/insert_paragraphs/replace_paragraphs 在本地副本上计算出完整内容后再发送
+- 编辑后的内容与副本逐字节相同时跳过这次编辑，不消耗配额
+
+只有通过本服务器创建或编辑过的笔记才有副本；在其他地方修改过的笔记，副本可能已经过时。
+"""
+
+import hashlib
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .codec import JSONCodec
+from .storage import connect
+
+logger = logging.getLogger("mowen-mcp-server")
+
+
+def body_digest(encoded: bytes) -> str:
+    """编码后文档的摘要"""
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class NoteMirror:
+    """笔记ID -> 最近一次发送的 NoteAtom 文档"""
+
+    def __init__(self, path: Path, codec: JSONCodec, max_entries: int = 500):
+        """
+        参数:
+        - path: SQLite数据库文件路径
+        - codec: 文档的JSON编解码器
+        - max_entries: 最多保存的笔记数，超出后淘汰最久没有更新的笔记
+        """
+        self.codec = codec
+        self.max_entries = max_entries
+        self._conn = connect(path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS note_mirror (
+                account TEXT NOT NULL,
+                note_id TEXT NOT NULL,
+                body BLOB NOT NULL,
+                digest TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (account, note_id)
+            )
+            """
+        )
+
+    def get(self, account: str, note_id: str) -> Optional[Dict[str, Any]]:
+        """读取笔记的本地副本，没有时返回None"""
+        row = self._conn.execute(
+            "SELECT body FROM note_mirror WHERE account=? AND note_id=?", (account, note_id)
+        ).fetchone()
+        return None if row is None else self.codec.loads(row[0])
+
+    def digest(self, account: str, note_id: str) -> Optional[str]:
+        """本地副本的摘要，没有时返回None"""
+        row = self._conn.execute(
+            "SELECT digest FROM note_mirror WHERE account=? AND note_id=?", (account, note_id)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def put(self, account: str, note_id: str, encoded: bytes) -> None:
+        """保存成功发送的文档（已编码）"""
+        try:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO note_mirror VALUES (?, ?, ?, ?, ?)",
+                (account, note_id, encoded, body_digest(encoded), time.time()),
+            )
+            self.evict()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ 笔记本地副本写入失败: {e}")
+
+    def evict(self) -> None:
+        """超过上限时淘汰最久没有更新的笔记"""
+        count = self._conn.execute("SELECT COUNT(*) FROM note_mirror").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM note_mirror WHERE rowid IN "
+                "(SELECT rowid FROM note_mirror ORDER BY updated_at ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,98 @@
+"""
+工具参数模型
+
+create_note/edit_note 的 paragraphs 参数使用带判别字段的 Pydantic 模型，
+由 pydantic-core 完成校验。各段落类型的说明只在模型中写一次，
+发布的 JSON Schema 通过 $defs 引用，不再在每个工具里重复一大段文字说明。
+"""
+
+from typing import Any, Dict, List, Literal, Optional, Sequence, Union
+
+from pydantic import BaseModel, ConfigDict, Discriminator, Field, Tag, TypeAdapter
+from typing_extensions import Annotated
+
+
+def _compact_schema(schema: Dict[str, Any]) -> None:
+    """去掉自动生成的 title，类型名已经体现在 $defs 的键中"""
+    schema.pop("title", None)
+    for prop in schema.get("properties", {}).values():
+        prop.pop("title", None)
+
+
+class _ParagraphModel(BaseModel):
+    model_config = ConfigDict(json_schema_extra=_compact_schema)
+
+
+class TextRun(_ParagraphModel):
+    """文本节点，可组合加粗、高亮和链接"""
+    text: str
+    bold: bool = False
+    highlight: bool = False
+    link: str = Field(default="", description="链接URL")
+
+
+class TextParagraph(_ParagraphModel):
+    """普通段落（默认类型，可以省略 type），例如 {"texts": [{"text": "重要：", "bold": true}, {"text": "内容"}]}"""
+    type: Literal["paragraph"] = "paragraph"
+    texts: List[TextRun]
+
+
+class QuoteParagraph(_ParagraphModel):
+    """引用段落，例如 {"type": "quote", "texts": [{"text": "引用内容"}]}"""
+    type: Literal["quote"]
+    texts: List[TextRun]
+
+
+class NoteLinkParagraph(_ParagraphModel):
+    """内链笔记，引用另一篇笔记，例如 {"type": "note", "note_id": "VPrWsE_-P0qwrFUOygGs8"}"""
+    type: Literal["note"]
+    note_id: str = Field(min_length=1, description="被引用笔记的ID")
+
+
+class FileMetadata(_ParagraphModel):
+    """文件附加信息：图片可设置 alt/align，音频可设置 show_note，URL 文件可指定 file_name"""
+    alt: str = Field(default="", description="图片描述")
+    align: Literal["left", "center", "right"] = "center"
+    show_note: str = Field(default="", description="音频 ShowNote，例如 \"00:00 开场\\n01:30 主要内容\"")
+    file_name: str = Field(default="", description="URL 文件的文件名")
+
+
+class FileParagraph(_ParagraphModel):
+    """
+    文件段落，上传本地文件或远程URL文件后插入笔记。
+    支持图片 .gif/.jpeg/.jpg/.png/.webp（最大50MB）、音频 .mp3/.mp4/.m4a（最大200MB）、PDF .pdf（最大100MB）
+    """
+    type: Literal["file"]
+    file_type: Literal["image", "audio", "pdf"]
+    source_type: Literal["local", "url"]
+    source_path: str = Field(
+        description="本地文件路径（推荐绝对路径，Windows/macOS/Linux 格式均可）或文件URL"
+    )
+    metadata: FileMetadata = Field(default_factory=FileMetadata)
+
+
+def _paragraph_tag(value: Any) -> Optional[str]:
+    """判别段落类型，未提供 type 的段落视为普通段落"""
+    if isinstance(value, dict):
+        return value.get("type", "paragraph")
+    return getattr(value, "type", None)
+
+
+Paragraph = Annotated[
+    Union[
+        Annotated[TextParagraph, Tag("paragraph")],
+        Annotated[QuoteParagraph, Tag("quote")],
+        Annotated[NoteLinkParagraph, Tag("note")],
+        Annotated[FileParagraph, Tag("file")],
+    ],
+    Discriminator(_paragraph_tag),
+]
+
+_PARAGRAPH_LIST = TypeAdapter(List[Paragraph])
+
+
+def dump_paragraphs(paragraphs: Sequence[Any]) -> List[Dict[str, Any]]:
+    """把段落模型转换为普通字典，已经是字典的列表原样返回"""
+    if paragraphs and isinstance(paragraphs[0], BaseModel):
+        return _PARAGRAPH_LIST.dump_python(list(paragraphs))
+    return list(paragraphs)
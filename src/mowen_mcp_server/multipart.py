@@ -0,0 +1,121 @@
+"""
+流式 multipart/form-data 请求体
+
+上传端点要求以表单方式投递文件。httpx 的 files= 参数需要先把文件内容整体读入内存，
+这里改为按块从磁盘读取文件并直接写入请求体，每个上传占用的内存只与块大小有关，
+与文件大小无关。请求体长度可以预先计算，因此仍然使用 Content-Length 而不是分块编码。
+
+文件在创建请求体时打开，长度取自打开的文件句柄，发送时读取同一个句柄：上传期间文件被替换不影响
+这次上传；文件被原地截断或追加时实际读到的字节数与 Content-Length 不一致，抛出 FileChangedError。
+"""
+
+import mimetypes
+import os
+from typing import AsyncIterator, Dict, Optional
+
+import aiofiles
+
+# 每次从磁盘读取的块大小
+DEFAULT_CHUNK_SIZE = 256 * 1024
+
+
+def _quote(value: str) -> str:
+    """转义表单头中的双引号和换行，与 httpx 的处理方式一致"""
+    return value.replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+
+
+class FileChangedError(OSError):
+    """上传过程中文件长度发生变化"""
+
+    def __init__(self, file_path: str, expected: int, actual: int):
+        self.file_path = file_path
+        self.expected = expected
+        self.actual = actual
+        super().__init__(
+            f"文件在上传过程中被修改: {file_path}（开始上传时 {expected} 字节，读取到 {actual} 字节），请在文件写入完成后重试"
+        )
+
+
+class MultipartFileStream:
+    """
+    由若干普通表单字段和一个文件字段组成的流式请求体
+
+    文件字段放在最后（对象存储的表单上传要求 file 为最后一个字段）。
+    每次迭代都从文件开头读取，因此同一个对象可以再次发送；用完后调用 close()（或用 with 语句）关闭文件。
+    """
+
+    def __init__(
+        self,
+        fields: Dict[str, str],
+        file_path: str,
+        file_name: str,
+        file_field: str = "file",
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ):
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self.boundary = os.urandom(16).hex()
+        self._file: Optional[int] = os.open(file_path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        self.file_size = os.fstat(self._file).st_size
+
+        boundary = self.boundary.encode("ascii")
+        parts = []
+        for name, value in fields.items():
+            parts.append(
+                b"--" + boundary + b"\r\n"
+                + f'Content-Disposition: form-data; name="{_quote(name)}"\r\n\r\n'.encode("utf-8")
+                + str(value).encode("utf-8") + b"\r\n"
+            )
+        file_content_type = mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+        parts.append(
+            b"--" + boundary + b"\r\n"
+            + (
+                f'Content-Disposition: form-data; name="{_quote(file_field)}"; filename="{_quote(file_name)}"\r\n'
+                f"Content-Type: {file_content_type}\r\n\r\n"
+            ).encode("utf-8")
+        )
+        self._head = b"".join(parts)
+        self._tail = b"\r\n--" + boundary + b"--\r\n"
+
+    @property
+    def content_length(self) -> int:
+        return len(self._head) + self.file_size + len(self._tail)
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """发送请求时需要附带的请求头"""
+        return {
+            "Content-Type": f"multipart/form-data; boundary={self.boundary}",
+            "Content-Length": str(self.content_length),
+        }
+
+    def close(self) -> None:
+        """关闭文件句柄"""
+        if self._file is not None:
+            os.close(self._file)
+            self._file = None
+
+    def __enter__(self) -> "MultipartFileStream":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        if self._file is None:
+            raise ValueError("请求体已关闭")
+        yield self._head
+        sent = 0
+        async with aiofiles.open(self._file, "rb", closefd=False) as f:
+            await f.seek(0)
+            while True:
+                chunk = await f.read(self.chunk_size)
+                if not chunk:
+                    break
+                sent += len(chunk)
+                if sent > self.file_size:
+                    raise FileChangedError(self.file_path, self.file_size, sent)
+                yield chunk
+        if sent != self.file_size:
+            raise FileChangedError(self.file_path, self.file_size, sent)
+        yield self._tail
@@ -0,0 +1,259 @@
+"""
+NoteAtom 文档构建模块
+
+墨问笔记正文使用 NoteAtom 结构（doc -> paragraph/quote/note/image/audio/pdf -> text）。
+compile_paragraphs() 对工具传入的 paragraphs 只遍历一次，同时完成校验和构建：
+
+- 加粗/高亮标记使用模块级共享对象，标记组合使用共享的元组，不再为每个文本节点新建字典
+- 链接标记在同一次编译中按 href 复用
+- 校验失败时抛出 NoteAtomError，指出具体的段落和文本下标
+- 文件段落原样保留在结果中，由上传流程替换为文件节点
+
+编译结果中的标记对象是共享的，不要原地修改。
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("mowen-mcp-server")
+
+# 文本段落类型
+TEXT_PARAGRAPH_TYPES = ("paragraph", "quote")
+# 文件段落中支持的文件类型和来源
+FILE_TYPES = ("image", "audio", "pdf")
+FILE_SOURCE_TYPES = ("local", "url")
+
+# 共享的标记对象
+BOLD_MARK: Dict[str, Any] = {"type": "bold"}
+HIGHLIGHT_MARK: Dict[str, Any] = {"type": "highlight"}
+
+# (bold, highlight) -> 标记元组
+_MARK_SETS: Dict[Tuple[bool, bool], Tuple[Dict[str, Any], ...]] = {
+    (False, False): (),
+    (True, False): (BOLD_MARK,),
+    (False, True): (HIGHLIGHT_MARK,),
+    (True, True): (BOLD_MARK, HIGHLIGHT_MARK),
+}
+
+
+class NoteAtomError(ValueError):
+    """段落格式错误，message 中带有出错位置，例如 paragraphs[2].texts[0].bold"""
+
+    def __init__(
+        self,
+        message: str,
+        paragraph_index: Optional[int] = None,
+        text_index: Optional[int] = None,
+        field: Optional[str] = None,
+    ):
+        self.paragraph_index = paragraph_index
+        self.text_index = text_index
+        self.field = field
+        self.detail = message
+        super().__init__(f"{self.location}: {message}" if self.location else message)
+
+    @property
+    def location(self) -> str:
+        if self.paragraph_index is None:
+            return "paragraphs" if self.field is None else self.field
+        location = f"paragraphs[{self.paragraph_index}]"
+        if self.text_index is not None:
+            location += f".texts[{self.text_index}]"
+        if self.field:
+            location += f".{self.field}"
+        return location
+
+
+class NoteAtomBuilder:
+    """NoteAtom结构构建器，帮助构建符合墨问格式的笔记内容"""
+
+    @staticmethod
+    def create_doc(paragraphs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """创建文档根节点"""
+        return {
+            "type": "doc",
+            "content": paragraphs
+        }
+
+    @staticmethod
+    def create_paragraph(texts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """创建段落节点"""
+        if not texts:
+            return {"type": "paragraph"}
+        return {
+            "type": "paragraph",
+            "content": texts
+        }
+
+    @staticmethod
+    def create_quote(texts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """创建引用节点"""
+        if not texts:
+            return {"type": "quote"}
+        return {
+            "type": "quote",
+            "content": texts
+        }
+
+    @staticmethod
+    def create_note(note_uuid: str) -> Dict[str, Any]:
+        """创建内链笔记节点"""
+        return {
+            "type": "note",
+            "attrs": {
+                "uuid": note_uuid
+            }
+        }
+
+    @staticmethod
+    def create_text(text: str, marks: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """创建文本节点"""
+        node = {
+            "type": "text",
+            "text": text
+        }
+        if marks:
+            node["marks"] = marks
+        return node
+
+    @staticmethod
+    def create_bold_mark() -> Dict[str, Any]:
+        """创建加粗标记"""
+        return {"type": "bold"}
+
+    @staticmethod
+    def create_highlight_mark() -> Dict[str, Any]:
+        """创建高亮标记"""
+        return {"type": "highlight"}
+
+    @staticmethod
+    def create_link_mark(href: str) -> Dict[str, Any]:
+        """创建链接标记"""
+        return {
+            "type": "link",
+            "attrs": {"href": href}
+        }
+
+    @staticmethod
+    def create_image(file_id: str, alt: str = "", align: str = "center") -> Dict[str, Any]:
+        """创建图片节点"""
+        attrs = {"uuid": file_id}
+        if alt:
+            attrs["alt"] = alt
+        if align:
+            attrs["align"] = align
+        return {
+            "type": "image",
+            "attrs": attrs
+        }
+
+    @staticmethod
+    def create_audio(file_id: str, show_note: str = "") -> Dict[str, Any]:
+        """创建音频节点"""
+        attrs = {"audio-uuid": file_id}
+        if show_note:
+            attrs["show-note"] = show_note
+        return {
+            "type": "audio",
+            "attrs": attrs
+        }
+
+    @staticmethod
+    def create_pdf(file_id: str) -> Dict[str, Any]:
+        """创建PDF节点"""
+        return {
+            "type": "pdf",
+            "attrs": {"uuid": file_id}
+        }
+
+
+def _check_file_paragraph(para: Dict[str, Any], index: int) -> None:
+    """校验文件段落的字段"""
+    if para.get("file_type") not in FILE_TYPES:
+        raise NoteAtomError(f"file_type 必须是 {'/'.join(FILE_TYPES)} 之一", index, field="file_type")
+    if para.get("source_type") not in FILE_SOURCE_TYPES:
+        raise NoteAtomError(f"source_type 必须是 {'/'.join(FILE_SOURCE_TYPES)} 之一", index, field="source_type")
+    if not isinstance(para.get("source_path"), str):
+        raise NoteAtomError("source_path 必须是字符串", index, field="source_path")
+    if "metadata" in para and not isinstance(para["metadata"], dict):
+        raise NoteAtomError("metadata 必须是对象", index, field="metadata")
+
+
+def _compile_texts(texts: Any, index: int, links: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """校验并构建一个文本段落中的所有文本节点"""
+    if not isinstance(texts, list):
+        raise NoteAtomError("文本段落必须提供 texts 列表", index, field="texts")
+    content = []
+    append = content.append
+    mark_sets = _MARK_SETS
+    for j, item in enumerate(texts):
+        if type(item) is not dict:
+            raise NoteAtomError("文本节点必须是对象", index, j)
+        text = item.get("text")
+        if type(text) is not str:
+            raise NoteAtomError("text 必须是字符串", index, j, "text")
+        bold = item.get("bold", False)
+        highlight = item.get("highlight", False)
+        link = item.get("link")
+        if type(bold) is not bool:
+            raise NoteAtomError("bold 必须是布尔值", index, j, "bold")
+        if type(highlight) is not bool:
+            raise NoteAtomError("highlight 必须是布尔值", index, j, "highlight")
+        marks = mark_sets[bold, highlight]
+        if link is not None:
+            if type(link) is not str:
+                raise NoteAtomError("link 必须是字符串URL", index, j, "link")
+            if link:
+                link_mark = links.get(link)
+                if link_mark is None:
+                    link_mark = links[link] = {"type": "link", "attrs": {"href": link}}
+                marks = marks + (link_mark,)
+        if marks:
+            append({"type": "text", "text": text, "marks": marks})
+        else:
+            append({"type": "text", "text": text})
+    return content
+
+
+def compile_paragraphs(paragraphs: Any) -> List[Dict[str, Any]]:
+    """
+    一次遍历完成段落校验和 NoteAtom 构建
+
+    参数:
+    - paragraphs: 工具传入的段落列表
+
+    返回: 段落节点列表，文件段落（type 为 file）原样保留，等待上传后替换
+
+    异常:
+    - NoteAtomError: 段落格式错误，包含出错的段落/文本下标
+    """
+    if not isinstance(paragraphs, list):
+        raise NoteAtomError("必须是列表")
+    built: List[Dict[str, Any]] = []
+    append = built.append
+    links: Dict[str, Dict[str, Any]] = {}
+    for i, para in enumerate(paragraphs):
+        if type(para) is not dict:
+            raise NoteAtomError("段落必须是对象", i)
+        para_type = para.get("type", "paragraph")
+        if para_type in TEXT_PARAGRAPH_TYPES:
+            content = _compile_texts(para.get("texts"), i, links)
+            append({"type": para_type, "content": content} if content else {"type": para_type})
+        elif para_type == "note":
+            note_id = para.get("note_id")
+            if type(note_id) is not str or not note_id:
+                raise NoteAtomError("内链笔记段落必须提供字符串 note_id", i, field="note_id")
+            append({"type": "note", "attrs": {"uuid": note_id}})
+        elif para_type == "file":
+            _check_file_paragraph(para, i)
+            append(para)
+        elif para_type in FILE_TYPES:
+            # 已经是文件节点（例如上传后得到的节点），直接保留
+            append(para)
+        elif "texts" in para:
+            # 其他类型但带有 texts 的段落按普通段落处理
+            content = _compile_texts(para["texts"], i, links)
+            append({"type": "paragraph", "content": content} if content else {"type": "paragraph"})
+        else:
+            logger.warning(f"⚠️ 未知段落类型，已跳过: paragraphs[{i}].type={para_type!r}")
+    return built
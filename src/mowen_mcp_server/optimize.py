@@ -0,0 +1,121 @@
+"""
+NoteAtom 请求体优化
+
+智能体生成的段落经常包含标记完全相同的相邻文本、空文本以及多余的空段落，
+这里在发送前做一次压缩：
+
+- 合并标记集合相同的相邻文本节点
+- 删除空文本节点
+- （可选）连续多个空段落只保留一个，删除末尾的空段落（至少保留一个段落）
+
+前两步不改变笔记的显示效果；空段落可能是有意留出的空行，合并后内容会变化，需要显式开启。
+
+只有发生变化的段落会被重新创建，其余节点原样复用。
+"""
+
+from dataclasses import dataclass
+from itertools import groupby
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .noteatom import TEXT_PARAGRAPH_TYPES
+
+
+@dataclass
+class OptimizeStats:
+    """一次优化的统计结果"""
+    merged_texts: int = 0
+    dropped_texts: int = 0
+    dropped_paragraphs: int = 0
+    # 传入编码函数时统计节省的请求体字节数
+    bytes_saved: int = 0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.merged_texts or self.dropped_texts or self.dropped_paragraphs)
+
+
+def _marks_key(node: Dict[str, Any]) -> Tuple[Any, ...]:
+    marks = node.get("marks")
+    return tuple(marks) if marks else ()
+
+
+def _run_key(node: Dict[str, Any]) -> Tuple[Any, ...]:
+    """相邻节点的分组键：只有标记相同的文本节点会被分到同一组"""
+    if node.get("type") == "text":
+        return (True, _marks_key(node))
+    return (False, id(node))
+
+
+def _is_empty_text(node: Dict[str, Any]) -> bool:
+    return node.get("type") == "text" and not node.get("text")
+
+
+def _is_empty_paragraph(node: Dict[str, Any]) -> bool:
+    return node.get("type") == "paragraph" and not node.get("content")
+
+
+def _optimize_texts(node: Dict[str, Any], stats: OptimizeStats) -> Dict[str, Any]:
+    """合并/删除一个文本段落中的文本节点，没有变化时返回原节点"""
+    texts = node.get("content")
+    if not texts:
+        return node
+    kept = [text for text in texts if not _is_empty_text(text)]
+    dropped = len(texts) - len(kept)
+    merged: List[Dict[str, Any]] = []
+    for _, group in groupby(kept, key=_run_key):
+        run = list(group)
+        if len(run) == 1:
+            merged.append(run[0])
+            continue
+        merged.append({**run[0], "text": "".join(text["text"] for text in run)})
+        stats.merged_texts += len(run) - 1
+    if not dropped and len(merged) == len(texts):
+        return node
+    stats.dropped_texts += dropped
+    new_node = {key: value for key, value in node.items() if key != "content"}
+    if merged:
+        new_node["content"] = merged
+    return new_node
+
+
+def optimize_doc(
+    body: Dict[str, Any],
+    dumps: Optional[Callable[[Any], bytes]] = None,
+    collapse_paragraphs: bool = False,
+) -> Tuple[Dict[str, Any], OptimizeStats]:
+    """
+    优化 NoteAtom 文档
+
+    参数:
+    - body: NoteAtom 文档（不会被修改）
+    - dumps: 请求体编码函数（可选），传入时只对发生变化的段落编码来统计节省的字节数
+    - collapse_paragraphs: 是否合并连续的空段落并删除末尾的空段落
+
+    返回: (优化后的文档, 统计结果)
+    """
+    stats = OptimizeStats()
+    size = (lambda obj: len(dumps(obj))) if dumps is not None else None
+    content: List[Dict[str, Any]] = []
+    saved = 0
+    for node in body.get("content") or ():
+        if node.get("type") in TEXT_PARAGRAPH_TYPES:
+            optimized = _optimize_texts(node, stats)
+            if optimized is not node and size is not None:
+                saved += size(node) - size(optimized)
+            node = optimized
+        if collapse_paragraphs and _is_empty_paragraph(node) and content and _is_empty_paragraph(content[-1]):
+            stats.dropped_paragraphs += 1
+            if size is not None:
+                saved += size(node) + 1
+            continue
+        content.append(node)
+    # 至少保留一个段落，避免发送空文档
+    while collapse_paragraphs and len(content) > 1 and _is_empty_paragraph(content[-1]):
+        node = content.pop()
+        stats.dropped_paragraphs += 1
+        if size is not None:
+            saved += size(node) + 1
+    stats.bytes_saved = saved
+    if not stats.changed:
+        return body, stats
+    return {**body, "content": content}, stats
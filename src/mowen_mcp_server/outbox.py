@@ -0,0 +1,370 @@
+"""
+笔记写入的本地待发送队列（outbox）
+
+stdio 客户端会频繁重启服务器进程，如果进程在文件上传完成之后、调用 note/create 之前退出，
+已上传的文件和整个请求都会丢失，智能体只能从头再来。这里在开始上传之前把写入意图记录到
+本地SQLite（WAL），每个文件上传成功后记录得到的文件节点，笔记写入成功后删除记录：
+
+- 进程崩溃后，下次启动时由后台 flusher 继续执行未完成的写入，已上传的文件不再重复上传
+- 网络暂时不可用（可以安全重放的失败）时保留记录，按指数退避定期重试，网络恢复后自动发送
+- 不可重放的失败（参数错误、配额不足、可能已被服务端处理的创建请求等）标记为 failed，不再重试
+- note/create 发出前把记录标记为 sending；进程在发送过程中退出时无法确认笔记是否已经创建，
+  这样的记录标记为 failed 并提示用户确认，不会自动重发
+- 同一篇笔记的编辑写入成功后，删除更早的待发送编辑（edit_note 替换整篇笔记，重发旧编辑会覆盖新内容）
+
+多个进程共享同一个数据库时，通过租约保证同一条记录同一时间只由一个进程处理：处理期间定期续约，
+当前进程正在处理的记录即使租约过期也不会被本进程的 flusher 再次领取。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple, Union
+
+from .storage import connect, run_blocking
+
+logger = logging.getLogger("mowen-mcp-server")
+
+# 写入类型对应的API端点（决定失败后能否安全重放）
+OUTBOX_ENDPOINTS = {
+    "create_note": "note/create",
+    "edit_note": "note/edit",
+}
+
+OUTBOX_PENDING = "pending"
+OUTBOX_SENDING = "sending"
+OUTBOX_FAILED = "failed"
+
+# 创建请求发出后结果未知时记录的错误信息
+UNCONFIRMED_CREATE = "创建请求已经发出但没有收到结果（进程退出或请求被取消），笔记可能已经创建，为避免重复创建不会自动重发"
+
+# 当前进程的标识：主机名:进程号
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class NoteDeferredError(Exception):
+    """笔记写入暂时失败，已保留在本地队列中等待自动重发"""
+
+    def __init__(self, entry_id: str, cause: Union[BaseException, str]):
+        self.entry_id = entry_id
+        self.cause = cause
+        super().__init__(f"笔记已保存到本地待发送队列（{entry_id}），网络恢复后会自动发送: {cause}")
+
+
+class NoteUnconfirmedError(Exception):
+    """相同的创建请求之前已经发出但结果未知，不会自动重发"""
+
+    def __init__(self, entry_id: str):
+        self.entry_id = entry_id
+        super().__init__(
+            f"相同的创建请求（{entry_id}）之前已经发出但没有收到结果，笔记可能已经创建。"
+            "请先在墨问中确认；确认未创建时传入新的 idempotency_key 重新创建"
+        )
+
+
+@dataclass
+class OutboxEntry:
+    """一条待发送的笔记写入"""
+    entry_id: str
+    kind: str
+    paragraphs: List[Dict[str, Any]]
+    note_id: Optional[str] = None
+    settings: Optional[Dict[str, Any]] = None
+    # 段落下标 -> 已上传得到的文件节点
+    files: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+    attempts: int = 0
+    last_error: Optional[str] = None
+    created_at: float = 0.0
+
+
+def _owner_alive(owner: Optional[str]) -> bool:
+    """租约持有进程是否仍在运行（无法判断其他主机上的进程时按存活处理）"""
+    if not owner:
+        return False
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    if int(pid) == os.getpid():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class Outbox:
+    """基于SQLite的笔记写入队列"""
+
+    def __init__(
+        self,
+        path: Path,
+        lease: float = 300.0,
+        base_delay: float = 5.0,
+        max_delay: float = 600.0,
+        failed_ttl: float = 7 * 24 * 3600,
+    ):
+        """
+        参数:
+        - path: SQLite数据库文件路径
+        - lease: 处理一条记录时持有的租约时长（秒），每上传完一个文件续约一次
+        - base_delay/max_delay: 暂时失败后重试的指数退避参数（秒）
+        - failed_ttl: 失败记录的保留时间（秒）
+        """
+        self.lease = lease
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failed_ttl = failed_ttl
+        # 当前进程正在处理的记录，claim 不会再次领取
+        self._active: Set[str] = set()
+        self._conn = connect(path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS note_outbox (
+                entry_id TEXT PRIMARY KEY,
+                account TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                note_id TEXT,
+                paragraphs TEXT NOT NULL,
+                settings TEXT,
+                files TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                next_attempt_at REAL NOT NULL,
+                owner TEXT,
+                lease_until REAL NOT NULL
+            )
+            """
+        )
+
+    def add(
+        self,
+        account: str,
+        kind: str,
+        paragraphs: List[Dict[str, Any]],
+        note_id: Optional[str] = None,
+        settings: Optional[Dict[str, Any]] = None,
+    ) -> OutboxEntry:
+        """记录一次写入意图，当前进程持有租约（处理期间用 hold 续约）"""
+        now = time.time()
+        entry = OutboxEntry(
+            entry_id=uuid.uuid4().hex[:16], kind=kind, paragraphs=paragraphs,
+            note_id=note_id, settings=settings, created_at=now,
+        )
+        self._conn.execute(
+            "INSERT INTO note_outbox VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                entry.entry_id, account, kind, note_id,
+                json.dumps(paragraphs, ensure_ascii=False),
+                None if settings is None else json.dumps(settings, ensure_ascii=False),
+                "{}", OUTBOX_PENDING, 0, None, now, now, _OWNER, now + self.lease,
+            ),
+        )
+        return entry
+
+    def record_file(self, entry: OutboxEntry, index: int, node: Dict[str, Any]) -> None:
+        """记录一个已上传的文件节点，并续约"""
+        entry.files[index] = node
+        try:
+            self._conn.execute(
+                "UPDATE note_outbox SET files=?, lease_until=? WHERE entry_id=?",
+                (json.dumps({str(k): v for k, v in entry.files.items()}, ensure_ascii=False),
+                 time.time() + self.lease, entry.entry_id),
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ 待发送队列写入失败: {e}")
+
+    def renew(self, entry: OutboxEntry) -> None:
+        """续约当前进程持有的记录"""
+        self._conn.execute(
+            "UPDATE note_outbox SET lease_until=? WHERE entry_id=? AND owner=?",
+            (time.time() + self.lease, entry.entry_id, _OWNER),
+        )
+
+    async def _heartbeat(self, entry: OutboxEntry) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await run_blocking(self.renew, entry)
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ 待发送队列续约失败: {e}")
+
+    @asynccontextmanager
+    async def hold(self, entry: OutboxEntry) -> AsyncIterator[None]:
+        """
+        处理一条记录期间持有它：登记为当前进程正在处理的记录，并每 lease/3 秒续约一次
+
+        退出时记录仍是待发送状态（处理被取消）则立即释放租约，之后由 flusher 重新领取。
+        """
+        self._active.add(entry.entry_id)
+        heartbeat = asyncio.create_task(self._heartbeat(entry))
+        try:
+            yield
+        finally:
+            heartbeat.cancel()
+            self._active.discard(entry.entry_id)
+            try:
+                await run_blocking(self._release, entry)
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ 待发送队列写入失败: {e}")
+
+    def _release(self, entry: OutboxEntry) -> None:
+        """释放仍是待发送状态的记录的租约"""
+        self._conn.execute(
+            "UPDATE note_outbox SET owner=NULL, lease_until=0 WHERE entry_id=? AND owner=? AND status=?",
+            (entry.entry_id, _OWNER, OUTBOX_PENDING),
+        )
+
+    def mark_sending(self, entry: OutboxEntry) -> None:
+        """即将发出不可重放的请求（note/create），进程在此之后退出时不再自动重发"""
+        self._conn.execute(
+            "UPDATE note_outbox SET status=?, lease_until=? WHERE entry_id=?",
+            (OUTBOX_SENDING, time.time() + self.lease, entry.entry_id),
+        )
+
+    def complete(self, entry: OutboxEntry) -> None:
+        """写入成功，删除记录"""
+        self._conn.execute("DELETE FROM note_outbox WHERE entry_id=?", (entry.entry_id,))
+
+    def supersede(self, account: str, entry: OutboxEntry) -> int:
+        """
+        编辑成功后删除同一篇笔记更早的待发送编辑，返回删除的记录数
+
+        edit_note 每次都替换整篇笔记，更早的编辑如果在之后重发会覆盖这次成功写入的内容。
+        """
+        cursor = self._conn.execute(
+            "DELETE FROM note_outbox WHERE account=? AND kind=? AND note_id=? AND status=? "
+            "AND created_at<=? AND entry_id<>?",
+            (account, "edit_note", entry.note_id, OUTBOX_PENDING, entry.created_at, entry.entry_id),
+        )
+        return cursor.rowcount
+
+    def exists(self, entry: OutboxEntry) -> bool:
+        """记录是否仍在队列中（没有被完成或取代）"""
+        row = self._conn.execute(
+            "SELECT 1 FROM note_outbox WHERE entry_id=?", (entry.entry_id,)
+        ).fetchone()
+        return row is not None
+
+    def defer(self, entry: OutboxEntry, error: str) -> float:
+        """
+        暂时失败（请求确定没有被处理），释放租约并安排下一次重试，返回重试等待时间（秒）
+        """
+        entry.attempts += 1
+        entry.last_error = error
+        delay = min(self.max_delay, self.base_delay * (2 ** (entry.attempts - 1)))
+        self._conn.execute(
+            "UPDATE note_outbox SET status=?, attempts=?, last_error=?, next_attempt_at=?, owner=NULL, lease_until=0 "
+            "WHERE entry_id=?",
+            (OUTBOX_PENDING, entry.attempts, error, time.time() + delay, entry.entry_id),
+        )
+        return delay
+
+    def fail(self, entry: OutboxEntry, error: str) -> None:
+        """不可重放的失败，标记为 failed 后不再重试"""
+        entry.last_error = error
+        self._conn.execute(
+            "UPDATE note_outbox SET status=?, last_error=?, owner=NULL, lease_until=0 WHERE entry_id=?",
+            (OUTBOX_FAILED, error, entry.entry_id),
+        )
+
+    def _abandoned(self, entry_id: str, owner: Optional[str], lease_until: float, now: float) -> bool:
+        """记录没有进程在处理：不是当前进程正在处理的记录，并且租约已过期或持有进程已退出"""
+        if entry_id in self._active:
+            return False
+        return lease_until <= now or not _owner_alive(owner)
+
+    def expire_sending(self, account: str, now: Optional[float] = None) -> List[str]:
+        """
+        把发送过程中被放弃的创建请求标记为 failed（结果未知，不自动重发），返回这些记录的ID
+        """
+        now = time.time() if now is None else now
+        rows = self._conn.execute(
+            "SELECT entry_id, owner, lease_until FROM note_outbox WHERE account=? AND status=?",
+            (account, OUTBOX_SENDING),
+        ).fetchall()
+        expired = []
+        for entry_id, owner, lease_until in rows:
+            if not self._abandoned(entry_id, owner, lease_until, now):
+                continue
+            cursor = self._conn.execute(
+                "UPDATE note_outbox SET status=?, last_error=?, owner=NULL, lease_until=0 "
+                "WHERE entry_id=? AND status=? AND owner IS ? AND lease_until=?",
+                (OUTBOX_FAILED, UNCONFIRMED_CREATE, entry_id, OUTBOX_SENDING, owner, lease_until),
+            )
+            if cursor.rowcount == 1:
+                expired.append(entry_id)
+        return expired
+
+    def status(self, entry_id: str) -> Optional[Tuple[str, Optional[str]]]:
+        """记录的 (状态, 最近一次错误)，记录不存在时返回None"""
+        row = self._conn.execute(
+            "SELECT status, last_error FROM note_outbox WHERE entry_id=?", (entry_id,)
+        ).fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def claim(self, account: str, now: Optional[float] = None) -> Optional[OutboxEntry]:
+        """领取一条到期的待发送记录（没有进程在处理），没有时返回None"""
+        now = time.time() if now is None else now
+        rows = self._conn.execute(
+            "SELECT entry_id, owner, lease_until FROM note_outbox "
+            "WHERE account=? AND status=? AND next_attempt_at<=? ORDER BY created_at",
+            (account, OUTBOX_PENDING, now),
+        ).fetchall()
+        for entry_id, owner, lease_until in rows:
+            if not self._abandoned(entry_id, owner, lease_until, now):
+                continue
+            cursor = self._conn.execute(
+                "UPDATE note_outbox SET owner=?, lease_until=? "
+                "WHERE entry_id=? AND status=? AND (owner IS ? AND lease_until=?)",
+                (_OWNER, now + self.lease, entry_id, OUTBOX_PENDING, owner, lease_until),
+            )
+            if cursor.rowcount == 1:
+                return self._load(entry_id)
+        return None
+
+    def _load(self, entry_id: str) -> Optional[OutboxEntry]:
+        row = self._conn.execute(
+            "SELECT kind, note_id, paragraphs, settings, files, attempts, last_error, created_at "
+            "FROM note_outbox WHERE entry_id=?",
+            (entry_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        kind, note_id, paragraphs, settings, files, attempts, last_error, created_at = row
+        return OutboxEntry(
+            entry_id=entry_id, kind=kind, note_id=note_id,
+            paragraphs=json.loads(paragraphs),
+            settings=None if settings is None else json.loads(settings),
+            files={int(k): v for k, v in json.loads(files).items()},
+            attempts=attempts, last_error=last_error, created_at=created_at,
+        )
+
+    def counts(self, account: str) -> Dict[str, int]:
+        """按状态统计记录数"""
+        rows = self._conn.execute(
+            "SELECT status, COUNT(*) FROM note_outbox WHERE account=? GROUP BY status", (account,)
+        ).fetchall()
+        return {status: count for status, count in rows}
+
+    def evict(self) -> None:
+        """删除超过保留时间的失败记录"""
+        self._conn.execute(
+            "DELETE FROM note_outbox WHERE status=? AND created_at<?",
+            (OUTBOX_FAILED, time.time() - self.failed_ttl),
+        )
+
+    def close(self) -> None:
+        self._conn.close()
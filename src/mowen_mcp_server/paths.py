@@ -0,0 +1,302 @@
+"""
+本地文件路径解析
+
+文件段落的本地路径来自各种客户端，格式五花八门（正反斜杠混用、相对路径、多余的@前缀等）。
+这里把路径标准化、存在性检查、文件类型和大小检查合并为一次解析：标准化之后只调用一次 stat，
+结果（标准化路径、文件类型、大小、修改时间）保存在 ResolvedFile 中供后续上传使用。
+
+解析涉及阻塞的文件系统调用，在网络文件系统上尤其慢。PathResolver 把解析放到线程池中执行，
+并在同一次请求内按原始路径缓存解析结果，重复出现的路径只解析一次。
+"""
+
+import asyncio
+import logging
+import os
+import stat
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger("mowen-mcp-server")
+
+
+class FilePathError(ValueError):
+    """本地文件路径无效"""
+
+
+@dataclass(frozen=True)
+class ResolvedFile:
+    """一次本地路径解析的结果"""
+    # 调用方传入的原始路径
+    source_path: str
+    # 标准化后的绝对路径
+    path: str
+    # 按扩展名判断的文件类型（image/audio/pdf）
+    file_type: str
+    size: int
+    mtime: float
+
+
+# 支持的文件扩展名
+SUPPORTED_EXTENSIONS = {
+    "image": {".gif", ".jpeg", ".jpg", ".png", ".webp"},
+    "audio": {".mp3", ".mp4", ".m4a"},
+    "pdf": {".pdf"}
+}
+
+# 文件大小限制 (字节)
+FILE_SIZE_LIMITS = {
+    "image": 50 * 1024 * 1024,  # 50MB
+    "audio": 200 * 1024 * 1024,  # 200MB
+    "pdf": 100 * 1024 * 1024   # 100MB
+}
+
+
+def get_file_type_from_extension(file_path: str) -> Optional[str]:
+    """根据文件扩展名判断文件类型"""
+    ext = Path(file_path).suffix.lower()
+    
+    for file_type, extensions in SUPPORTED_EXTENSIONS.items():
+        if ext in extensions:
+            return file_type
+    return None
+
+
+def normalize_file_path(file_path: str) -> str:
+    """
+    标准化文件路径，处理不同操作系统和客户端传入的路径格式
+    
+    主要处理：
+    1. 正斜杠和反斜杠的统一
+    2. 路径分隔符的标准化
+    3. 相对路径转绝对路径
+    4. 客户端路径前缀异常修复（如多余的@符号）
+    
+    参数:
+    - file_path: 原始文件路径
+    
+    返回: 标准化后的文件路径
+    """
+    if not file_path:
+        return file_path
+    
+    try:
+        # 记录原始路径
+        logger.debug("🔧 路径标准化 - 原始路径: %r", file_path)
+        
+        # 预处理：检查并修复客户端路径异常
+        cleaned_path = _clean_client_path_anomalies(file_path)
+        if cleaned_path != file_path:
+            logger.debug("🔧 路径标准化 - 客户端异常修复: %r -> %r", file_path, cleaned_path)
+        
+        # 使用pathlib自动处理路径分隔符
+        # pathlib会自动将正斜杠转换为当前系统的路径分隔符
+        path = Path(cleaned_path)
+        
+        # 如果是相对路径，转换为绝对路径
+        if not path.is_absolute():
+            path = path.resolve()
+            logger.debug("🔧 路径标准化 - 相对路径转绝对路径: %s", path)
+        else:
+            # 即使是绝对路径，也进行resolve()来标准化
+            path = path.resolve()
+        
+        normalized_path = str(path)
+        logger.debug("🔧 路径标准化 - 最终路径: %r", normalized_path)
+        
+        return normalized_path
+        
+    except Exception as e:
+        logger.warning(f"⚠️ 路径标准化失败: {file_path}, 错误: {str(e)}")
+        # 如果标准化失败，返回原始路径
+        return file_path
+
+
+def _clean_client_path_anomalies(file_path: str) -> str:
+    """
+    清理客户端传入路径的异常情况
+    
+    处理已知的客户端路径问题：
+    1. 文件名前多余的@符号
+    2. 其他可能的前缀异常
+    
+    参数:
+    - file_path: 原始文件路径
+    
+    返回: 清理后的文件路径
+    """
+    if not file_path:
+        return file_path
+    
+    original_path = file_path
+    
+    # 检查文件名前是否有多余的@符号
+    # 例如: "D:\\@note.png" -> "D:\\note.png"
+    if '@' in file_path:
+        # 分离路径和文件名
+        path_obj = Path(file_path)
+        parent_dir = path_obj.parent
+        filename = path_obj.name
+        
+        # 如果文件名以@开头，尝试移除@
+        if filename.startswith('@'):
+            cleaned_filename = filename[1:]  # 移除第一个@字符
+            cleaned_path = str(parent_dir / cleaned_filename)
+            
+            logger.info(f"🔧 检测到文件名前缀@符号: {repr(filename)} -> {repr(cleaned_filename)}")
+            return cleaned_path
+    
+    # 可以在这里添加其他客户端异常的处理逻辑
+    # 例如：处理其他特殊前缀字符
+    
+    return original_path
+
+
+def resolve_local_file(file_path: str) -> ResolvedFile:
+    """
+    解析并验证本地文件路径
+    
+    自动处理路径格式兼容性：
+    - 支持正斜杠和反斜杠混用
+    - 自动标准化路径分隔符
+    - 兼容不同客户端的路径格式
+    - 自动修复客户端路径异常（如@前缀）
+    
+    标准化之后只调用一次 stat，同时得到文件是否存在、是否为普通文件以及文件大小。
+    这是阻塞的文件系统调用，在事件循环中请通过 PathResolver 调用。
+    
+    返回: 解析结果
+    
+    异常:
+    - FilePathError: 文件不存在、不是文件、类型不支持或文件过大
+    """
+    normalized_path = normalize_file_path(file_path)
+    logger.debug("🔍 文件路径验证 - 标准化路径: %s", normalized_path)
+    try:
+        file_stat = _stat_if_exists(normalized_path)
+        if file_stat is None:
+            # 如果标准化后的路径仍然不存在，尝试额外的修复策略
+            alternative_path = _try_alternative_path_fixes(file_path)
+            if alternative_path and alternative_path != normalized_path:
+                file_stat = _stat_if_exists(alternative_path)
+                if file_stat is not None:
+                    logger.info(f"🔧 使用替代路径修复成功: {alternative_path}")
+                    normalized_path = alternative_path
+            if file_stat is None:
+                # 提供详细的错误信息，包括尝试的所有路径
+                error_msg = f"文件不存在：{file_path}"
+                if normalized_path != file_path:
+                    error_msg += f"\n标准化后路径：{normalized_path}"
+                if alternative_path and alternative_path != normalized_path:
+                    error_msg += f"\n尝试的替代路径：{alternative_path}"
+                error_msg += f"\n💡 请检查：\n  1. 文件路径是否正确\n  2. 文件是否确实存在\n  3. 路径中是否包含特殊字符或异常前缀"
+                raise FilePathError(error_msg)
+    except OSError as e:
+        error_msg = f"文件路径验证失败：{str(e)}"
+        if file_path != normalized_path:
+            error_msg += f"\n原始路径：{file_path}\n标准化路径：{normalized_path}"
+        raise FilePathError(error_msg) from e
+    
+    # 检查是否为文件
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise FilePathError(f"路径不是文件：{normalized_path}")
+    
+    # 检查文件类型
+    file_type = get_file_type_from_extension(normalized_path)
+    if not file_type:
+        supported = ", ".join([f"{ft}({', '.join(exts)})" for ft, exts in SUPPORTED_EXTENSIONS.items()])
+        raise FilePathError(f"不支持的文件类型。支持的类型：{supported}")
+    
+    # 检查文件大小
+    size_limit = FILE_SIZE_LIMITS[file_type]
+    if file_stat.st_size > size_limit:
+        size_mb = size_limit // (1024 * 1024)
+        raise FilePathError(f"文件过大。{file_type}类型文件最大支持{size_mb}MB")
+    
+    logger.debug("✅ 文件路径验证通过: %s", normalized_path)
+    return ResolvedFile(
+        source_path=file_path,
+        path=normalized_path,
+        file_type=file_type,
+        size=file_stat.st_size,
+        mtime=file_stat.st_mtime,
+    )
+
+
+def _stat_if_exists(path: str) -> Optional[os.stat_result]:
+    """stat 文件，路径不存在时返回None，其他错误照常抛出"""
+    try:
+        return os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def validate_file_path(file_path: str) -> Tuple[bool, str]:
+    """
+    验证文件路径的安全性和有效性（需要解析结果时直接调用 resolve_local_file）
+    
+    返回: (是否有效, 错误信息)
+    """
+    try:
+        resolve_local_file(file_path)
+    except FilePathError as e:
+        return False, str(e)
+    return True, ""
+
+
+def _try_alternative_path_fixes(file_path: str) -> Optional[str]:
+    """
+    尝试额外的路径修复策略
+    
+    当标准化路径仍然无效时，尝试其他可能的修复方法：
+    1. 直接移除文件名前的@符号（不通过标准化）
+    2. 其他可能的客户端异常修复
+    
+    参数:
+    - file_path: 原始文件路径
+    
+    返回: 修复后的路径，如果无法修复则返回None
+    """
+    if not file_path:
+        return None
+    
+    # 策略1：直接检查原始路径中的@符号问题
+    if '@' in file_path:
+        # 尝试移除文件名中的@符号
+        path_obj = Path(file_path)
+        parent_dir = path_obj.parent
+        filename = path_obj.name
+        
+        if filename.startswith('@'):
+            # 移除@前缀
+            cleaned_filename = filename[1:]
+            alternative_path = str(parent_dir / cleaned_filename)
+            logger.info(f"🔧 尝试替代路径修复 - 移除@前缀: {repr(file_path)} -> {repr(alternative_path)}")
+            return alternative_path
+    
+    # 可以在这里添加其他修复策略
+    # 例如：处理其他已知的客户端异常模式
+    
+    return None
+
+
+
+class PathResolver:
+    """
+    同一次请求内共享的路径解析器
+
+    解析在线程池中执行，不阻塞事件循环；相同的原始路径只解析一次，
+    并发解析同一路径时等待同一个结果。
+    """
+
+    def __init__(self):
+        self._memo: Dict[str, "asyncio.Future[ResolvedFile]"] = {}
+
+    async def resolve(self, file_path: str) -> ResolvedFile:
+        """解析本地文件路径，失败时抛出 FilePathError"""
+        future = self._memo.get(file_path)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(None, resolve_local_file, file_path)
+            self._memo[file_path] = future
+        return await asyncio.shield(future)
@@ -0,0 +1,154 @@
+"""
+本地文件上传前的预检
+
+上传端点会检查文件的 MIME 类型，扩展名与实际内容不符的文件（例如实际是 JPEG 或 HEIC 的 .png）
+要等获取上传授权、完整投递之后才会被拒绝。这里在线程池中对每个本地文件做一次预检：
+
+- 内存映射文件，根据文件头的魔数判断实际格式，与扩展名对应的格式不符时立即在本地报错
+- 同一次映射中计算内容哈希（SHA-256），上传缓存等后续步骤直接复用，不再重新读一遍文件
+"""
+
+import hashlib
+import mmap
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, FrozenSet, Optional
+
+# 判断格式需要的文件头长度
+SNIFF_BYTES = 1024
+
+# 扩展名 -> 墨问上传端点接受的 MIME 类型（见 墨问API.md 中上传接口的限制说明）
+EXTENSION_MIME_TYPES: Dict[str, FrozenSet[str]] = {
+    ".gif": frozenset({"image/gif"}),
+    ".jpeg": frozenset({"image/jpeg"}),
+    ".jpg": frozenset({"image/jpeg"}),
+    ".png": frozenset({"image/png"}),
+    ".webp": frozenset({"image/webp"}),
+    ".mp3": frozenset({"audio/mpeg"}),
+    ".mp4": frozenset({"audio/mp4", "audio/x-m4a"}),
+    ".m4a": frozenset({"audio/mp4", "audio/x-m4a"}),
+    ".pdf": frozenset({"application/pdf"}),
+}
+
+# MIME 类型对应的常用扩展名（用于错误提示）
+_MIME_EXTENSIONS = {
+    "image/gif": ".gif",
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/heic": ".heic",
+    "image/avif": ".avif",
+    "image/bmp": ".bmp",
+    "image/tiff": ".tiff",
+    "audio/mpeg": ".mp3",
+    "audio/mp4": ".m4a",
+    "audio/x-m4a": ".m4a",
+    "audio/wav": ".wav",
+    "audio/ogg": ".ogg",
+    "audio/flac": ".flac",
+    "video/quicktime": ".mov",
+    "application/pdf": ".pdf",
+    "application/zip": ".zip",
+}
+
+# ISO 基础媒体文件（ftyp）中表示 HEIF/AVIF 图片的品牌
+_HEIF_BRANDS = {b"heic", b"heix", b"heim", b"heis", b"hevc", b"hevx", b"mif1", b"msf1"}
+_AVIF_BRANDS = {b"avif", b"avis"}
+
+
+class FilePreflightError(ValueError):
+    """文件内容与扩展名不符或无法识别"""
+
+
+@dataclass(frozen=True)
+class PreflightResult:
+    """一次预检的结果"""
+    # 根据文件头判断的 MIME 类型
+    mime: str
+    # 文件内容的 SHA-256（未要求计算时为None）
+    content_hash: Optional[str] = None
+
+
+def sniff_mime(header: bytes) -> Optional[str]:
+    """根据文件头的魔数判断 MIME 类型，无法识别时返回None"""
+    if header.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        return "audio/wav"
+    if header[4:8] == b"ftyp":
+        brand = header[8:12]
+        if brand in _HEIF_BRANDS:
+            return "image/heic"
+        if brand in _AVIF_BRANDS:
+            return "image/avif"
+        if brand == b"qt  ":
+            return "video/quicktime"
+        if brand == b"M4A ":
+            return "audio/x-m4a"
+        return "audio/mp4"
+    if header.startswith(b"ID3"):
+        return "audio/mpeg"
+    # MPEG 音频帧同步字（11位1），layer 位不为0（排除 AAC ADTS）
+    if len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0 and header[1] & 0x06:
+        return "audio/mpeg"
+    if header.startswith(b"OggS"):
+        return "audio/ogg"
+    if header.startswith(b"fLaC"):
+        return "audio/flac"
+    if header.startswith(b"BM"):
+        return "image/bmp"
+    if header.startswith((b"II*\x00", b"MM\x00*")):
+        return "image/tiff"
+    if header.startswith(b"PK\x03\x04"):
+        return "application/zip"
+    # PDF 文件头前允许有少量其他字节
+    if b"%PDF-" in header[:SNIFF_BYTES]:
+        return "application/pdf"
+    return None
+
+
+def preflight_file(path: str, compute_hash: bool = True) -> PreflightResult:
+    """
+    预检本地文件（阻塞调用，应放到线程池中执行）
+
+    参数:
+    - path: 标准化后的本地文件路径
+    - compute_hash: 是否同时计算内容哈希
+
+    返回: 预检结果
+
+    异常:
+    - FilePreflightError: 文件为空、格式无法识别或与扩展名不符
+    """
+    ext = Path(path).suffix.lower()
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            raise FilePreflightError(f"文件为空：{Path(path).name}")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            mime = sniff_mime(mapped[:SNIFF_BYTES])
+            expected = EXTENSION_MIME_TYPES.get(ext)
+            if expected is not None and mime not in expected:
+                raise FilePreflightError(_mismatch_message(path, ext, mime))
+            content_hash = hashlib.sha256(mapped).hexdigest() if compute_hash else None
+    return PreflightResult(mime=mime or "application/octet-stream", content_hash=content_hash)
+
+
+def _mismatch_message(path: str, ext: str, mime: Optional[str]) -> str:
+    name = Path(path).name
+    if mime is None:
+        return f"无法识别文件格式：{name} 的内容不是有效的 {ext} 文件，墨问会拒绝上传"
+    suggestion = _MIME_EXTENSIONS.get(mime)
+    message = f"文件内容与扩展名不符：{name} 的实际格式是 {mime}，墨问会拒绝上传"
+    if suggestion in EXTENSION_MIME_TYPES:
+        message += f"\n💡 请把扩展名改为 {suggestion} 后重试"
+    else:
+        message += "\n💡 请先转换为支持的格式（图片 .gif/.jpeg/.jpg/.png/.webp，音频 .mp3/.mp4/.m4a，PDF .pdf）"
+    return message
@@ -0,0 +1,326 @@
+"""
+每日配额统计模块
+
+墨问开放API对每个接口都有每日配额（调用成功才计为 1 次），例如 note/edit 每天 1000 次。
+这里在本地按配额项统计当天已成功的调用次数并持久化到本地SQLite，进程重启后继续累计，
+同一个密钥的多个进程共用计数；在发出请求前就判断配额是否足够，配额不足时直接在本地拒绝。
+"""
+
+import json
+import logging
+import math
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .errors import MowenAPIError
+from .storage import connect, transaction
+
+logger = logging.getLogger("mowen-mcp-server")
+
+# 墨问API文档中的每日配额（按配额项）
+DAILY_QUOTAS: Dict[str, int] = {
+    "note/create": 100,
+    "note/edit": 1000,
+    "note/set": 100,
+    "auth/key/reset": 100,
+    # 文档说明每天可以上传 200 个文件，本地上传和URL上传共用这一份配额
+    "upload": 200,
+}
+
+# 共用同一个配额项的端点，未列出的端点单独统计
+QUOTA_KEYS: Dict[str, str] = {
+    "upload/prepare": "upload",
+    "upload/url": "upload",
+}
+
+# 配额按北京时间自然日重置
+QUOTA_TIMEZONE = timezone(timedelta(hours=8))
+
+PRIORITIES = ("high", "normal", "low")
+
+
+class QuotaExceededError(MowenAPIError):
+    """本地判断配额不足时抛出，不会发出网络请求"""
+    def __init__(self, endpoint: str, message: str):
+        self.endpoint = endpoint
+        super().__init__(403, "Quota", message)
+
+
+def quota_key(endpoint: str) -> str:
+    """端点对应的配额项"""
+    return QUOTA_KEYS.get(endpoint, endpoint)
+
+
+def quota_day(now: Optional[datetime] = None) -> str:
+    """返回配额所属的日期（北京时间）"""
+    now = now or datetime.now(QUOTA_TIMEZONE)
+    return now.astimezone(QUOTA_TIMEZONE).strftime("%Y-%m-%d")
+
+
+def next_reset(now: Optional[datetime] = None) -> datetime:
+    """返回下一次配额重置的时间（北京时间零点）"""
+    now = (now or datetime.now(QUOTA_TIMEZONE)).astimezone(QUOTA_TIMEZONE)
+    return (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class QuotaTracker:
+    """
+    按配额项统计每日配额（upload/prepare 和 upload/url 共用 upload 配额）
+
+    - 请求发出前调用 admit() 预占一次配额，配额不足时抛出 QuotaExceededError
+    - 请求成功后调用 commit() 计入已用次数，失败时调用 release() 归还预占
+    - low 优先级的调用在剩余配额低于预留比例时就会被拒绝，把最后一部分配额留给重要调用
+
+    计数保存在本地SQLite中（按账户和日期），同一台机器上使用同一个密钥的所有进程共用一份统计。
+    预占直接计入计数：在同一个写事务里判断计数是否小于配额并加一，失败时再减一归还，
+    多个进程同时预占也不会超出配额。进程在请求过程中崩溃时预占不会归还，按已用计算（宁可少用不超额）。
+    不指定 path 或数据库无法打开时只在内存中统计。
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        limits: Optional[Dict[str, int]] = None,
+        low_priority_reserve: float = 0.1,
+        account: str = "default",
+        legacy_path: Optional[Path] = None,
+    ):
+        """
+        参数:
+        - path: SQLite数据库文件路径
+        - limits: 覆盖文档中的默认配额，键可以是配额项或端点
+        - low_priority_reserve: 为高优先级调用预留的配额比例
+        - account: 账户标识
+        - legacy_path: 旧版本保存当天计数的JSON文件，存在时导入后删除
+        """
+        self.limits = dict(DAILY_QUOTAS)
+        for endpoint, limit in (limits or {}).items():
+            self.limits[quota_key(endpoint)] = limit
+        self.low_priority_reserve = low_priority_reserve
+        self.account = account
+        self._day = quota_day()
+        # 没有数据库时的内存计数
+        self._used: Dict[str, int] = {}
+        # 当前进程中正在进行的调用：每次预占的日期以及是否记在数据库中
+        self._inflight: Dict[str, List[Tuple[str, bool]]] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        if path is not None:
+            try:
+                self._conn = connect(path)
+                self._conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS quota_usage (
+                        account TEXT NOT NULL,
+                        day TEXT NOT NULL,
+                        endpoint TEXT NOT NULL,
+                        used INTEGER NOT NULL,
+                        PRIMARY KEY (account, day, endpoint)
+                    )
+                    """
+                )
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"⚠️ 配额统计数据库打开失败，只在当前进程内统计: {e}")
+                self._conn = None
+        if legacy_path is not None:
+            self._import_legacy(legacy_path)
+
+    def _import_legacy(self, path: Path) -> None:
+        """导入旧版本JSON文件中当天的计数"""
+        if not path.exists():
+            return
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ 配额记录读取失败，重新开始统计: {e}")
+            return
+        if data.get("day") == self._day:
+            for endpoint, used in data.get("used", {}).items():
+                self._raise_used(quota_key(endpoint), int(used))
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+    def _used_counts(self) -> Dict[str, int]:
+        """当天各配额项的计数（已用次数加上所有进程中的预占）"""
+        if self._conn is None:
+            return dict(self._used)
+        try:
+            rows = self._conn.execute(
+                "SELECT endpoint, used FROM quota_usage WHERE account=? AND day=?", (self.account, self._day)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ 配额记录读取失败: {e}")
+            return dict(self._used)
+        return dict(rows)
+
+    def _get_used(self, endpoint: str) -> int:
+        if self._conn is None:
+            return self._used.get(endpoint, 0)
+        try:
+            row = self._conn.execute(
+                "SELECT used FROM quota_usage WHERE account=? AND day=? AND endpoint=?",
+                (self.account, self._day, endpoint),
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ 配额记录读取失败: {e}")
+            return self._used.get(endpoint, 0)
+        return 0 if row is None else row[0]
+
+    def _reserve(self, endpoint: str, ceiling: int) -> Optional[bool]:
+        """
+        计数小于 ceiling 时加一，返回是否记在数据库中；计数已达到 ceiling 时返回None
+
+        数据库中的判断和加一在同一个写事务里完成，多个进程同时预占时不会超出配额。
+        """
+        if self._conn is not None:
+            try:
+                with transaction(self._conn):
+                    self._conn.execute(
+                        "INSERT INTO quota_usage VALUES (?, ?, ?, 0) "
+                        "ON CONFLICT (account, day, endpoint) DO NOTHING",
+                        (self.account, self._day, endpoint),
+                    )
+                    cursor = self._conn.execute(
+                        "UPDATE quota_usage SET used = used + 1 "
+                        "WHERE account=? AND day=? AND endpoint=? AND used < ?",
+                        (self.account, self._day, endpoint, ceiling),
+                    )
+                if cursor.rowcount == 0:
+                    return None
+                self._used[endpoint] = self._used.get(endpoint, 0) + 1
+                return True
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ 配额预占写入失败，按当前进程的计数判断: {e}")
+        if self._used.get(endpoint, 0) >= ceiling:
+            return None
+        self._used[endpoint] = self._used.get(endpoint, 0) + 1
+        return False
+
+    def _refund(self, endpoint: str, day: str, in_db: bool) -> None:
+        """归还一次预占（跨过重置时间后旧日期的计数已经清理，不再归还）"""
+        if day != self._day:
+            return
+        self._used[endpoint] = max(0, self._used.get(endpoint, 0) - 1)
+        if not in_db or self._conn is None:
+            return
+        try:
+            self._conn.execute(
+                "UPDATE quota_usage SET used = used - 1 "
+                "WHERE account=? AND day=? AND endpoint=? AND used > 0",
+                (self.account, day, endpoint),
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ 配额归还失败: {e}")
+
+    def _raise_used(self, endpoint: str, used: int) -> None:
+        """把计数提高到至少 used"""
+        self._used[endpoint] = max(self._used.get(endpoint, 0), used)
+        if self._conn is None:
+            return
+        try:
+            self._conn.execute(
+                "INSERT INTO quota_usage VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (account, day, endpoint) DO UPDATE SET used = MAX(used, excluded.used)",
+                (self.account, self._day, endpoint, used),
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ 配额记录保存失败: {e}")
+
+    def _roll_day(self) -> None:
+        """跨过重置时间后从零开始统计，并删除之前日期的记录"""
+        today = quota_day()
+        if today == self._day:
+            return
+        self._day = today
+        self._used = {}
+        if self._conn is not None:
+            try:
+                self._conn.execute(
+                    "DELETE FROM quota_usage WHERE account=? AND day<?", (self.account, today)
+                )
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ 清理过期配额记录失败: {e}")
+
+    def _in_flight(self, endpoint: str) -> int:
+        """当前进程中当天正在进行的调用数"""
+        return sum(1 for day, _ in self._inflight.get(endpoint, []) if day == self._day)
+
+    def remaining(self, endpoint: str) -> Optional[int]:
+        """端点当天剩余配额（扣除所有进程中正在进行的调用），没有配额限制的端点返回None"""
+        endpoint = quota_key(endpoint)
+        limit = self.limits.get(endpoint)
+        if limit is None:
+            return None
+        self._roll_day()
+        return max(0, limit - self._get_used(endpoint))
+
+    def admit(self, endpoint: str, priority: str = "normal") -> None:
+        """发出请求前预占一次配额"""
+        key = quota_key(endpoint)
+        limit = self.limits.get(key)
+        if limit is None:
+            return
+        self._roll_day()
+        reserve = math.ceil(limit * self.low_priority_reserve) if priority == "low" else 0
+        in_db = self._reserve(key, limit - reserve)
+        if in_db is None:
+            remaining = self.remaining(endpoint) or 0
+            if remaining <= 0:
+                raise QuotaExceededError(
+                    endpoint, f"{key} 今日配额已用完（{limit}次/天），将于 {next_reset():%Y-%m-%d %H:%M} 重置"
+                )
+            raise QuotaExceededError(
+                endpoint, f"{key} 剩余配额 {remaining} 次，已预留给高优先级调用，低优先级调用被拒绝"
+            )
+        self._inflight.setdefault(key, []).append((self._day, in_db))
+
+    def _pop_inflight(self, endpoint: str) -> Optional[Tuple[str, bool]]:
+        reservations = self._inflight.get(endpoint)
+        return reservations.pop() if reservations else None
+
+    def release(self, endpoint: str) -> None:
+        """请求失败，归还预占的配额"""
+        endpoint = quota_key(endpoint)
+        reservation = self._pop_inflight(endpoint)
+        if reservation is not None:
+            self._roll_day()
+            self._refund(endpoint, *reservation)
+
+    def commit(self, endpoint: str) -> None:
+        """请求成功，预占转为已用次数"""
+        self._pop_inflight(quota_key(endpoint))
+
+    def mark_exhausted(self, endpoint: str) -> None:
+        """服务端返回配额不足时，以服务端为准把当天配额标记为用完"""
+        endpoint = quota_key(endpoint)
+        if endpoint not in self.limits:
+            return
+        self._roll_day()
+        self._raise_used(endpoint, self.limits[endpoint])
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        """返回各配额项当天的使用情况"""
+        self._roll_day()
+        reset_at = next_reset().strftime("%Y-%m-%d %H:%M")
+        counts = self._used_counts()
+        result = {}
+        for endpoint, limit in self.limits.items():
+            count = counts.get(endpoint, 0)
+            in_flight = self._in_flight(endpoint)
+            result[endpoint] = {
+                "limit": limit,
+                "used": max(0, count - in_flight),
+                "in_flight": in_flight,
+                "remaining": max(0, limit - count),
+                "reset_at": reset_at,
+            }
+        return result
+
+    def close(self) -> None:
+        """关闭数据库连接，之后的计数只保存在内存中"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,218 @@
+"""
+请求限频模块
+
+墨问开放API的限频规则为：每个用户/每个API/每秒钟内请求 1 次，超出频率的请求会被拦截。
+这里为每个API端点维护一个令牌桶，超出频率的调用在本地按到达顺序排队等待，
+而不是发出请求后收到 RATELIMIT 错误。
+
+同一个API密钥经常同时被多个进程使用（Cursor、Claude Desktop、脚本各自启动一个服务器进程，
+或者HTTP传输的多个worker），进程内的令牌桶互相看不到对方的请求。SharedEndpointRateLimiter
+把每个端点的发送时间表保存在本地SQLite中，同一台机器上使用同一个密钥的所有进程按预约顺序分配时隙。
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from .storage import connect, transaction
+
+logger = logging.getLogger("mowen-mcp-server")
+
+
+class TokenBucket:
+    """
+    异步令牌桶
+
+    - rate: 每秒补充的令牌数
+    - capacity: 桶容量（允许的突发请求数）
+
+    等待方通过 asyncio.Lock 排队，asyncio.Lock 按等待顺序唤醒，因此先到先得。
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        if rate <= 0:
+            raise ValueError("rate必须大于0")
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> float:
+        """获取一个令牌，返回排队等待的秒数"""
+        if self._lock is None:
+            # 延迟创建，确保锁属于当前运行的事件循环
+            self._lock = asyncio.Lock()
+        waited = 0.0
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                waited = (1 - self._tokens) / self.rate
+                await asyncio.sleep(waited)
+                self._refill()
+            self._tokens -= 1
+        return waited
+
+    def penalize(self) -> None:
+        """服务端仍然返回限频时清空令牌，后续请求至少等待一个完整间隔"""
+        self._refill()
+        self._tokens = min(self._tokens, 0.0)
+
+
+class EndpointRateLimiter:
+    """按API端点（如 note/create、note/edit）分别限频"""
+
+    def __init__(self, interval: float = 1.0, burst: int = 1, overrides: Optional[Dict[str, float]] = None):
+        """
+        参数:
+        - interval: 同一端点两次请求之间的最小间隔（秒）
+        - burst: 允许的突发请求数
+        - overrides: 特定端点的间隔覆盖，例如 {"note/edit": 2.0}
+        """
+        self.interval = interval
+        self.burst = burst
+        self.overrides = overrides or {}
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def bucket(self, endpoint: str) -> TokenBucket:
+        """获取（或创建）端点对应的令牌桶"""
+        bucket = self._buckets.get(endpoint)
+        if bucket is None:
+            interval = self.overrides.get(endpoint, self.interval)
+            bucket = TokenBucket(rate=1.0 / interval, capacity=self.burst)
+            self._buckets[endpoint] = bucket
+        return bucket
+
+    async def acquire(self, endpoint: str) -> None:
+        """等待端点的发送时隙"""
+        waited = await self.bucket(endpoint).acquire()
+        if waited > 0:
+            logger.info(f"⏳ 限频排队 - {endpoint} 等待 {waited:.2f}s")
+
+    def penalize(self, endpoint: str) -> None:
+        """记录一次服务端限频响应"""
+        self.bucket(endpoint).penalize()
+
+    def close(self) -> None:
+        """释放限频器占用的资源（进程内限频没有需要释放的资源）"""
+
+
+class SharedEndpointRateLimiter(EndpointRateLimiter):
+    """
+    多进程共用的按端点限频（GCRA 算法，状态保存在SQLite中）
+
+    每个 (账户, 端点) 只保存一个“理论到达时间”（tat）：预约时在一个写事务中取出
+    max(当前时间, tat - 突发容差) 作为自己的发送时隙，并把 tat 推后一个间隔。
+    预约是原子的，各进程不需要轮询，只需睡到自己的时隙；被取消的预约会空出一个时隙，不会超频。
+    时间使用系统时钟（time.time），各进程之间可比较。
+
+    预约在线程池中执行，等待写锁时不阻塞事件循环；等待超过 busy_timeout 秒（其他进程长时间
+    持有写锁）或数据库不可用时，这次请求退回进程内限频。
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        account: str,
+        interval: float = 1.0,
+        burst: int = 1,
+        overrides: Optional[Dict[str, float]] = None,
+        busy_timeout: float = 1.0,
+    ):
+        """
+        参数:
+        - path: SQLite数据库文件路径
+        - account: 账户标识，同一账户的进程共用时间表
+        - interval/burst/overrides: 同 EndpointRateLimiter
+        - busy_timeout: 等待其他进程释放写锁的最长时间（秒）
+        """
+        super().__init__(interval, burst, overrides)
+        self.account = account
+        # 同一个连接不能同时开始两个事务，线程池中的预约按顺序使用连接
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = connect(path, timeout=busy_timeout)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rate_schedule (
+                account TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                tat REAL NOT NULL,
+                PRIMARY KEY (account, endpoint)
+            )
+            """
+        )
+
+    def _tat(self, endpoint: str) -> Optional[float]:
+        row = self._conn.execute(
+            "SELECT tat FROM rate_schedule WHERE account=? AND endpoint=?", (self.account, endpoint)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def _set_tat(self, endpoint: str, tat: float) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO rate_schedule VALUES (?, ?, ?)", (self.account, endpoint, tat)
+        )
+
+    def reserve(self, endpoint: str) -> float:
+        """预约端点的下一个发送时隙，返回需要等待的秒数（阻塞调用，应放到线程池中执行）"""
+        interval = self.overrides.get(endpoint, self.interval)
+        tolerance = (max(self.burst, 1) - 1) * interval
+        with self._lock:
+            if self._conn is None:
+                raise sqlite3.ProgrammingError("限频器已关闭")
+            return self._reserve(endpoint, interval, tolerance)
+
+    def _reserve(self, endpoint: str, interval: float, tolerance: float) -> float:
+        with transaction(self._conn):
+            now = time.time()
+            tat = self._tat(endpoint)
+            tat = now if tat is None else tat
+            slot = max(now, tat - tolerance)
+            self._set_tat(endpoint, max(tat, now) + interval)
+        return slot - now
+
+    async def acquire(self, endpoint: str) -> None:
+        """等待端点的发送时隙（与其他进程共同排队）"""
+        loop = asyncio.get_running_loop()
+        try:
+            waited = await loop.run_in_executor(None, self.reserve, endpoint)
+        except sqlite3.Error as e:
+            # 数据库暂时不可用时退回进程内限频
+            logger.warning(f"⚠️ 跨进程限频不可用，使用进程内限频: {e}")
+            await super().acquire(endpoint)
+            return
+        if waited > 0:
+            logger.info(f"⏳ 限频排队 - {endpoint} 等待 {waited:.2f}s")
+            await asyncio.sleep(waited)
+
+    def penalize(self, endpoint: str) -> None:
+        """记录一次服务端限频响应：所有进程之后的请求至少等待一个完整间隔"""
+        interval = self.overrides.get(endpoint, self.interval)
+        # 预约时会减去突发容差，这里一并加上，否则允许突发时下一次请求不用等待
+        tolerance = (max(self.burst, 1) - 1) * interval
+        try:
+            with self._lock:
+                if self._conn is None:
+                    raise sqlite3.ProgrammingError("限频器已关闭")
+                with transaction(self._conn):
+                    now = time.time()
+                    self._set_tat(endpoint, max(self._tat(endpoint) or now, now + interval + tolerance))
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ 跨进程限频状态写入失败: {e}")
+            super().penalize(endpoint)
+
+    def close(self) -> None:
+        """关闭数据库连接，之后的请求只在进程内限频"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,181 @@
+"""
+请求重试模块
+
+对 429/5xx 以及网络传输错误进行指数退避重试（带随机抖动），并通过全局重试预算
+限制重试的总量，避免在服务端故障时重试放大负载。
+
+重试安全性规则：
+- 请求确定没有被服务端处理（连接失败、429限频拦截）时，任何端点都可以重试
+- 请求可能已被服务端处理（读超时、连接中断、5xx）时，只有幂等端点才会重试，
+  例如 note/edit 是整篇替换，重复执行结果相同；note/create 重复执行会多建一篇笔记
+"""
+
+import asyncio
+import logging
+import random
+from dataclasses import dataclass, field, replace
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Optional, TypeVar
+
+import httpx
+
+from .errors import MowenAPIError
+
+logger = logging.getLogger("mowen-mcp-server")
+
+T = TypeVar("T")
+
+# 请求尚未发出就失败的传输错误，重试不会造成重复写入
+_NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def request_rejected(exc: BaseException) -> bool:
+    """请求确定没有被服务端执行：服务端返回了4xx错误，或者请求根本没有发出"""
+    if isinstance(exc, MowenAPIError):
+        return exc.status_code < 500
+    return isinstance(exc, _NOT_SENT_ERRORS)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """单个端点的重试策略"""
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    # 端点是否幂等（或者调用方有幂等保护），决定“可能已被处理”的失败能否重试
+    idempotent: bool = True
+    retry_statuses: FrozenSet[int] = field(default_factory=lambda: frozenset({429, 500, 502, 503, 504}))
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次失败后的等待时间（指数退避 + 全抖动）"""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+    def should_retry(self, exc: BaseException) -> bool:
+        """判断异常是否可以安全重试"""
+        if isinstance(exc, MowenAPIError):
+            if exc.status_code not in self.retry_statuses:
+                return False
+            # 429 表示请求在处理前就被限频拦截
+            return exc.status_code == 429 or self.idempotent
+        if isinstance(exc, _NOT_SENT_ERRORS):
+            return True
+        if isinstance(exc, httpx.TransportError):
+            return self.idempotent
+        return False
+
+
+# 各端点的默认策略
+DEFAULT_POLICIES: Dict[str, RetryPolicy] = {
+    "note/create": RetryPolicy(idempotent=False),
+    "note/edit": RetryPolicy(),
+    "note/set": RetryPolicy(),
+    "upload/prepare": RetryPolicy(),
+    "upload/url": RetryPolicy(idempotent=False),
+    "auth/key/reset": RetryPolicy(idempotent=False),
+    # 向上传端点投递表单，同一授权信息重复投递会覆盖同一个对象
+    "upload/post": RetryPolicy(),
+}
+
+
+class RetryBudget:
+    """
+    全局重试预算（令牌桶）
+
+    每次成功请求存入 ratio 个令牌，每次重试消耗 1 个令牌，令牌不足时放弃重试。
+    这样重试流量最多约为正常流量的 ratio 倍，服务端大面积故障时不会被重试放大。
+    """
+
+    def __init__(self, ratio: float = 0.1, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+
+    @property
+    def tokens(self) -> float:
+        return self._tokens
+
+    def record_success(self) -> None:
+        self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+class RetryController:
+    """按端点执行重试策略"""
+
+    def __init__(
+        self,
+        policies: Optional[Dict[str, RetryPolicy]] = None,
+        default: Optional[RetryPolicy] = None,
+        budget: Optional[RetryBudget] = None,
+    ):
+        self.policies: Dict[str, RetryPolicy] = dict(DEFAULT_POLICIES)
+        if policies:
+            self.policies.update(policies)
+        self.default = default or RetryPolicy()
+        self.budget = budget or RetryBudget()
+
+    @classmethod
+    def from_config(cls, config: Any) -> "RetryController":
+        """根据 Config 创建：先应用全局退避参数，再应用 MOWEN_RETRY_POLICIES 中的端点覆盖"""
+        common = {
+            "max_attempts": config.retry_max_attempts,
+            "base_delay": config.retry_base_delay,
+            "max_delay": config.retry_max_delay,
+        }
+        controller = cls(
+            default=RetryPolicy(**common),
+            budget=RetryBudget(config.retry_budget_ratio, config.retry_budget_max),
+        )
+        for endpoint in list(controller.policies):
+            controller.set_policy(endpoint, **common)
+        for endpoint, changes in config.retry_policies.items():
+            try:
+                controller.set_policy(endpoint, **changes)
+            except TypeError as e:
+                logger.warning(f"⚠️ 忽略无效的重试策略配置 {endpoint}: {e}")
+        return controller
+
+    def policy(self, endpoint: str) -> RetryPolicy:
+        return self.policies.get(endpoint, self.default)
+
+    def set_policy(self, endpoint: str, **changes: Any) -> RetryPolicy:
+        """修改某个端点的策略，例如 set_policy("note/edit", max_attempts=5)"""
+        policy = replace(self.policy(endpoint), **changes)
+        self.policies[endpoint] = policy
+        return policy
+
+    async def run(self, endpoint: str, attempt_fn: Callable[[], Awaitable[T]], operation: str = "API调用") -> T:
+        """
+        执行请求，失败时按策略重试
+
+        参数:
+        - endpoint: 端点名，用于选择策略
+        - attempt_fn: 每次调用发起一次完整请求的协程函数
+        - operation: 操作描述，用于日志记录
+        """
+        policy = self.policy(endpoint)
+        attempt = 1
+        while True:
+            try:
+                result = await attempt_fn()
+            except Exception as exc:
+                if attempt >= policy.max_attempts or not policy.should_retry(exc):
+                    raise
+                if not self.budget.try_spend():
+                    logger.warning(f"🚧 {operation} - 重试预算已耗尽，放弃重试: {exc}")
+                    raise
+                delay = policy.backoff(attempt)
+                logger.warning(
+                    f"🔁 {operation} - 第{attempt}次请求失败，{delay:.2f}s后重试"
+                    f"（{type(exc).__name__}: {exc}）"
+                )
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.budget.record_success()
+            return result
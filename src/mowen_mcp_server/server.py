@@ -6,6 +6,9 @@
 2. 编辑笔记（统一富文本格式）
 3. 设置笔记权限
 4. 重置API密钥
+5. 查询每日配额
+6. 查询后台任务进度
+7. 追加、插入、替换段落（基于笔记的本地副本，无需重新发送整篇笔记）
 
 所有笔记操作均使用统一的富文本格式，支持：
 - 普通段落：文本内容和富文本格式（加粗、高亮、链接）
@@ -13,50 +16,250 @@
 - 内链笔记：用于引用其他笔记，创建笔记间的关联
 """
 
+import argparse
 import asyncio
-import json
+import hashlib
 import logging
 import os
 import mimetypes
-import aiofiles
+import sqlite3
+import time
+from contextlib import asynccontextmanager, contextmanager
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Literal
-from urllib.parse import urljoin
-import nest_asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Literal, Tuple, Union
+from urllib.parse import urlsplit
 
 import httpx
 from mcp.server.fastmcp import FastMCP
+from mcp.server.lowlevel.server import request_ctx
 from pydantic import BaseModel, Field
 
-# 允许嵌套事件循环
-nest_asyncio.apply()
+from .cache import VALIDATOR_HEADERS, UploadCache, UrlUploadCache, hash_file
+from .codec import get_codec
+from .coalesce import EditCoalescer
+from .config import TRANSPORTS, Config
+from .errors import MowenAPIError
+from .jobs import FILE_DONE, FILE_FAILED, FILE_UPLOADING, JOB_DEFERRED, JOB_FAILED, JOB_SUCCEEDED, Job, JobManager
+from .logutil import LazyJSON, log_event, redact_headers, resolve_level
+from .models import Paragraph, dump_paragraphs
+from .multipart import MultipartFileStream
+from .noteatom import NoteAtomBuilder, NoteAtomError, compile_paragraphs
+from .optimize import optimize_doc
+from .idempotency import IdempotencyStore, derive_key
+from .mirror import NoteMirror, body_digest
+# 路径相关的常量和函数已移到 paths 模块，这里保留导入以兼容从 server 模块导入的代码
+from .paths import (  # noqa: F401
+    FILE_SIZE_LIMITS,
+    SUPPORTED_EXTENSIONS,
+    PathResolver,
+    get_file_type_from_extension,
+    normalize_file_path,
+    validate_file_path,
+)
+from .outbox import (
+    OUTBOX_ENDPOINTS,
+    OUTBOX_FAILED,
+    OUTBOX_PENDING,
+    OUTBOX_SENDING,
+    UNCONFIRMED_CREATE,
+    NoteDeferredError,
+    NoteUnconfirmedError,
+    Outbox,
+    OutboxEntry,
+)
+from .preflight import preflight_file
+from .imageprep import ImagePreprocessor
+from .quota import QuotaExceededError, QuotaTracker
+from .ratelimit import EndpointRateLimiter, SharedEndpointRateLimiter
+from .retry import RetryController, request_rejected
+from .state import LocalState
+from .storage import run_blocking
+from .tenants import TenantPool, api_key_from_headers
 
 # 配置日志
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=resolve_level(os.getenv("MOWEN_LOG_LEVEL", "INFO")))
 logger = logging.getLogger("mowen-mcp-server")
 
 # 创建FastMCP服务器实例
 mcp = FastMCP("墨问笔记MCP服务器")
 
-class MowenAPIError(Exception):
-    """墨问API异常类"""
-    def __init__(self, status_code: int, reason: str = "", message: str = "", response_text: str = ""):
-        self.status_code = status_code
-        self.reason = reason
-        self.message = message
-        self.response_text = response_text
-        super().__init__(f"API调用失败 [{status_code}] {reason}: {message}")
+# 墨问开放API路径前缀，端点名（如 note/create）拼接在其后
+API_PREFIX = "/api/open/api/v1/"
+
+def _elapsed_ms(response: httpx.Response) -> Optional[float]:
+    """响应耗时（毫秒）；未经过网络读取的响应没有耗时信息，返回None"""
+    try:
+        return round(response.elapsed.total_seconds() * 1000, 1)
+    except RuntimeError:
+        return None
+
 
 class MowenAPI:
-    """墨问API客户端类，封装所有API调用"""
+    """墨问API客户端类，封装所有API调用
+    
+    客户端内部持有长连接的HTTP连接池：
+    - 墨问开放API（base_url）共用一个连接池
+    - 每个文件上传端点（按 scheme://host 区分）各自维护一个连接池
     
-    def __init__(self, api_key: str, base_url: str = "https://open.mowen.cn"):
+    连接池在首次请求时按需创建，调用 aclose() 或使用 async with 释放。
+    """
+    
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://open.mowen.cn",
+        config: Optional[Config] = None,
+        state: Optional[LocalState] = None,
+    ):
         self.api_key = api_key
         self.base_url = base_url
+        self.config = config or Config()
         self.headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
         }
+        self._client: Optional[httpx.AsyncClient] = None
+        self._upload_clients: Dict[str, httpx.AsyncClient] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.codec = get_codec(self.config.json_codec)
+        # 账户标识：API密钥的摘要，用于区分本地状态文件，不落盘明文密钥
+        self.account_id = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+        self.rate_limiter: Optional[EndpointRateLimiter] = None
+        if self.config.rate_limit_interval > 0:
+            self.rate_limiter = self._build_rate_limiter()
+        self.retry = RetryController.from_config(self.config)
+        self.quota: Optional[QuotaTracker] = None
+        if self.config.quota_enabled:
+            self.quota = QuotaTracker(
+                path=self.config.state_dir / "cache.sqlite3",
+                limits=self.config.quota_limits,
+                low_priority_reserve=self.config.quota_low_priority_reserve,
+                account=self.account_id,
+                legacy_path=self.config.state_dir / f"quota-{self.account_id}.json",
+            )
+        # 本地状态存储：单租户时由客户端自己打开，多租户模式下所有租户共用一份
+        self._owns_state = state is None
+        self.state = state if state is not None else LocalState.open(self.config, self.codec)
+        self.upload_cache: Optional[UploadCache] = self.state.upload_cache
+        self.url_cache: Optional[UrlUploadCache] = self.state.url_cache
+        self.outbox: Optional[Outbox] = self.state.outbox
+        self.image_preprocessor: Optional[ImagePreprocessor] = self.state.image_preprocessor
+        self.mirror: Optional[NoteMirror] = self.state.mirror
+        self.idempotency: Optional[IdempotencyStore] = self.state.idempotency
+        self.edit_coalescer = EditCoalescer(
+            self.config.edit_coalesce_window, self.config.edit_coalesce_max_wait
+        )
+        # 正在进行的请求数和最近一次请求结束的时间，多租户模式据此判断租户是否空闲
+        self._active = 0
+        self.last_active = time.monotonic()
+    
+    def _build_rate_limiter(self) -> EndpointRateLimiter:
+        """创建限频器：默认与本机使用同一密钥的其他进程共用发送时间表，数据库不可用时只在进程内限频"""
+        if self.config.shared_rate_limit:
+            try:
+                return SharedEndpointRateLimiter(
+                    self.config.state_dir / "cache.sqlite3",
+                    self.account_id,
+                    interval=self.config.rate_limit_interval,
+                    burst=self.config.rate_limit_burst,
+                )
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"⚠️ 跨进程限频初始化失败，只在进程内限频: {e}")
+        return EndpointRateLimiter(
+            interval=self.config.rate_limit_interval,
+            burst=self.config.rate_limit_burst,
+        )
+    
+    async def __aenter__(self) -> "MowenAPI":
+        return self
+    
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+    
+    def _http2_enabled(self) -> bool:
+        """HTTP/2 需要额外安装 h2，未安装时自动回退到 HTTP/1.1"""
+        if not self.config.http2:
+            return False
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("⚠️ 已开启MOWEN_HTTP2但未安装h2，回退到HTTP/1.1（pip install 'httpx[http2]'）")
+            self.config.http2 = False
+            return False
+        return True
+    
+    def _build_client(self, **kwargs) -> httpx.AsyncClient:
+        """按配置创建带连接池的HTTP客户端"""
+        limits = httpx.Limits(
+            max_connections=self.config.max_connections,
+            max_keepalive_connections=self.config.max_keepalive_connections,
+            keepalive_expiry=self.config.keepalive_expiry,
+        )
+        return httpx.AsyncClient(limits=limits, http2=self._http2_enabled(), **kwargs)
+    
+    def _check_loop(self) -> None:
+        """连接池绑定创建时的事件循环，事件循环变化后丢弃旧连接池"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._loop is not None:
+                logger.debug("事件循环已变化，重建HTTP连接池")
+            self._client = None
+            self._upload_clients = {}
+            self._loop = loop
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """获取墨问开放API的共享连接池"""
+        self._check_loop()
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client(
+                base_url=self.base_url,
+                headers=self.headers,
+                timeout=self.config.request_timeout,
+            )
+        return self._client
+    
+    def _get_upload_client(self, endpoint: str) -> httpx.AsyncClient:
+        """获取上传端点所在主机的共享连接池"""
+        self._check_loop()
+        parts = urlsplit(endpoint)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        client = self._upload_clients.get(origin)
+        if client is None or client.is_closed:
+            client = self._build_client(timeout=self.config.upload_timeout)
+            self._upload_clients[origin] = client
+        return client
+    
+    @property
+    def busy(self) -> bool:
+        """是否有正在进行的请求或等待合并发送的编辑"""
+        return self._active > 0 or not self.edit_coalescer.idle
+    
+    @contextmanager
+    def _track_activity(self) -> Iterator[None]:
+        """统计正在进行的请求（包括重试之间的等待）"""
+        self._active += 1
+        try:
+            yield
+        finally:
+            self._active -= 1
+            self.last_active = time.monotonic()
+    
+    async def aclose(self) -> None:
+        """关闭所有连接池、限频和配额的数据库连接；本地状态由客户端自己打开时同时关闭图片预处理进程池"""
+        if self._owns_state:
+            self.state.shutdown()
+        if self.rate_limiter is not None:
+            self.rate_limiter.close()
+        if self.quota is not None:
+            await run_blocking(self.quota.close)
+        clients = list(self._upload_clients.values())
+        if self._client is not None:
+            clients.append(self._client)
+        self._client = None
+        self._upload_clients = {}
+        for client in clients:
+            if not client.is_closed:
+                await client.aclose()
     
     def _handle_response(self, response: httpx.Response, operation: str = "API调用") -> Dict[str, Any]:
         """
@@ -73,23 +276,33 @@ class MowenAPI:
         - Exception: 网络错误等其他异常直接抛出
         """
         status_code = response.status_code
-        response_text = response.text
         
-        # 记录响应基本信息
-        logger.info(f"📥 {operation} - HTTP状态码: {status_code}")
-        logger.debug(f"📥 {operation} - 响应内容: {response_text}")
+        # 记录一条紧凑的请求摘要；响应内容只在DEBUG级别输出
+        log_event(
+            logger, logging.INFO, "📥 api.response",
+            op=operation,
+            status=status_code,
+            elapsed_ms=_elapsed_ms(response),
+            bytes=len(response.content),
+        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📥 %s - 响应内容: %s", operation, response.text)
         
         # 2XX 成功响应
         if 200 <= status_code < 300:
+            # 直接从响应字节解析，成功路径不解码为文本
             try:
-                return response.json()
+                return self.codec.loads(response.content)
             except Exception as e:
                 logger.error(f"❌ {operation} - JSON解析失败: {str(e)}")
-                logger.error(f"📄 原始响应内容: {response_text}")
+                logger.error(f"📄 原始响应内容: {response.text}")
                 raise Exception(f"响应JSON解析失败: {str(e)}")
         
+        # 只有错误响应才需要解码响应文本（用于日志和异常信息）
+        response_text = response.text
+        
         # 解析错误响应的详细信息
-        error_detail = self._parse_error_response(response_text)
+        error_detail = self._parse_error_response(response.content)
         reason = error_detail.get("reason", "UNKNOWN")
         message = error_detail.get("message", "未知错误")
         
@@ -135,17 +348,17 @@ class MowenAPI:
             logger.error(f"📄 响应内容: {response_text}")
             raise MowenAPIError(status_code, "UNKNOWN", f"未知状态码: {status_code}", response_text)
     
-    def _parse_error_response(self, response_text: str) -> Dict[str, Any]:
+    def _parse_error_response(self, response_body: Union[bytes, str]) -> Dict[str, Any]:
         """
         解析错误响应，提取错误详情
         
         参数:
-        - response_text: 响应文本
+        - response_body: 响应内容（字节或文本）
         
         返回: 包含错误信息的字典
         """
         try:
-            error_json = json.loads(response_text)
+            error_json = self.codec.loads(response_body)
             return {
                 "code": error_json.get("code", 0),
                 "reason": error_json.get("reason", "UNKNOWN"),
@@ -161,50 +374,98 @@ class MowenAPI:
                 "metadata": {}
             }
     
-    async def create_note(self, body: Dict[str, Any], settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    async def _post(
+        self,
+        endpoint: str,
+        payload: Dict[str, Any],
+        operation: str,
+        timeout: Optional[float] = None,
+        priority: str = "normal",
+    ) -> Dict[str, Any]:
+        """
+        通过共享连接池向墨问开放API发送POST请求
+        
+        参数:
+        - endpoint: API端点，例如 note/create，同时作为限频和配额统计的键
+        - payload: 请求体
+        - operation: 操作描述，用于日志记录
+        - timeout: 单次请求超时时间（可选，默认使用连接池配置）
+        - priority: 配额优先级（high/normal/low），low在配额紧张时会被提前拒绝
+        """
+        # 请求体只编码一次，重试时直接复用同一份字节
+        kwargs: Dict[str, Any] = {"content": self.codec.dumps(payload)}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        
+        async def attempt() -> Dict[str, Any]:
+            # 每次尝试（包括重试）都重新排队获取限频时隙
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire(endpoint)
+            response = await self._get_client().post(API_PREFIX + endpoint, **kwargs)
+            if response.status_code == 429 and self.rate_limiter is not None:
+                self.rate_limiter.penalize(endpoint)
+            return self._handle_response(response, operation)
+        
+        with self._track_activity():
+            if self.quota is None:
+                return await self.retry.run(endpoint, attempt, operation)
+            
+            # 配额不足时在这里直接抛出QuotaExceededError，不发出请求
+            await run_blocking(self.quota.admit, endpoint, priority)
+            try:
+                result = await self.retry.run(endpoint, attempt, operation)
+            except MowenAPIError as e:
+                await run_blocking(self.quota.release, endpoint)
+                if e.reason == "Quota":
+                    await run_blocking(self.quota.mark_exhausted, endpoint)
+                raise
+            except BaseException:
+                await run_blocking(self.quota.release, endpoint)
+                raise
+            await run_blocking(self.quota.commit, endpoint)
+            return result
+    
+    async def create_note(self, body: Dict[str, Any], settings: Optional[Dict[str, Any]] = None, priority: str = "normal") -> Dict[str, Any]:
         """
         创建笔记
         
         参数:
         - body: 笔记内容（NoteAtom结构）
         - settings: 笔记设置（可选）
+        - priority: 配额优先级（high/normal/low）
         """
-        url = urljoin(self.base_url, "/api/open/api/v1/note/create")
         payload = {"body": body}
         if settings:
             payload["settings"] = settings
         
-        # 记录完整的API调用参数
-        logger.info(f"📤 墨问API创建笔记请求:")
-        logger.info(f"URL: {url}")
-        logger.info(f"Headers: {self.headers}")
-        logger.info(f"Payload: {json.dumps(payload, indent=2, ensure_ascii=False)}")
-            
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=self.headers, json=payload)
-            return self._handle_response(response, "创建笔记")
+        # 完整的请求参数只在DEBUG级别序列化输出，并隐藏API密钥
+        logger.debug(
+            "📤 墨问API创建笔记请求 URL: %s%s Headers: %s Payload: %s",
+            self.base_url, API_PREFIX + "note/create",
+            LazyJSON(redact_headers(self.headers), indent=None), LazyJSON(payload),
+        )
+        
+        return await self._post("note/create", payload, "创建笔记", priority=priority)
     
-    async def edit_note(self, note_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    async def edit_note(self, note_id: str, body: Dict[str, Any], priority: str = "normal") -> Dict[str, Any]:
         """
         编辑笔记
         
         参数:
         - note_id: 笔记ID
         - body: 新的笔记内容（NoteAtom结构）
+        - priority: 配额优先级（high/normal/low）
         """
-        url = urljoin(self.base_url, "/api/open/api/v1/note/edit")
         payload = {
             "noteId": note_id,
             "body": body
         }
         
-        logger.info(f"📤 墨问API编辑笔记请求: {note_id}")
+        logger.debug("📤 墨问API编辑笔记请求: %s", note_id)
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=self.headers, json=payload)
-            return self._handle_response(response, "编辑笔记")
+        return await self._post("note/edit", payload, "编辑笔记", priority=priority)
     
-    async def set_note_privacy(self, note_id: str, privacy_type: str, rule: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    async def set_note_privacy(self, note_id: str, privacy_type: str, rule: Optional[Dict[str, Any]] = None, priority: str = "normal") -> Dict[str, Any]:
         """
         设置笔记隐私
         
@@ -212,8 +473,8 @@ class MowenAPI:
         - note_id: 笔记ID
         - privacy_type: 隐私类型 (public/private/rule)
         - rule: 隐私规则（可选）
+        - priority: 配额优先级（high/normal/low）
         """
-        url = urljoin(self.base_url, "/api/open/api/v1/note/set")
         privacy_settings = {"type": privacy_type}
         if rule:
             privacy_settings["rule"] = rule
@@ -226,69 +487,63 @@ class MowenAPI:
             }
         }
         
-        logger.info(f"📤 墨问API设置笔记隐私请求: {note_id}")
+        logger.debug("📤 墨问API设置笔记隐私请求: %s", note_id)
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=self.headers, json=payload)
-            return self._handle_response(response, "设置笔记隐私")
+        return await self._post("note/set", payload, "设置笔记隐私", priority=priority)
     
     async def reset_api_key(self) -> Dict[str, Any]:
-        """重置API密钥"""
-        url = urljoin(self.base_url, "/api/open/api/v1/auth/key/reset")
-        
-        logger.info(f"📤 墨问API重置密钥请求")
+        """重置API密钥（高优先级，不受低优先级配额预留影响）"""
+        logger.debug("📤 墨问API重置密钥请求")
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=self.headers, json={})
-            return self._handle_response(response, "重置API密钥")
+        return await self._post("auth/key/reset", {}, "重置API密钥", priority="high")
     
-    async def get_upload_auth(self, file_type: int, file_name: str) -> Dict[str, Any]:
+    async def get_upload_auth(self, file_type: int, file_name: str, priority: str = "normal") -> Dict[str, Any]:
         """
         获取上传授权信息
         
         参数:
         - file_type: 文件类型 (1=图片, 2=音频, 3=PDF)
         - file_name: 文件名
+        - priority: 配额优先级（high/normal/low）
         """
-        url = urljoin(self.base_url, "/api/open/api/v1/upload/prepare")
         payload = {
             "fileType": file_type,
             "fileName": file_name
         }
         
-        logger.info(f"📤 墨问API获取上传授权请求: {file_name}")
+        logger.debug("📤 墨问API获取上传授权请求: %s", file_name)
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=self.headers, json=payload)
-            return self._handle_response(response, "获取上传授权")
+        return await self._post("upload/prepare", payload, "获取上传授权", priority=priority)
     
-    async def upload_file_local(self, auth_info: Dict[str, Any], file_path: str) -> Dict[str, Any]:
+    async def upload_file_local(
+        self, auth_info: Dict[str, Any], file_path: str, file_name: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
         本地文件上传
         
         参数:
         - auth_info: 上传授权信息
         - file_path: 本地文件路径
+        - file_name: 表单中的文件名（可选，默认使用路径中的文件名）
         """
         form_info = auth_info["form"]
         endpoint = form_info["endpoint"]
-        form_data = form_info
+        data = {k: v for k, v in form_info.items() if k != "file"}
+        file_name = file_name or Path(file_path).name
         
-        # 读取文件内容
-        async with aiofiles.open(file_path, 'rb') as f:
-            file_content = await f.read()
+        logger.debug("📤 文件上传到端点: %s", endpoint)
         
-        # 构建multipart/form-data
-        files = {"file": (Path(file_path).name, file_content)}
-        data = {k: v for k, v in form_data.items() if k != "file"}
-        
-        logger.info(f"📤 文件上传到端点: {endpoint}")
-        
-        async with httpx.AsyncClient(timeout=300.0) as client:  # 增加超时时间
-            response = await client.post(endpoint, data=data, files=files)
+        async def attempt() -> Dict[str, Any]:
+            # 文件按块从磁盘流式写入请求体，不整体读入内存
+            with MultipartFileStream(data, file_path, file_name) as stream:
+                client = self._get_upload_client(endpoint)
+                response = await client.post(endpoint, content=stream, headers=stream.headers)
             return self._handle_response(response, "本地文件上传")
+        
+        with self._track_activity():
+            return await self.retry.run("upload/post", attempt, "本地文件上传")
     
-    async def upload_file_url(self, file_type: int, url: str, file_name: Optional[str] = None) -> Dict[str, Any]:
+    async def upload_file_url(self, file_type: int, url: str, file_name: Optional[str] = None, priority: str = "normal") -> Dict[str, Any]:
         """
         远程URL文件上传
         
@@ -296,8 +551,8 @@ class MowenAPI:
         - file_type: 文件类型 (1=图片, 2=音频, 3=PDF)
         - url: 文件URL
         - file_name: 文件名（可选）
+        - priority: 配额优先级（high/normal/low）
         """
-        api_url = urljoin(self.base_url, "/api/open/api/v1/upload/url")
         payload = {
             "fileType": file_type,
             "url": url
@@ -305,127 +560,79 @@ class MowenAPI:
         if file_name:
             payload["fileName"] = file_name
         
-        logger.info(f"📤 墨问API远程文件上传请求: {url}")
-            
-        async with httpx.AsyncClient(timeout=300.0) as client:  # 增加超时时间
-            response = await client.post(api_url, headers=self.headers, json=payload)
-            return self._handle_response(response, "远程文件上传")
-
-class NoteAtomBuilder:
-    """NoteAtom结构构建器，帮助构建符合墨问格式的笔记内容"""
-    
-    @staticmethod
-    def create_doc(paragraphs: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """创建文档根节点"""
-        return {
-            "type": "doc",
-            "content": paragraphs
-        }
-    
-    @staticmethod
-    def create_paragraph(texts: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """创建段落节点"""
-        if not texts:
-            return {"type": "paragraph"}
-        return {
-            "type": "paragraph", 
-            "content": texts
-        }
-    
-    @staticmethod
-    def create_quote(texts: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """创建引用节点"""
-        if not texts:
-            return {"type": "quote"}
-        return {
-            "type": "quote",
-            "content": texts
-        }
-    
-    @staticmethod
-    def create_note(note_uuid: str) -> Dict[str, Any]:
-        """创建内链笔记节点"""
-        return {
-            "type": "note",
-            "attrs": {
-                "uuid": note_uuid
-            }
-        }
-    
-    @staticmethod
-    def create_text(text: str, marks: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
-        """创建文本节点"""
-        node = {
-            "type": "text",
-            "text": text
-        }
-        if marks:
-            node["marks"] = marks
-        return node
-    
-    @staticmethod
-    def create_bold_mark() -> Dict[str, Any]:
-        """创建加粗标记"""
-        return {"type": "bold"}
-    
-    @staticmethod  
-    def create_highlight_mark() -> Dict[str, Any]:
-        """创建高亮标记"""
-        return {"type": "highlight"}
-    
-    @staticmethod
-    def create_link_mark(href: str) -> Dict[str, Any]:
-        """创建链接标记"""
-        return {
-            "type": "link",
-            "attrs": {"href": href}
-        }
-    
-    @staticmethod
-    def create_image(file_id: str, alt: str = "", align: str = "center") -> Dict[str, Any]:
-        """创建图片节点"""
-        attrs = {"uuid": file_id}
-        if alt:
-            attrs["alt"] = alt
-        if align:
-            attrs["align"] = align
-        return {
-            "type": "image",
-            "attrs": attrs
-        }
-    
-    @staticmethod  
-    def create_audio(file_id: str, show_note: str = "") -> Dict[str, Any]:
-        """创建音频节点"""
-        attrs = {"audio-uuid": file_id}
-        if show_note:
-            attrs["show-note"] = show_note
-        return {
-            "type": "audio",
-            "attrs": attrs
-        }
-    
-    @staticmethod
-    def create_pdf(file_id: str) -> Dict[str, Any]:
-        """创建PDF节点"""
-        return {
-            "type": "pdf",
-            "attrs": {"uuid": file_id}
-        }
+        logger.debug("📤 墨问API远程文件上传请求: %s", url)
+        
+        # 远程下载可能较慢，使用上传超时时间
+        return await self._post(
+            "upload/url", payload, "远程文件上传",
+            timeout=self.config.upload_timeout, priority=priority,
+        )
+
+    async def fetch_url_validators(self, url: str) -> Optional[Dict[str, str]]:
+        """
+        对远程文件发起HEAD请求，返回用于判断文件是否变化的响应头
+        
+        返回: ETag/Last-Modified/Content-Length 中存在的头；请求失败时返回None
+        """
+        try:
+            client = self._get_upload_client(url)
+            response = await client.head(url, follow_redirects=True, timeout=10.0)
+        except httpx.HTTPError as e:
+            logger.debug("远程文件HEAD请求失败: %s, %s", url, e)
+            return None
+        if response.status_code >= 400:
+            return None
+        return {name: response.headers[name] for name in VALIDATOR_HEADERS if name in response.headers}
 
 # 全局API客户端变量
 mowen_api: Optional[MowenAPI] = None
 
+# 多租户模式下的租户客户端池（由 main 按配置创建）
+tenant_pool: Optional[TenantPool[MowenAPI]] = None
+
+def _request_api_key() -> Optional[str]:
+    """当前MCP请求的HTTP请求头中携带的API密钥（stdio传输或不在请求处理中时返回None）"""
+    try:
+        request = getattr(request_ctx.get(), "request", None)
+    except LookupError:
+        return None
+    headers = getattr(request, "headers", None)
+    return api_key_from_headers(headers) if headers is not None else None
+
 def get_mowen_api() -> MowenAPI:
-    """获取或初始化MowenAPI实例"""
+    """获取或初始化MowenAPI实例（多租户模式下返回当前请求的API密钥对应的客户端）"""
     global mowen_api
+    if tenant_pool is not None:
+        api_key = _request_api_key()
+        if api_key is None:
+            raise RuntimeError(
+                "多租户模式下请求未携带墨问API密钥。请在请求头中设置 Authorization: Bearer <API密钥> 或 X-Mowen-Api-Key。"
+            )
+        return tenant_pool.get(api_key)
     if mowen_api is None:
-        api_key = os.getenv("MOWEN_API_KEY")
-        if not api_key:
+        config = Config()
+        if not config.validate():
             raise RuntimeError("未设置API密钥。请先设置MOWEN_API_KEY环境变量。")
-        mowen_api = MowenAPI(api_key)
+        mowen_api = MowenAPI(config.api_key, config.base_url, config)
     return mowen_api
 
+def active_api_clients() -> List[MowenAPI]:
+    """当前进程中的所有API客户端（单租户时只有一个）"""
+    clients = tenant_pool.clients() if tenant_pool is not None else []
+    if mowen_api is not None:
+        clients.append(mowen_api)
+    return clients
+
+# 全局后台任务管理器
+job_manager: Optional[JobManager] = None
+
+def get_job_manager(config: Config) -> JobManager:
+    """获取或初始化后台任务管理器"""
+    global job_manager
+    if job_manager is None:
+        job_manager = JobManager(workers=config.job_workers, max_retained=config.job_max_retained)
+    return job_manager
+
 # 文件类型映射
 FILE_TYPE_MAP = {
     "image": 1,
@@ -433,230 +640,157 @@ FILE_TYPE_MAP = {
     "pdf": 3
 }
 
-# 支持的文件扩展名
-SUPPORTED_EXTENSIONS = {
-    "image": {".gif", ".jpeg", ".jpg", ".png", ".webp"},
-    "audio": {".mp3", ".mp4", ".m4a"},
-    "pdf": {".pdf"}
-}
-
-# 文件大小限制 (字节)
-FILE_SIZE_LIMITS = {
-    "image": 50 * 1024 * 1024,  # 50MB
-    "audio": 200 * 1024 * 1024,  # 200MB
-    "pdf": 100 * 1024 * 1024   # 100MB
-}
-
-def get_file_type_from_extension(file_path: str) -> Optional[str]:
-    """根据文件扩展名判断文件类型"""
-    ext = Path(file_path).suffix.lower()
-    
-    for file_type, extensions in SUPPORTED_EXTENSIONS.items():
-        if ext in extensions:
-            return file_type
-    return None
-
-def normalize_file_path(file_path: str) -> str:
+async def _upload_local_file(
+    api_client: MowenAPI,
+    file_path: str,
+    file_type_code: int,
+    upload_slots: Optional[asyncio.Semaphore] = None,
+    file_size: int = 0,
+    priority: str = "normal",
+    upload_memo: Optional[Dict[Tuple[str, str, str], "asyncio.Future[str]"]] = None,
+) -> str:
     """
-    标准化文件路径，处理不同操作系统和客户端传入的路径格式
-    
-    主要处理：
-    1. 正斜杠和反斜杠的统一
-    2. 路径分隔符的标准化
-    3. 相对路径转绝对路径
-    4. 客户端路径前缀异常修复（如多余的@符号）
-    
-    参数:
-    - file_path: 原始文件路径
-    
-    返回: 标准化后的文件路径
+    上传本地文件并返回fileId
+    
+    先在线程池中预检文件（文件头格式与扩展名不符时直接报错），同一次读取中计算内容哈希；
+    同一批段落中路径不同但内容相同的文件按内容哈希只上传一次（upload_memo）；
+    再按内容哈希查询上传缓存，命中时直接复用之前的fileId，不发出任何网络请求。
+    开启图片预处理时，较大的图片先在进程池中缩小并重新编码，上传处理后的文件。
+    获取上传授权不占用上传并发名额，因此多个文件的授权请求可以提前排队，
+    文件投递阶段才受 upload_slots 限制。
     """
-    if not file_path:
-        return file_path
-    
-    try:
-        # 记录原始路径
-        logger.info(f"🔧 路径标准化 - 原始路径: {repr(file_path)}")
-        
-        # 预处理：检查并修复客户端路径异常
-        cleaned_path = _clean_client_path_anomalies(file_path)
-        if cleaned_path != file_path:
-            logger.info(f"🔧 路径标准化 - 客户端异常修复: {repr(file_path)} -> {repr(cleaned_path)}")
-        
-        # 使用pathlib自动处理路径分隔符
-        # pathlib会自动将正斜杠转换为当前系统的路径分隔符
-        path = Path(cleaned_path)
-        
-        # 如果是相对路径，转换为绝对路径
-        if not path.is_absolute():
-            path = path.resolve()
-            logger.info(f"🔧 路径标准化 - 相对路径转绝对路径: {path}")
+    file_name = Path(file_path).name
+    preprocessor = api_client.image_preprocessor
+    if file_type_code != FILE_TYPE_MAP["image"] or (
+        preprocessor is not None and not preprocessor.should_process(file_path, file_size)
+    ):
+        preprocessor = None
+    need_hash = api_client.upload_cache is not None or preprocessor is not None or upload_memo is not None
+    content_hash = None
+    # 预检和哈希计算是阻塞的磁盘IO，放到线程池中执行
+    loop = asyncio.get_running_loop()
+    if api_client.config.upload_preflight:
+        preflight = await loop.run_in_executor(None, preflight_file, file_path, need_hash)
+        content_hash = preflight.content_hash
+    elif need_hash:
+        content_hash = await loop.run_in_executor(None, hash_file, file_path)
+    
+    # 预处理参数不同，上传的内容也不同，缓存键带上参数摘要
+    cache_key = content_hash
+    if preprocessor is not None:
+        cache_key = f"{content_hash}:{preprocessor.options.key}"
+    
+    async def upload() -> str:
+        if api_client.upload_cache is not None:
+            cached_file_id = await run_blocking(
+                api_client.upload_cache.get, api_client.account_id, cache_key, file_type_code
+            )
+            if cached_file_id:
+                logger.info(f"♻️ 命中上传缓存: {file_name} -> {cached_file_id}")
+                return cached_file_id
+    
+        upload_path, upload_name = file_path, file_name
+        if preprocessor is not None:
+            prepared = await preprocessor.prepare(file_path, content_hash, file_size)
+            if prepared is not None:
+                upload_path = str(prepared)
+                upload_name = Path(file_name).stem + prepared.suffix
+    
+        # 获取上传授权
+        auth_result = await api_client.get_upload_auth(file_type_code, upload_name, priority=priority)
+    
+        # 执行文件上传（使用标准化路径）
+        if upload_slots is None:
+            upload_result = await api_client.upload_file_local(auth_result, upload_path, upload_name)
         else:
-            # 即使是绝对路径，也进行resolve()来标准化
-            path = path.resolve()
-        
-        normalized_path = str(path)
-        logger.info(f"🔧 路径标准化 - 最终路径: {repr(normalized_path)}")
-        
-        return normalized_path
-        
-    except Exception as e:
-        logger.warning(f"⚠️ 路径标准化失败: {file_path}, 错误: {str(e)}")
-        # 如果标准化失败，返回原始路径
-        return file_path
+            async with upload_slots:
+                upload_result = await api_client.upload_file_local(auth_result, upload_path, upload_name)
+        file_id = upload_result["file"]["fileId"]
+        logger.info(f"✅ 文件上传成功，获得文件ID: {file_id}")
+    
+        if api_client.upload_cache is not None:
+            await run_blocking(api_client.upload_cache.put, api_client.account_id, cache_key, file_type_code, file_id)
+        return file_id
+    
+    if upload_memo is None or content_hash is None:
+        return await upload()
+    return await _upload_once(upload_memo, ("hash", cache_key, str(file_type_code)), upload, label=file_name)
 
-def _clean_client_path_anomalies(file_path: str) -> str:
-    """
-    清理客户端传入路径的异常情况
-    
-    处理已知的客户端路径问题：
-    1. 文件名前多余的@符号
-    2. 其他可能的前缀异常
-    
-    参数:
-    - file_path: 原始文件路径
-    
-    返回: 清理后的文件路径
-    """
-    if not file_path:
-        return file_path
-    
-    original_path = file_path
-    
-    # 检查文件名前是否有多余的@符号
-    # 例如: "D:\\@note.png" -> "D:\\note.png"
-    if '@' in file_path:
-        # 分离路径和文件名
-        path_obj = Path(file_path)
-        parent_dir = path_obj.parent
-        filename = path_obj.name
-        
-        # 如果文件名以@开头，尝试移除@
-        if filename.startswith('@'):
-            cleaned_filename = filename[1:]  # 移除第一个@字符
-            cleaned_path = str(parent_dir / cleaned_filename)
-            
-            logger.info(f"🔧 检测到文件名前缀@符号: {repr(filename)} -> {repr(cleaned_filename)}")
-            return cleaned_path
-    
-    # 可以在这里添加其他客户端异常的处理逻辑
-    # 例如：处理其他特殊前缀字符
-    
-    return original_path
-
-def validate_file_path(file_path: str) -> tuple[bool, str]:
+async def _upload_remote_file(
+    api_client: MowenAPI,
+    url: str,
+    file_type_code: int,
+    file_name: Optional[str],
+    priority: str = "normal",
+) -> str:
     """
-    验证文件路径的安全性和有效性
-    
-    自动处理路径格式兼容性：
-    - 支持正斜杠和反斜杠混用
-    - 自动标准化路径分隔符
-    - 兼容不同客户端的路径格式
-    - 自动修复客户端路径异常（如@前缀）
+    通过URL上传远程文件并返回fileId
     
-    返回: (是否有效, 错误信息)
+    先查询URL上传缓存；开启校验时，距上次校验超过一定时间的条目会先发HEAD请求，
+    远程文件的ETag/Last-Modified/Content-Length未变化才复用缓存。
     """
-    try:
-        # 首先标准化路径
-        normalized_path = normalize_file_path(file_path)
-        path = Path(normalized_path)
-        
-        logger.info(f"🔍 文件路径验证 - 标准化路径: {normalized_path}")
-        
-        # 检查文件是否存在
-        if not path.exists():
-            # 如果标准化后的路径仍然不存在，尝试额外的修复策略
-            alternative_path = _try_alternative_path_fixes(file_path)
-            if alternative_path and alternative_path != normalized_path:
-                alt_path_obj = Path(alternative_path)
-                if alt_path_obj.exists():
-                    logger.info(f"🔧 使用替代路径修复成功: {alternative_path}")
-                    path = alt_path_obj
-                    normalized_path = alternative_path
-                else:
-                    # 提供详细的错误信息，包括尝试的所有路径
-                    error_msg = f"文件不存在：{file_path}"
-                    if normalized_path != file_path:
-                        error_msg += f"\n标准化后路径：{normalized_path}"
-                    if alternative_path != normalized_path:
-                        error_msg += f"\n尝试的替代路径：{alternative_path}"
-                    error_msg += f"\n💡 请检查：\n  1. 文件路径是否正确\n  2. 文件是否确实存在\n  3. 路径中是否包含特殊字符或异常前缀"
-                    return False, error_msg
-            else:
-                # 提供详细的错误信息
-                error_msg = f"文件不存在：{file_path}"
-                if normalized_path != file_path:
-                    error_msg += f"\n标准化后路径：{normalized_path}"
-                error_msg += f"\n💡 请检查：\n  1. 文件路径是否正确\n  2. 文件是否确实存在\n  3. 路径中是否包含特殊字符或异常前缀"
-                return False, error_msg
-        
-        # 检查是否为文件
-        if not path.is_file():
-            return False, f"路径不是文件：{normalized_path}"
-        
-        # 检查文件类型
-        file_type = get_file_type_from_extension(str(path))
-        if not file_type:
-            supported = ", ".join([f"{ft}({', '.join(exts)})" for ft, exts in SUPPORTED_EXTENSIONS.items()])
-            return False, f"不支持的文件类型。支持的类型：{supported}"
-        
-        # 检查文件大小
-        file_size = path.stat().st_size
-        size_limit = FILE_SIZE_LIMITS[file_type]
-        if file_size > size_limit:
-            size_mb = size_limit // (1024 * 1024)
-            return False, f"文件过大。{file_type}类型文件最大支持{size_mb}MB"
-        
-        logger.info(f"✅ 文件路径验证通过: {normalized_path}")
-        return True, ""
-        
-    except Exception as e:
-        error_msg = f"文件路径验证失败：{str(e)}"
-        if file_path != normalize_file_path(file_path):
-            error_msg += f"\n原始路径：{file_path}\n标准化路径：{normalize_file_path(file_path)}"
-        return False, error_msg
+    cache = api_client.url_cache
+    config = api_client.config
+    account = api_client.account_id
+    validators: Optional[Dict[str, str]] = None
+    if cache is not None:
+        entry = await run_blocking(cache.get, account, url, file_type_code)
+        if entry is not None:
+            if not config.url_cache_revalidate or time.time() - entry.validated_at < config.url_cache_revalidate_after:
+                logger.info(f"♻️ 命中URL上传缓存: {url} -> {entry.file_id}")
+                return entry.file_id
+            validators = await api_client.fetch_url_validators(url)
+            if validators is None or entry.matches(validators):
+                # 远程文件未变化（或无法校验），继续使用缓存
+                await run_blocking(cache.mark_validated, account, url, file_type_code)
+                logger.info(f"♻️ 命中URL上传缓存（已校验）: {url} -> {entry.file_id}")
+                return entry.file_id
+            logger.info(f"🔄 远程文件已变化，重新上传: {url}")
+            await run_blocking(cache.invalidate, account, url, file_type_code)
+        elif config.url_cache_revalidate:
+            validators = await api_client.fetch_url_validators(url)
+    
+    upload_result = await api_client.upload_file_url(file_type_code, url, file_name, priority=priority)
+    file_id = upload_result["file"]["fileId"]
+    if cache is not None:
+        await run_blocking(cache.put, account, url, file_type_code, file_id, validators)
+    return file_id
 
-def _try_alternative_path_fixes(file_path: str) -> Optional[str]:
-    """
-    尝试额外的路径修复策略
-    
-    当标准化路径仍然无效时，尝试其他可能的修复方法：
-    1. 直接移除文件名前的@符号（不通过标准化）
-    2. 其他可能的客户端异常修复
-    
-    参数:
-    - file_path: 原始文件路径
-    
-    返回: 修复后的路径，如果无法修复则返回None
-    """
-    if not file_path:
-        return None
-    
-    # 策略1：直接检查原始路径中的@符号问题
-    if '@' in file_path:
-        # 尝试移除文件名中的@符号
-        path_obj = Path(file_path)
-        parent_dir = path_obj.parent
-        filename = path_obj.name
-        
-        if filename.startswith('@'):
-            # 移除@前缀
-            cleaned_filename = filename[1:]
-            alternative_path = str(parent_dir / cleaned_filename)
-            logger.info(f"🔧 尝试替代路径修复 - 移除@前缀: {repr(file_path)} -> {repr(alternative_path)}")
-            return alternative_path
-    
-    # 可以在这里添加其他修复策略
-    # 例如：处理其他已知的客户端异常模式
-    
-    return None
+async def _upload_once(
+    upload_memo: Optional[Dict[Tuple[str, str, str], "asyncio.Future[str]"]],
+    key: Tuple[str, str, str],
+    upload: Callable[[], Awaitable[str]],
+    label: Optional[str] = None,
+) -> str:
+    """同一批段落中相同的文件只上传一次，重复出现时等待并复用第一次的上传结果（label 用于日志，默认为键中的路径）"""
+    if upload_memo is None:
+        return await upload()
+    future = upload_memo.get(key)
+    if future is None:
+        future = asyncio.ensure_future(upload())
+        upload_memo[key] = future
+    else:
+        logger.info(f"♻️ 段落中重复的文件，复用上传结果: {label or key[1]}")
+    return await future
 
-async def process_file_upload(file_info: Dict[str, Any]) -> Dict[str, Any]:
+async def process_file_upload(
+    api_client: MowenAPI,
+    file_info: Dict[str, Any],
+    upload_memo: Optional[Dict[Tuple[str, str, str], "asyncio.Future[str]"]] = None,
+    upload_slots: Optional[asyncio.Semaphore] = None,
+    path_resolver: Optional[PathResolver] = None,
+    priority: str = "normal",
+) -> Dict[str, Any]:
     """
     处理文件上传
     
     参数:
+    - api_client: 墨问API客户端（多租户模式下为当前请求的租户）
     - file_info: 文件信息字典
+    - upload_memo: 同一批段落共享的上传去重表（可选）
+    - upload_slots: 限制文件投递并发数的信号量（可选）
+    - path_resolver: 同一批段落共享的本地路径解析器（可选）
+    - priority: 上传请求的配额优先级（high/normal/low）
     
     返回: 上传后的文件节点
     """
@@ -665,46 +799,35 @@ async def process_file_upload(file_info: Dict[str, Any]) -> Dict[str, Any]:
     source_path = file_info["source_path"]
     metadata = file_info.get("metadata", {})
     
-    logger.info(f"🔄 开始处理文件上传: {file_type}, {source_type}, {source_path}")
-    
-    # 预先检查API密钥
-    try:
-        get_mowen_api()  # 这会抛出异常如果API密钥未设置
-    except RuntimeError as e:
-        raise ValueError(f"API配置错误：{str(e)}。请设置MOWEN_API_KEY环境变量后重试。")
+    logger.debug("🔄 开始处理文件上传: %s, %s, %s", file_type, source_type, source_path)
     
     try:
         if source_type == "local":
-            # 本地文件上传
-            is_valid, error_msg = validate_file_path(source_path)
-            if not is_valid:
-                raise ValueError(error_msg)
+            # 本地文件上传：在线程池中一次完成路径标准化和验证
+            resolved = await (path_resolver or PathResolver()).resolve(source_path)
             
             # 使用标准化后的路径进行文件操作
-            normalized_path = normalize_file_path(source_path)
-            file_path = Path(normalized_path)
-            file_name = file_path.name
+            normalized_path = resolved.path
             file_type_code = FILE_TYPE_MAP[file_type]
             
-            logger.info(f"📁 使用标准化路径进行文件上传: {normalized_path}")
-            
-            # 获取上传授权
-            api_client = get_mowen_api()
-            auth_result = await api_client.get_upload_auth(file_type_code, file_name)
+            logger.debug("📁 使用标准化路径进行文件上传: %s", normalized_path)
             
-            # 执行文件上传（使用标准化路径）
-            upload_result = await api_client.upload_file_local(auth_result, normalized_path)
-            file_id = upload_result["file"]["fileId"]
-            logger.info(f"✅ 文件上传成功，获得文件ID: {file_id}")
+            file_id = await _upload_once(
+                upload_memo, ("local", normalized_path, file_type),
+                lambda: _upload_local_file(
+                    api_client, normalized_path, file_type_code, upload_slots, resolved.size, priority, upload_memo
+                ),
+            )
             
         elif source_type == "url":
             # 远程URL上传
             file_type_code = FILE_TYPE_MAP[file_type]
             file_name = metadata.get("file_name")
             
-            api_client = get_mowen_api()
-            upload_result = await api_client.upload_file_url(file_type_code, source_path, file_name)
-            file_id = upload_result["file"]["fileId"]
+            file_id = await _upload_once(
+                upload_memo, ("url", source_path, file_type),
+                lambda: _upload_remote_file(api_client, source_path, file_type_code, file_name, priority),
+            )
             
         else:
             raise ValueError(f"不支持的上传类型：{source_type}")
@@ -714,7 +837,7 @@ async def process_file_upload(file_info: Dict[str, Any]) -> Dict[str, Any]:
             alt = metadata.get("alt", "")
             align = metadata.get("align", "center")
             image_node = NoteAtomBuilder.create_image(file_id, alt, align)
-            logger.info(f"🖼️ 创建图片节点: {image_node}")
+            logger.debug("🖼️ 创建图片节点: %s", image_node)
             return image_node
         elif file_type == "audio":
             show_note = metadata.get("show_note", "")
@@ -728,198 +851,481 @@ async def process_file_upload(file_info: Dict[str, Any]) -> Dict[str, Any]:
         logger.error(f"文件上传失败: {str(e)}")
         raise
 
-async def process_paragraphs_with_files(paragraphs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+# 文件上传进度回调：(段落下标, 状态, 错误信息)
+FileProgressCallback = Callable[[int, str, Optional[str]], None]
+
+async def process_paragraphs_with_files(
+    api_client: MowenAPI,
+    paragraphs: List[Dict[str, Any]],
+    on_file: Optional[FileProgressCallback] = None,
+    on_uploaded: Optional[Callable[[int, Dict[str, Any]], Awaitable[None]]] = None,
+    priority: str = "normal",
+) -> List[Dict[str, Any]]:
     """
     处理包含文件的段落列表，将文件段落转换为实际的文件节点
     
+    所有文件段落并发处理：受限频约束的 upload/prepare 请求按顺序排队依次发出，
+    拿到授权的文件立即开始投递，投递并发数由 MOWEN_UPLOAD_CONCURRENCY 限制。
+    返回的段落顺序与输入一致。
+    
     参数:
+    - api_client: 墨问API客户端（多租户模式下为当前请求的租户）
     - paragraphs: 段落列表
+    - on_file: 文件上传进度回调（可选）
+    - on_uploaded: 文件上传成功后以 (段落下标, 文件节点) 调用的回调（可选）
+    - priority: 上传请求的配额优先级（high/normal/low）
     
     返回: 处理后的段落列表
     """
-    processed_paragraphs = []
-    logger.info(f"📝 开始处理段落，总数: {len(paragraphs)}")
+    upload_memo: Dict[Tuple[str, str, str], "asyncio.Future[str]"] = {}
+    upload_slots = asyncio.Semaphore(max(1, api_client.config.upload_concurrency))
+    path_resolver = PathResolver()
+    file_indexes = [i for i, paragraph in enumerate(paragraphs) if paragraph.get("type") == "file"]
+    logger.info(f"📝 开始处理段落，总数: {len(paragraphs)}，文件段落: {len(file_indexes)}")
+    if not file_indexes:
+        return list(paragraphs)
+    
+    async def process(i: int, paragraph: Dict[str, Any]) -> Dict[str, Any]:
+        # 文件段落，需要上传文件并转换
+        logger.debug("📁 处理文件段落 %s: %s", i, paragraph)
+        if on_file is not None:
+            on_file(i, FILE_UPLOADING, None)
+        try:
+            file_node = await process_file_upload(
+                api_client, paragraph, upload_memo, upload_slots, path_resolver, priority
+            )
+            logger.debug("✅ 文件段落 %s 处理完成，生成节点: %s", i, file_node)
+            if on_uploaded is not None:
+                await on_uploaded(i, file_node)
+            if on_file is not None:
+                on_file(i, FILE_DONE, None)
+            return file_node
+        except Exception as e:
+            # 文件上传失败，添加错误信息段落
+            logger.error(f"❌ 文件段落 {i} 上传失败: {str(e)}")
+            if on_file is not None:
+                on_file(i, FILE_FAILED, str(e))
+            error_text = f"⚠️ 文件上传失败：{str(e)}"
+            return NoteAtomBuilder.create_paragraph([
+                NoteAtomBuilder.create_text(error_text, [NoteAtomBuilder.create_highlight_mark()])
+            ])
+    
+    # 只为文件段落创建任务，普通段落原样保留
+    file_nodes = await asyncio.gather(*(process(i, paragraphs[i]) for i in file_indexes))
+    processed = list(paragraphs)
+    for i, file_node in zip(file_indexes, file_nodes):
+        processed[i] = file_node
+    return processed
+
+# 段落格式错误时附带的简要格式说明
+PARAGRAPH_FORMAT_HINT = """段落格式：
+- 普通段落：{"texts": [{"text": "文本", "bold": true, "highlight": true, "link": "https://..."}]}
+- 引用段落：{"type": "quote", "texts": [...]}
+- 内链笔记：{"type": "note", "note_id": "笔记ID"}
+- 文件段落：{"type": "file", "file_type": "image|audio|pdf", "source_type": "local|url", "source_path": "路径"}"""
+
+async def finish_note_body(
+    api_client: MowenAPI,
+    compiled: List[Dict[str, Any]],
+    on_file: Optional[FileProgressCallback] = None,
+    on_uploaded: Optional[Callable[[int, Dict[str, Any]], Awaitable[None]]] = None,
+    priority: str = "normal",
+) -> Dict[str, Any]:
+    """
+    上传 compile_paragraphs 结果中的文件段落，再（开启 MOWEN_OPTIMIZE_PAYLOAD 时）压缩请求体
     
-    for i, paragraph in enumerate(paragraphs):
-        if paragraph.get("type") == "file":
-            # 这是一个文件段落，需要上传文件并转换
-            logger.info(f"📁 处理文件段落 {i}: {paragraph}")
-            try:
-                file_node = await process_file_upload(paragraph)
-                processed_paragraphs.append(file_node)
-                logger.info(f"✅ 文件段落 {i} 处理完成，生成节点: {file_node}")
-            except Exception as e:
-                # 文件上传失败，添加错误信息段落
-                logger.error(f"❌ 文件段落 {i} 上传失败: {str(e)}")
-                error_text = f"⚠️ 文件上传失败：{str(e)}"
-                error_paragraph = NoteAtomBuilder.create_paragraph([
-                    NoteAtomBuilder.create_text(error_text, [NoteAtomBuilder.create_highlight_mark()])
-                ])
-                processed_paragraphs.append(error_paragraph)
-        else:
-            # 普通段落，直接添加
-            logger.info(f"📄 处理普通段落 {i}: {paragraph.get('type', 'paragraph')}")
-            processed_paragraphs.append(paragraph)
+    参数:
+    - api_client: 墨问API客户端
+    - compiled: compile_paragraphs 的结果（已经通过校验）
+    - on_file: 文件上传进度回调（可选）
+    - on_uploaded: 文件上传成功回调（可选）
+    - priority: 上传请求的配额优先级（high/normal/low）
     
-    return processed_paragraphs
+    返回: NoteAtom 文档
+    """
+    processed = await process_paragraphs_with_files(api_client, compiled, on_file, on_uploaded, priority)
+    body = NoteAtomBuilder.create_doc(processed)
+    if api_client.config.optimize_payload:
+        body, stats = optimize_doc(
+            body, api_client.codec.dumps, collapse_paragraphs=api_client.config.collapse_empty_paragraphs
+        )
+        if stats.changed:
+            log_event(
+                logger, logging.INFO, "🗜️ note.optimize",
+                merged_texts=stats.merged_texts,
+                dropped_texts=stats.dropped_texts,
+                dropped_paragraphs=stats.dropped_paragraphs,
+                bytes_saved=stats.bytes_saved,
+            )
+    # 最终发送给墨问的数据结构只在DEBUG级别输出
+    logger.debug("🏗️ 最终构建的笔记结构 Body: %s", LazyJSON(body))
+    log_event(logger, logging.INFO, "📊 note.build", input=len(compiled), built=len(body["content"]))
+    return body
 
-def run_async_safely(coro):
-    """安全地运行异步函数"""
+async def complete_outbox_entry(api_client: MowenAPI, entry: OutboxEntry) -> None:
+    """写入成功后删除待发送记录；编辑时同时删除这篇笔记更早的待发送编辑，避免重发时覆盖新内容"""
+    outbox = api_client.outbox
+    await run_blocking(outbox.complete, entry)
+    if entry.kind != "edit_note":
+        return
     try:
-        # 尝试在现有事件循环中运行
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            # 使用 nest_asyncio 允许嵌套
-            return asyncio.run(coro)
+        superseded = await run_blocking(outbox.supersede, api_client.account_id, entry)
+    except sqlite3.Error as e:
+        logger.warning(f"⚠️ 待发送队列写入失败: {e}")
+        return
+    if superseded:
+        logger.info(f"📮 笔记 {entry.note_id} 已写入新内容，丢弃待发送队列中更早的编辑 {superseded} 条")
+
+async def write_note(
+    api_client: MowenAPI,
+    kind: str,
+    compiled: List[Dict[str, Any]],
+    note_id: Optional[str] = None,
+    settings: Optional[Dict[str, Any]] = None,
+    on_file: Optional[FileProgressCallback] = None,
+    entry: Optional[OutboxEntry] = None,
+    priority: str = "normal",
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    上传文件并写入笔记（create_note/edit_note 共用）
+    
+    启用本地待发送队列时，上传前先记录写入意图，每个文件上传成功后记录文件节点，
+    写入成功后删除记录；进程中途退出或网络中断时由 flush_outbox 继续执行。
+    写入成功的文档保存为笔记的本地副本，编辑后的内容与副本完全相同时跳过这次编辑。
+    
+    参数:
+    - api_client: 墨问API客户端
+    - kind: 写入类型（create_note/edit_note）
+    - compiled: compile_paragraphs 的结果（已经通过校验）
+    - note_id: 编辑的笔记ID（edit_note）
+    - settings: 笔记设置（create_note）
+    - on_file: 文件上传进度回调（可选）
+    - entry: 从待发送队列中领取的记录（可选，flush_outbox 使用）
+    - priority: 配额优先级（high/normal/low），后台任务和重发使用 low，配额紧张时把剩余配额留给交互调用；
+      low 写入因配额不足被拒绝时请求没有发出，保留在待发送队列中等待配额恢复
+    
+    返回: (发送的 NoteAtom 文档, 墨问API响应；跳过编辑时为 {"noteId": ..., "unchanged": True})
+    
+    异常:
+    - NoteDeferredError: 发送暂时失败，记录已保留在待发送队列中等待自动重发
+    """
+    outbox = api_client.outbox
+    if outbox is None:
+        return await _send_note(api_client, kind, compiled, note_id, settings, on_file, None, priority)
+    if entry is None:
+        entry = await run_blocking(
+            outbox.add, api_client.account_id, kind, compiled, note_id=note_id, settings=settings
+        )
+    # 处理期间持续续约，flusher 不会在这次调用还在进行时重发同一条记录
+    async with outbox.hold(entry):
+        return await _send_note(api_client, kind, compiled, note_id, settings, on_file, entry, priority)
+
+async def _send_note(
+    api_client: MowenAPI,
+    kind: str,
+    compiled: List[Dict[str, Any]],
+    note_id: Optional[str],
+    settings: Optional[Dict[str, Any]],
+    on_file: Optional[FileProgressCallback],
+    entry: Optional[OutboxEntry],
+    priority: str,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """write_note 的实际处理，entry 为None表示未启用待发送队列"""
+    outbox = api_client.outbox if entry is not None else None
+    on_uploaded = None
+    if outbox is not None:
+        # 之前已经上传过的文件直接使用记录的文件节点
+        compiled = [entry.files.get(i, paragraph) for i, paragraph in enumerate(compiled)]
+        on_uploaded = lambda index, node: run_blocking(outbox.record_file, entry, index, node)
+    
+    body = await finish_note_body(api_client, compiled, on_file, on_uploaded, priority)
+    mirror = api_client.mirror
+    encoded = api_client.codec.dumps(body) if mirror is not None else b""
+    if (
+        kind == "edit_note"
+        and mirror is not None
+        and await run_blocking(mirror.digest, api_client.account_id, note_id) == body_digest(encoded)
+    ):
+        logger.info(f"⏭️ 笔记 {note_id} 的内容与上次发送的完全相同，跳过编辑")
+        if outbox is not None:
+            await complete_outbox_entry(api_client, entry)
+        return body, {"noteId": note_id, "unchanged": True}
+    if outbox is not None and kind == "create_note":
+        # note/create 不能盲目重放：发出之后进程退出时，这条记录不会再被自动发送
+        await run_blocking(outbox.mark_sending, entry)
+    try:
+        if kind == "create_note":
+            result = await api_client.create_note(body, settings, priority=priority)
         else:
-            return loop.run_until_complete(coro)
-    except RuntimeError:
-        # 没有事件循环，创建新的
-        return asyncio.run(coro)
+            result = await api_client.edit_note(note_id, body, priority=priority)
+    except Exception as e:
+        if outbox is not None:
+            # 只保留可以安全重放的失败，否则重发可能重复创建笔记
+            if api_client.retry.policy(OUTBOX_ENDPOINTS[kind]).should_retry(e) or (
+                priority == "low" and isinstance(e, QuotaExceededError)
+            ):
+                delay = await run_blocking(outbox.defer, entry, str(e))
+                logger.warning(f"📮 笔记写入暂时失败，已保留在待发送队列 {entry.entry_id}，{delay:.0f}秒后重试: {e}")
+                raise NoteDeferredError(entry.entry_id, e) from e
+            # 创建请求可能已经被处理（读超时、5xx等）时结果未知，相同的请求不能再自动创建一篇
+            unconfirmed = kind == "create_note" and not request_rejected(e)
+            await run_blocking(outbox.fail, entry, UNCONFIRMED_CREATE if unconfirmed else str(e))
+        raise
+    except BaseException:
+        if outbox is not None and kind == "create_note":
+            # 请求可能已经发出，结果未知
+            await run_blocking(outbox.fail, entry, UNCONFIRMED_CREATE)
+        raise
+    if outbox is not None:
+        await complete_outbox_entry(api_client, entry)
+    written_id = result.get("noteId") or note_id
+    if mirror is not None and written_id:
+        await run_blocking(mirror.put, api_client.account_id, written_id, encoded)
+    return body, result
+
+async def create_note_once(
+    api_client: MowenAPI,
+    compiled: List[Dict[str, Any]],
+    settings: Dict[str, Any],
+    idempotency_key: Optional[str] = None,
+    on_file: Optional[FileProgressCallback] = None,
+    priority: str = "normal",
+) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+    """
+    幂等地创建笔记
+    
+    幂等键优先使用调用方传入的 idempotency_key，否则按段落内容和笔记设置计算。
+    有效期内的重复请求直接返回原来的 noteId；原请求仍在进行中时等待其结果。
+    启用待发送队列时，发送前就把幂等键和队列记录关联起来：原请求中断（进程退出、调用被取消）后，
+    相同的请求能查到它的结果未知，不会再创建一篇。
+    
+    返回: (发送的 NoteAtom 文档，重复请求直接返回记录时为None, 墨问API响应)
+    
+    异常:
+    - NoteDeferredError: 请求（或相同的原请求）在本地待发送队列中等待发送
+    - NoteUnconfirmedError: 请求（或相同的原请求）已经发出但没有收到结果，笔记可能已经创建
+    """
+    store = api_client.idempotency
+    if store is None:
+        return await write_note(
+            api_client, "create_note", compiled, settings=settings, on_file=on_file, priority=priority,
+        )
+    
+    account = api_client.account_id
+    key = f"key:{idempotency_key}" if idempotency_key else f"body:{derive_key(compiled, settings)}"
+    record = await run_blocking(store.lookup, account, key)
+    if record is not None:
+        if record.note_id:
+            logger.info(f"♻️ 重复的创建请求，返回原笔记: {record.note_id}")
+            return None, {"noteId": record.note_id}
+        status = None
+        if api_client.outbox is not None:
+            status = await run_blocking(api_client.outbox.status, record.entry_id)
+        if status == (OUTBOX_FAILED, UNCONFIRMED_CREATE):
+            raise NoteUnconfirmedError(record.entry_id)
+        raise NoteDeferredError(record.entry_id, "相同的创建请求已经在队列中，不会重复创建")
+    pending = store.inflight(account, key)
+    if pending is not None:
+        logger.info("⏳ 相同的创建请求正在进行，等待其结果")
+        return await asyncio.shield(pending)
+    
+    store.begin(account, key)
+    outbox = api_client.outbox
+    entry = None
+    try:
+        if outbox is not None:
+            entry = await run_blocking(outbox.add, account, "create_note", compiled, settings=settings)
+            await run_blocking(store.record, account, key, entry_id=entry.entry_id)
+        body, result = await write_note(
+            api_client, "create_note", compiled, settings=settings, on_file=on_file, entry=entry, priority=priority,
+        )
+    except NoteDeferredError as e:
+        store.finish(account, key, error=e)
+        raise
+    except Exception as e:
+        if entry is not None:
+            if await run_blocking(outbox.status, entry.entry_id) == (OUTBOX_FAILED, UNCONFIRMED_CREATE):
+                e = NoteUnconfirmedError(entry.entry_id)
+                store.finish(account, key, error=e)
+                raise e
+            # 确定没有创建，之后相同的请求可以重新创建
+            await run_blocking(store.discard_entry, entry.entry_id)
+        store.finish(account, key, error=e)
+        raise
+    except BaseException as e:
+        store.finish(account, key, error=e)
+        raise
+    if result.get("noteId"):
+        await run_blocking(store.record, account, key, note_id=result["noteId"])
+    store.finish(account, key, result=(body, result))
+    return body, result
+
+async def edit_note_coalesced(
+    api_client: MowenAPI,
+    note_id: str,
+    compiled: List[Dict[str, Any]],
+    on_file: Optional[FileProgressCallback] = None,
+    priority: str = "normal",
+) -> Tuple[Dict[str, Any], Dict[str, Any], bool]:
+    """
+    编辑笔记，开启 MOWEN_EDIT_COALESCE_WINDOW 时与窗口内对同一篇笔记的其他编辑合并发送
+    
+    返回: (最终发送的 NoteAtom 文档, 墨问API响应, 这次编辑是否被之后的编辑覆盖)
+    """
+    (body, result), superseded = await api_client.edit_coalescer.submit(
+        note_id,
+        lambda: write_note(api_client, "edit_note", compiled, note_id=note_id, on_file=on_file, priority=priority),
+    )
+    return body, result, superseded
+
+async def replay_outbox_entry(api_client: MowenAPI, entry: OutboxEntry) -> Optional[Dict[str, Any]]:
+    """
+    重新发送一条待发送记录，返回墨问API响应
+
+    重发不是用户正在等待的调用，使用低配额优先级。
+    编辑与同一篇笔记的新编辑按顺序发送；等待期间被新编辑取代的记录不再发送，返回None。
+    """
+    if entry.kind != "edit_note":
+        _, result = await write_note(
+            api_client, entry.kind, entry.paragraphs, settings=entry.settings, entry=entry, priority="low",
+        )
+        return result
+    async with api_client.edit_coalescer.exclusive(entry.note_id):
+        if not await run_blocking(api_client.outbox.exists, entry):
+            return None
+        _, result = await write_note(
+            api_client, entry.kind, entry.paragraphs, note_id=entry.note_id, entry=entry, priority="low",
+        )
+        return result
+
+async def flush_outbox(api_client: MowenAPI) -> int:
+    """
+    发送待发送队列中到期的记录（包括之前的进程退出时未完成的写入）
+    
+    返回: 成功发送的记录数
+    """
+    outbox = api_client.outbox
+    if outbox is None:
+        return 0
+    for entry_id in await run_blocking(outbox.expire_sending, api_client.account_id):
+        logger.error(f"❌ 待发送队列中的笔记创建 {entry_id} 发出后没有收到结果，可能已经创建，不会自动重发")
+    sent = 0
+    while True:
+        entry = await run_blocking(outbox.claim, api_client.account_id)
+        if entry is None:
+            break
+        logger.info(f"📮 重新发送待发送队列中的笔记写入 {entry.entry_id}（{entry.kind}，已上传文件 {len(entry.files)} 个）")
+        try:
+            result = await replay_outbox_entry(api_client, entry)
+            if result is None:
+                logger.info(f"📮 待发送队列中的编辑 {entry.entry_id} 已被之后的编辑取代，不再发送")
+                continue
+        except NoteDeferredError:
+            # 仍然无法发送（通常是网络尚未恢复），等下一轮再试
+            break
+        except Exception as e:
+            logger.error(f"❌ 待发送队列中的笔记写入 {entry.entry_id} 失败，不再重试: {e}")
+            if api_client.idempotency is not None and (
+                await run_blocking(outbox.status, entry.entry_id) != (OUTBOX_FAILED, UNCONFIRMED_CREATE)
+            ):
+                # 确定没有创建，否则相同的创建请求会一直收到“已经在队列中”的提示；
+                # 结果未知时保留关联，相同的请求会被拒绝而不是再创建一篇
+                await run_blocking(api_client.idempotency.discard_entry, entry.entry_id)
+            continue
+        sent += 1
+        if api_client.idempotency is not None and result.get("noteId"):
+            await run_blocking(api_client.idempotency.resolve_entry, entry.entry_id, result["noteId"])
+        logger.info(f"✅ 待发送队列中的笔记写入 {entry.entry_id} 已完成，笔记ID: {result.get('noteId', entry.note_id)}")
+    await run_blocking(outbox.evict)
+    return sent
+
+async def run_outbox_flusher(interval: float) -> None:
+    """定期发送待发送队列（多租户模式下依次处理当前保留的每个租户），启动后立即执行一次"""
+    interval = max(1.0, interval)
+    while True:
+        for api_client in active_api_clients():
+            try:
+                await flush_outbox(api_client)
+            except Exception as e:
+                logger.error(f"❌ 处理待发送队列失败: {e}")
+        await asyncio.sleep(interval)
+
+def submit_note_job(
+    api_client: MowenAPI,
+    kind: str,
+    description: str,
+    compiled: List[Dict[str, Any]],
+    note_id: Optional[str] = None,
+    settings: Optional[Dict[str, Any]] = None,
+    idempotency_key: Optional[str] = None,
+) -> Job:
+    """
+    把笔记写入放入后台任务队列
+    
+    后台任务使用低配额优先级：当天剩余配额低于 MOWEN_QUOTA_LOW_PRIORITY_RESERVE 时被拒绝，
+    剩余配额留给同步调用。
+    
+    参数:
+    - api_client: 墨问API客户端（多租户模式下为提交任务的租户）
+    - kind: 任务类型（create_note/edit_note）
+    - description: 任务描述
+    - compiled: compile_paragraphs 的结果（已经通过校验）
+    - note_id: 编辑的笔记ID（edit_note）
+    - settings: 笔记设置（create_note）
+    - idempotency_key: 幂等键（create_note，可选）
+    """
+    async def run(job: Job) -> Optional[str]:
+        if kind == "create_note":
+            body, result = await create_note_once(
+                api_client, compiled, settings, idempotency_key, on_file=job.update_file, priority="low",
+            )
+            job.message = f"段落数: {len(body['content'])}" if body is not None else "重复请求，返回原笔记"
+        else:
+            body, result, superseded = await edit_note_coalesced(
+                api_client, note_id, compiled, on_file=job.update_file, priority="low",
+            )
+            job.message = "内容没有变化，已跳过编辑" if result.get("unchanged") else f"段落数: {len(body['content'])}"
+            if superseded:
+                job.message += f"\n{SUPERSEDED_EDIT_NOTE}"
+        return result.get("noteId") or job.note_id
+    
+    job = get_job_manager(api_client.config).submit(kind, description, run, note_id=note_id, owner=api_client.account_id)
+    for i, paragraph in enumerate(compiled):
+        if paragraph.get("type") == "file":
+            job.track_file(i, paragraph.get("source_path", ""))
+    return job
+
+# 编辑被合并窗口内之后的编辑覆盖时附带的说明
+SUPERSEDED_EDIT_NOTE = "说明: 本次内容已被随后对同一笔记的编辑覆盖，只发送了最后一次编辑的内容"
+
+def format_job_submitted(job: Job) -> str:
+    """后台任务提交成功的返回文本"""
+    return (
+        f"⏳ 已提交后台任务，文件将在后台上传\n\n任务ID: {job.job_id}\n"
+        f"文件数: {len(job.files)}\n请稍后调用 get_job_status 查询进度和笔记ID"
+    )
 
 @mcp.tool()
-def create_note(
-    paragraphs: List[Dict[str, Any]] = Field(
-        description="""
-        富文本段落列表，每个段落包含多个文本节点。支持文本、引用、内链笔记和文件。
-        
-        段落类型：
-        1. 普通段落（默认）：{"texts": [...]}
-        2. 引用段落：{"type": "quote", "texts": [...]}
-        3. 内链笔记：{"type": "note", "note_id": "笔记ID"}
-        4. 文件段落：{"type": "file", "file_type": "image|audio|pdf", "source_type": "local|url", "source_path": "路径", "metadata": {...}}
-        
-        格式示例：
-        [
-            {
-                "texts": [
-                    {"text": "这是普通文本"},
-                    {"text": "这是加粗文本", "bold": true},
-                    {"text": "这是高亮文本", "highlight": true},
-                    {"text": "这是链接", "link": "https://example.com"}
-                ]
-            },
-            {
-                "type": "quote",
-                "texts": [
-                    {"text": "这是引用段落"},
-                    {"text": "支持富文本", "bold": true}
-                ]
-            },
-            {
-                "type": "note",
-                "note_id": "VPrWsE_-P0qwrFUOygGs8"
-            },
-            {
-                "type": "file",
-                "file_type": "image",
-                "source_type": "local",
-                "source_path": "/path/to/image.jpg",
-                "metadata": {
-                    "alt": "图片描述",
-                    "align": "center"
-                }
-            },
-            {
-                "type": "file",
-                "file_type": "audio",
-                "source_type": "url",
-                "source_path": "https://example.com/audio.mp3",
-                "metadata": {
-                    "show_note": "00:00 开场\\n01:30 主要内容"
-                }
-            },
-            {
-                "texts": [
-                    {"text": "第二段内容"}
-                ]
-            }
-        ]
-        
-        支持的文件类型：
-        - 图片(image): .gif, .jpeg, .jpg, .png, .webp (最大50MB)
-        - 音频(audio): .mp3, .mp4, .m4a (最大200MB)
-        - PDF(pdf): .pdf (最大100MB)
-        
-        文件metadata说明：
-        - 图片: alt(描述), align(对齐: left|center|right)
-        - 音频: show_note(ShowNote内容)
-        - PDF: 无需额外metadata
-        
-        📁 文件路径说明：
-        - 支持绝对路径和相对路径（推荐使用绝对路径）
-        - 自动兼容不同操作系统的路径格式：
-          * Windows反斜杠: "C:\\Users\\用户名\\Documents\\image.jpg"
-          * 正斜杠格式: "C:/Users/用户名/Documents/image.jpg"  
-          * macOS/Linux: "/Users/用户名/Documents/image.jpg"
-          * 混合格式: "C:/Users\\用户名/Documents\\image.jpg"
-        - 智能路径修复功能：
-          * 自动移除文件名前的异常@符号: "D:\\@note.png" -> "D:\\note.png"
-          * 自动标准化路径格式，跨平台兼容
-          * 多重修复策略确保路径正确性
-        
-        如果只是简单文本，可以这样使用：
-        [
-            {
-                "texts": [
-                    {"text": "这是一段简单的文本内容"}
-                ]
-            }
-        ]
-        """
+async def create_note(
+    paragraphs: List[Paragraph] = Field(
+        description="富文本段落列表，支持普通段落、引用段落、内链笔记和文件段落，各类型的结构见对应定义"
     ),
     auto_publish: bool = Field(default=False, description="是否自动发布笔记。True表示立即发布，False表示保存为草稿"),
-    tags: Optional[List[str]] = Field(default=None, description="笔记标签列表，例如：['工作', '学习', '重要']")
+    tags: Optional[List[str]] = Field(default=None, description="笔记标签列表，例如：['工作', '学习', '重要']"),
+    background: bool = Field(default=False, description="后台模式：校验参数后立即返回任务ID，文件在后台上传，之后用 get_job_status 查询结果。附带较大文件时建议开启"),
+    idempotency_key: Optional[str] = Field(default=None, description="幂等键（可选）：相同的键在有效期内只创建一次笔记，重试时传入相同的值。不填时按内容和设置自动判断重复请求")
 ) -> str:
     """
     创建一篇新的墨问笔记
     
-    这个工具使用统一的富文本格式来创建笔记，支持：
-    - 多个段落的结构化内容
-    - 普通段落：文本格式（加粗、高亮、链接）
-    - 引用段落：用于创建引用文本块，支持富文本格式
-    - 内链笔记：引用其他笔记，创建笔记间的关联
-    - 灵活的内容组织方式
+    使用统一的富文本格式，支持普通段落（加粗、高亮、链接）、引用段落、内链笔记和文件（图片、音频、PDF）。
     
-    使用场景：
-    - 快速记录想法或备忘录
-    - 创建结构化文档
-    - 保存会议记录或学习笔记
-    - 包含外部链接的笔记
-    
-    简单文本示例：
+    示例：
     create_note(
         paragraphs=[
-            {
-                "texts": [
-                    {"text": "今天学习了Python编程，重点是异步编程概念"}
-                ]
-            }
-        ],
-        auto_publish=True,
-        tags=["学习", "Python", "编程"]
-    )
-    
-    富文本示例：
-    create_note(
-        paragraphs=[
-            {
-                "texts": [
-                    {"text": "重要提醒：", "bold": true},
-                    {"text": "明天的会议已改期"}
-                ]
-            },
-            {
-                "type": "quote",
-                "texts": [
-                    {"text": "详情请查看：", "highlight": true},
-                    {"text": "会议通知", "link": "https://example.com/meeting"}
-                ]
-            },
-            {
-                "type": "note",
-                "note_id": "VPrWsE_-P0qwrFUOygGs8"
-            }
+            {"texts": [{"text": "重要提醒：", "bold": true}, {"text": "明天的会议已改期"}]},
+            {"type": "quote", "texts": [{"text": "会议通知", "link": "https://example.com/meeting"}]},
+            {"type": "note", "note_id": "VPrWsE_-P0qwrFUOygGs8"}
         ],
         auto_publish=True,
         tags=["会议", "通知"]
@@ -933,112 +1339,34 @@ def create_note(
     except RuntimeError as e:
         return f"错误：{str(e)}"
     
-    # 参数验证
-    if not validate_rich_note_paragraphs(paragraphs):
-        return """❌ 参数格式错误！
-        
-正确的paragraphs格式示例：
-[
-    {
-        "texts": [
-            {"text": "普通文本"},
-            {"text": "加粗文本", "bold": true},
-            {"text": "高亮文本", "highlight": true},
-            {"text": "链接文本", "link": "https://example.com"}
-        ]
-    },
-    {
-        "type": "quote",
-        "texts": [
-            {"text": "引用段落"}
-        ]
-    },
-    {
-        "type": "note",
-        "note_id": "VPrWsE_-P0qwrFUOygGs8"
-    }
-]
-
-请检查：
-1. 普通段落和引用段落必须有"texts"字段
-2. 内链笔记段落必须有"note_id"字段
-3. 每个文本节点必须有"text"字段
-4. bold和highlight必须是布尔值
-5. link必须是字符串URL
-6. note_id必须是字符串
-"""
-    
     if tags is None:
         tags = []
     
+    settings = {
+        "autoPublish": auto_publish,
+        "tags": tags
+    }
+    
     try:
-        # 先处理包含文件的段落，进行文件上传
-        logger.info(f"🚀 开始创建笔记，原始段落数: {len(paragraphs)}")
-        processed_paragraphs = run_async_safely(process_paragraphs_with_files(paragraphs))
-        logger.info(f"📋 文件处理完成，处理后段落数: {len(processed_paragraphs)}")
-        
-        # 构建富文本内容
-        paragraphs_built = []
-        for para_data in processed_paragraphs:
-            para_type = para_data.get("type", "paragraph")
+        compiled = compile_paragraphs(dump_paragraphs(paragraphs))
+        if background:
+            job = submit_note_job(
+                api_client, "create_note", f"创建笔记（{len(compiled)}段）", compiled,
+                settings=settings, idempotency_key=idempotency_key,
+            )
+            return format_job_submitted(job)
+        
+        body, result = await create_note_once(api_client, compiled, settings, idempotency_key)
+        if body is None:
+            return f"✅ 笔记已创建（重复请求，未再次创建）\n\n笔记ID: {result['noteId']}"
             
-            if para_type == "note":
-                # 内链笔记节点
-                note_id = para_data.get("note_id")
-                if not note_id:
-                    raise ValueError("内链笔记节点必须提供note_id参数")
-                paragraphs_built.append(NoteAtomBuilder.create_note(note_id))
-            elif para_type in ["image", "audio", "pdf"]:
-                # 文件节点（已经通过process_paragraphs_with_files处理过）
-                paragraphs_built.append(para_data)
-            elif "texts" in para_data:
-                # 文本段落（普通或引用）
-                texts = []
-                for text_data in para_data["texts"]:
-                    marks = []
-                    if text_data.get("bold"):
-                        marks.append(NoteAtomBuilder.create_bold_mark())
-                    if text_data.get("highlight"):
-                        marks.append(NoteAtomBuilder.create_highlight_mark())
-                    if text_data.get("link"):
-                        marks.append(NoteAtomBuilder.create_link_mark(text_data["link"]))
-                    
-                    text_node = NoteAtomBuilder.create_text(
-                        text_data["text"], 
-                        marks if marks else None
-                    )
-                    texts.append(text_node)
-                
-                if para_type == "quote":
-                    paragraphs_built.append(NoteAtomBuilder.create_quote(texts))
-                else:
-                    paragraphs_built.append(NoteAtomBuilder.create_paragraph(texts))
-            else:
-                # 其他类型的段落，可能是处理后的文件节点等，直接跳过或记录错误
-                logger.warning(f"未知段落类型: {para_data}")
-        
-        body = NoteAtomBuilder.create_doc(paragraphs_built)
-        settings = {
-            "autoPublish": auto_publish,
-            "tags": tags
-        }
-        
-        # 记录最终发送给墨问的完整数据结构
-        logger.info(f"🏗️ 最终构建的笔记结构:")
-        logger.info(f"Body: {json.dumps(body, indent=2, ensure_ascii=False)}")
-        logger.info(f"Settings: {json.dumps(settings, indent=2, ensure_ascii=False)}")
-        
-        # 详细记录每个阶段的段落数
-        logger.info(f"📊 段落处理统计:")
-        logger.info(f"  - 原始输入段落数: {len(paragraphs)}")
-        logger.info(f"  - 文件处理后段落数: {len(processed_paragraphs)}")
-        logger.info(f"  - 最终构建段落数: {len(paragraphs_built)}")
-        logger.info(f"  - 每个构建段落的类型: {[p.get('type', 'unknown') for p in paragraphs_built]}")
-        
-        # 使用修复的异步运行方式
-        result = run_async_safely(api_client.create_note(body, settings))
-            
-        return f"✅ 笔记创建成功！\n\n笔记ID: {result.get('noteId', 'N/A')}\n段落数: {len(paragraphs_built)}\n自动发布: {auto_publish}\n标签: {', '.join(tags)}"
+        return f"✅ 笔记创建成功！\n\n笔记ID: {result.get('noteId', 'N/A')}\n段落数: {len(body['content'])}\n自动发布: {auto_publish}\n标签: {', '.join(tags)}"
+    except NoteAtomError as e:
+        return f"❌ 参数格式错误：{e}\n\n{PARAGRAPH_FORMAT_HINT}"
+    except NoteDeferredError as e:
+        return f"📮 墨问API暂时无法访问，{e}"
+    except NoteUnconfirmedError as e:
+        return f"⚠️ {e}"
     except MowenAPIError as e:
         # 墨问API特定错误，已经有详细日志记录
         error_detail = f"\n错误代码: {e.status_code}\n错误原因: {e.reason}\n错误信息: {e.message}"
@@ -1050,128 +1378,23 @@ def create_note(
         return f"❌ 发生错误: {str(e)}\n\n调试信息:\n{tb}"
 
 @mcp.tool()
-def edit_note(
+async def edit_note(
     note_id: str = Field(description="要编辑的笔记ID，通常是创建笔记时返回的ID"),
-    paragraphs: List[Dict[str, Any]] = Field(
-        description="""
-        富文本段落列表，每个段落包含多个文本节点。将完全替换原有笔记内容。支持文本、引用、内链笔记和文件。
-        
-        段落类型：
-        1. 普通段落（默认）：{"texts": [...]}
-        2. 引用段落：{"type": "quote", "texts": [...]}
-        3. 内链笔记：{"type": "note", "note_id": "笔记ID"}
-        4. 文件段落：{"type": "file", "file_type": "image|audio|pdf", "source_type": "local|url", "source_path": "路径", "metadata": {...}}
-        
-        格式示例：
-        [
-            {
-                "texts": [
-                    {"text": "这是普通文本"},
-                    {"text": "这是加粗文本", "bold": true},
-                    {"text": "这是高亮文本", "highlight": true},
-                    {"text": "这是链接", "link": "https://example.com"}
-                ]
-            },
-            {
-                "type": "quote",
-                "texts": [
-                    {"text": "这是引用段落"},
-                    {"text": "支持富文本", "bold": true}
-                ]
-            },
-            {
-                "type": "note",
-                "note_id": "VPrWsE_-P0qwrFUOygGs8"
-            },
-            {
-                "type": "file",
-                "file_type": "image",
-                "source_type": "local",
-                "source_path": "/path/to/image.jpg",
-                "metadata": {
-                    "alt": "图片描述",
-                    "align": "center"
-                }
-            },
-            {
-                "texts": [
-                    {"text": "第二段内容"}
-                ]
-            }
-        ]
-        
-        支持的文件类型：
-        - 图片(image): .gif, .jpeg, .jpg, .png, .webp (最大50MB)
-        - 音频(audio): .mp3, .mp4, .m4a (最大200MB)
-        - PDF(pdf): .pdf (最大100MB)
-        
-        文件metadata说明：
-        - 图片: alt(描述), align(对齐: left|center|right)
-        - 音频: show_note(ShowNote内容)
-        - PDF: 无需额外metadata
-        
-        如果只是简单文本，可以这样使用：
-        [
-            {
-                "texts": [
-                    {"text": "这是一段简单的文本内容"}
-                ]
-            }
-        ]
-        """
-    )
+    paragraphs: List[Paragraph] = Field(
+        description="富文本段落列表，将完全替换原有笔记内容，各段落类型的结构见对应定义"
+    ),
+    background: bool = Field(default=False, description="后台模式：校验参数后立即返回任务ID，文件在后台上传，之后用 get_job_status 查询结果。附带较大文件时建议开启")
 ) -> str:
     """
     编辑已存在的笔记内容
     
-    这个工具使用统一的富文本格式来编辑笔记，支持：
-    - 多个段落的结构化内容
-    - 普通段落：文本格式（加粗、高亮、链接）
-    - 引用段落：用于创建引用文本块，支持富文本格式
-    - 内链笔记：引用其他笔记，创建笔记间的关联
-    - 灵活的内容组织方式
+    段落格式与 create_note 相同。注意：此操作会完全替换笔记的原有内容，而不是追加内容。
     
-    注意：此操作会完全替换笔记的原有内容，而不是追加内容。
-    
-    使用场景：
-    - 修正笔记中的错误
-    - 更新笔记内容
-    - 将简单文本笔记升级为富文本格式
-    - 重新组织笔记结构和格式
-    
-    简单文本示例：
+    示例：
     edit_note(
         note_id="note_123456",
         paragraphs=[
-            {
-                "texts": [
-                    {"text": "更新后的笔记内容"}
-                ]
-            }
-        ]
-    )
-    
-    富文本示例：
-    edit_note(
-        note_id="note_123456",
-        paragraphs=[
-            {
-                "texts": [
-                    {"text": "更新：", "bold": true},
-                    {"text": "项目进度已完成80%"}
-                ]
-            },
-            {
-                "type": "quote",
-                "texts": [
-                    {"text": "详细报告请查看：", "highlight": true},
-                    {"text": "项目文档", "link": "https://example.com/report"}
-                ]
-            },
-            {
-                "type": "note",
-                "note_id": "VPrWsE_-P0qwrFUOygGs8"
-            }
+            {"texts": [{"text": "更新：", "bold": true}, {"text": "项目进度已完成80%"}]}
         ]
     )
     """
@@ -1180,101 +1403,150 @@ def edit_note(
     except RuntimeError as e:
         return f"错误：{str(e)}"
     
-    # 参数验证
-    if not validate_rich_note_paragraphs(paragraphs):
-        return """❌ 参数格式错误！
-        
-正确的paragraphs格式示例：
-[
-    {
-        "texts": [
-            {"text": "普通文本"},
-            {"text": "加粗文本", "bold": true},
-            {"text": "高亮文本", "highlight": true},
-            {"text": "链接文本", "link": "https://example.com"}
-        ]
-    },
-    {
-        "type": "quote",
-        "texts": [
-            {"text": "引用段落"}
-        ]
-    },
-    {
-        "type": "note",
-        "note_id": "VPrWsE_-P0qwrFUOygGs8"
-    }
-]
-
-请检查：
-1. 普通段落和引用段落必须有"texts"字段
-2. 内链笔记段落必须有"note_id"字段
-3. 每个文本节点必须有"text"字段
-4. bold和highlight必须是布尔值
-5. link必须是字符串URL
-6. note_id必须是字符串
-"""
+    try:
+        compiled = compile_paragraphs(dump_paragraphs(paragraphs))
+        if background:
+            job = submit_note_job(api_client, "edit_note", f"编辑笔记 {note_id}（{len(compiled)}段）", compiled, note_id=note_id)
+            return format_job_submitted(job)
+        
+        body, result, superseded = await edit_note_coalesced(api_client, note_id, compiled)
+        
+        if result.get("unchanged"):
+            return f"✅ 笔记内容没有变化，已跳过编辑\n\n笔记ID: {note_id}"
+        message = f"✅ 笔记编辑成功！\n\n笔记ID: {result.get('noteId', note_id)}\n段落数: {len(body['content'])}"
+        if superseded:
+            message += f"\n{SUPERSEDED_EDIT_NOTE}"
+        return message
+    except NoteAtomError as e:
+        return f"❌ 参数格式错误：{e}\n\n{PARAGRAPH_FORMAT_HINT}"
+    except NoteDeferredError as e:
+        return f"📮 墨问API暂时无法访问，{e}"
+    except MowenAPIError as e:
+        # 墨问API特定错误，已经有详细日志记录
+        error_detail = f"\n错误代码: {e.status_code}\n错误原因: {e.reason}\n错误信息: {e.message}"
+        return f"❌ API调用失败: {str(e)}{error_detail}"
+    except Exception as e:
+        return f"❌ 发生错误: {str(e)}"
+
+# 段落下标在修改工具中的说明
+PARAGRAPH_INDEX_HINT = "段落下标从0开始，对应上一次通过本服务器发送的笔记内容（开启 MOWEN_COLLAPSE_EMPTY_PARAGRAPHS 时连续的空段落已合并为一个）"
+
+PatchFunction = Callable[[List[Dict[str, Any]], List[Dict[str, Any]]], List[Dict[str, Any]]]
+
+async def patch_note(
+    note_id: str,
+    paragraphs: List[Paragraph],
+    patch: PatchFunction,
+    action: str,
+) -> str:
+    """
+    在笔记的本地副本上修改段落，再把完整内容发送给墨问
     
+    参数:
+    - note_id: 笔记ID
+    - paragraphs: 新的段落
+    - patch: 接收 (本地副本的段落节点, 新段落) 返回修改后段落列表的函数，下标越界时抛出 ValueError
+    - action: 返回信息中的操作描述
+    """
     try:
-        # 先处理包含文件的段落，进行文件上传
-        processed_paragraphs = run_async_safely(process_paragraphs_with_files(paragraphs))
-        
-        # 构建富文本内容
-        paragraphs_built = []
-        for para_data in processed_paragraphs:
-            para_type = para_data.get("type", "paragraph")
-            
-            if para_type == "note":
-                # 内链笔记节点
-                internal_note_id = para_data.get("note_id")
-                if not internal_note_id:
-                    raise ValueError("内链笔记节点必须提供note_id参数")
-                paragraphs_built.append(NoteAtomBuilder.create_note(internal_note_id))
-            elif para_type in ["image", "audio", "pdf"]:
-                # 文件节点（已经通过process_paragraphs_with_files处理过）
-                paragraphs_built.append(para_data)
-            elif "texts" in para_data:
-                # 文本段落（普通或引用）
-                texts = []
-                for text_data in para_data["texts"]:
-                    marks = []
-                    if text_data.get("bold"):
-                        marks.append(NoteAtomBuilder.create_bold_mark())
-                    if text_data.get("highlight"):
-                        marks.append(NoteAtomBuilder.create_highlight_mark())
-                    if text_data.get("link"):
-                        marks.append(NoteAtomBuilder.create_link_mark(text_data["link"]))
-                    
-                    text_node = NoteAtomBuilder.create_text(
-                        text_data["text"], 
-                        marks if marks else None
-                    )
-                    texts.append(text_node)
-                
-                if para_type == "quote":
-                    paragraphs_built.append(NoteAtomBuilder.create_quote(texts))
-                else:
-                    paragraphs_built.append(NoteAtomBuilder.create_paragraph(texts))
-            else:
-                # 其他类型的段落，可能是处理后的文件节点等，直接跳过或记录错误
-                logger.warning(f"未知段落类型: {para_data}")
-        
-        body = NoteAtomBuilder.create_doc(paragraphs_built)
-        
-        # 使用修复的异步运行方式
-        result = run_async_safely(api_client.edit_note(note_id, body))
-            
-        return f"✅ 笔记编辑成功！\n\n笔记ID: {result.get('noteId', note_id)}\n段落数: {len(paragraphs_built)}"
+        api_client = get_mowen_api()
+    except RuntimeError as e:
+        return f"错误：{str(e)}"
+    if api_client.mirror is None:
+        return "❌ 笔记本地副本未启用（MOWEN_MIRROR_ENABLED=false），请使用 edit_note 发送完整内容"
+    
+    try:
+        compiled = compile_paragraphs(dump_paragraphs(paragraphs))
+        # 基于副本的修改不参与编辑合并，并且与同一篇笔记的其他编辑按顺序进行
+        async with api_client.edit_coalescer.exclusive(note_id):
+            base = await run_blocking(api_client.mirror.get, api_client.account_id, note_id)
+            if base is None:
+                return (
+                    f"❌ 本地没有笔记 {note_id} 的内容副本（只有通过本服务器创建或编辑过的笔记才有），"
+                    "请使用 edit_note 发送完整内容"
+                )
+            content = patch(list(base.get("content") or ()), compiled)
+            body, result = await write_note(api_client, "edit_note", content, note_id=note_id)
+        
+        if result.get("unchanged"):
+            return f"✅ 笔记内容没有变化，已跳过编辑\n\n笔记ID: {note_id}"
+        return f"✅ {action}\n\n笔记ID: {note_id}\n段落数: {len(body['content'])}"
+    except NoteAtomError as e:
+        return f"❌ 参数格式错误：{e}\n\n{PARAGRAPH_FORMAT_HINT}"
+    except NoteDeferredError as e:
+        return f"📮 墨问API暂时无法访问，{e}"
     except MowenAPIError as e:
         # 墨问API特定错误，已经有详细日志记录
         error_detail = f"\n错误代码: {e.status_code}\n错误原因: {e.reason}\n错误信息: {e.message}"
         return f"❌ API调用失败: {str(e)}{error_detail}"
+    except ValueError as e:
+        return f"❌ {e}"
     except Exception as e:
         return f"❌ 发生错误: {str(e)}"
 
+def _check_paragraph_range(content: List[Dict[str, Any]], start: int, end: int) -> None:
+    if not 0 <= start <= end <= len(content):
+        raise ValueError(f"段落下标超出范围：笔记当前共 {len(content)} 段。{PARAGRAPH_INDEX_HINT}")
 
 @mcp.tool()
-def set_note_privacy(
+async def append_to_note(
+    note_id: str = Field(description="笔记ID，必须是通过本服务器创建或编辑过的笔记"),
+    paragraphs: List[Paragraph] = Field(description="追加到笔记末尾的段落，格式与 create_note 相同"),
+) -> str:
+    """
+    在笔记末尾追加段落，只需要传入新增的段落
+    
+    服务器在本地保存了每篇笔记上一次发送的内容，会自动拼出完整内容再发送。
+    
+    示例：
+    append_to_note(note_id="note_123456", paragraphs=[{"texts": [{"text": "补充：明天10点开会"}]}])
+    """
+    return await patch_note(
+        note_id, paragraphs, lambda content, new: content + new, f"已追加 {len(paragraphs)} 段"
+    )
+
+@mcp.tool()
+async def insert_paragraphs(
+    note_id: str = Field(description="笔记ID，必须是通过本服务器创建或编辑过的笔记"),
+    position: int = Field(ge=0, description=f"插入位置，新段落插入到这个下标的段落之前，等于段落数时追加到末尾。{PARAGRAPH_INDEX_HINT}"),
+    paragraphs: List[Paragraph] = Field(description="要插入的段落，格式与 create_note 相同"),
+) -> str:
+    """
+    在笔记的指定位置插入段落，只需要传入新增的段落
+    
+    示例（在第一段之后插入）：
+    insert_paragraphs(note_id="note_123456", position=1, paragraphs=[{"type": "quote", "texts": [{"text": "引用"}]}])
+    """
+    def patch(content: List[Dict[str, Any]], new: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        _check_paragraph_range(content, position, position)
+        return content[:position] + new + content[position:]
+    
+    return await patch_note(note_id, paragraphs, patch, f"已在第 {position} 段前插入 {len(paragraphs)} 段")
+
+@mcp.tool()
+async def replace_paragraphs(
+    note_id: str = Field(description="笔记ID，必须是通过本服务器创建或编辑过的笔记"),
+    start: int = Field(ge=0, description=f"要替换的第一个段落的下标。{PARAGRAPH_INDEX_HINT}"),
+    paragraphs: List[Paragraph] = Field(description="替换后的段落，格式与 create_note 相同，传入空列表表示删除"),
+    count: int = Field(default=1, ge=0, description="被替换的段落数"),
+) -> str:
+    """
+    替换（或删除）笔记中从 start 开始的 count 个段落，只需要传入替换后的段落
+    
+    示例（把第3段改写为两段）：
+    replace_paragraphs(note_id="note_123456", start=2, count=1, paragraphs=[{"texts": [{"text": "新内容"}]}, {"texts": [{"text": "补充"}]}])
+    """
+    def patch(content: List[Dict[str, Any]], new: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        _check_paragraph_range(content, start, start + count)
+        return content[:start] + new + content[start + count:]
+    
+    return await patch_note(
+        note_id, paragraphs, patch, f"已替换第 {start} 段起的 {count} 段为 {len(paragraphs)} 段"
+    )
+
+
+@mcp.tool()
+async def set_note_privacy(
     note_id: str = Field(description="笔记ID"),
     privacy_type: Literal["public", "private", "rule"] = Field(
         description="""
@@ -1335,8 +1607,7 @@ def set_note_privacy(
                 "expireAt": str(expire_at)
             }
         
-        # 使用修复的异步运行方式
-        result = run_async_safely(api_client.set_note_privacy(note_id, privacy_type, rule))
+        result = await api_client.set_note_privacy(note_id, privacy_type, rule)
         
         privacy_desc = {
             "public": "完全公开",
@@ -1363,7 +1634,7 @@ def set_note_privacy(
         return f"❌ 发生错误: {str(e)}"
 
 @mcp.tool()
-def reset_api_key() -> str:
+async def reset_api_key() -> str:
     """
     重置墨问API密钥
     
@@ -1388,8 +1659,7 @@ def reset_api_key() -> str:
         return f"错误：{str(e)}"
     
     try:
-        # 使用修复的异步运行方式
-        result = run_async_safely(api_client.reset_api_key())
+        result = await api_client.reset_api_key()
             
         new_api_key = result.get("apiKey", "N/A")
         
@@ -1401,64 +1671,259 @@ def reset_api_key() -> str:
     except Exception as e:
         return f"❌ 发生错误: {str(e)}"
 
+@mcp.tool()
+async def get_quota_status() -> str:
+    """
+    查询墨问API今日剩余配额
+    
+    墨问开放API每个接口都有每日配额（调用成功才计为1次，北京时间零点重置），例如：
+    - 笔记创建：100次/天
+    - 笔记编辑：1000次/天
+    - 笔记设置：100次/天
+    - 文件上传：200次/天（本地文件和远程URL上传合计）
+    
+    使用场景：
+    - 批量创建或编辑笔记前确认配额是否足够
+    - 调用因配额不足被拒绝后查看重置时间
+    
+    注意：统计基于本服务器发出的调用，通过其他途径使用同一API密钥的调用不会计入。
+    
+    示例调用：
+    get_quota_status()
+    """
+    try:
+        api_client = get_mowen_api()
+    except RuntimeError as e:
+        return f"错误：{str(e)}"
+    
+    if api_client.quota is None:
+        return "ℹ️ 本地配额统计未启用（MOWEN_QUOTA_ENABLED=false）"
+    
+    endpoint_names = {
+        "note/create": "笔记创建",
+        "note/edit": "笔记编辑",
+        "note/set": "笔记设置",
+        "upload": "文件上传（本地与远程URL合计）",
+        "auth/key/reset": "API密钥重置",
+    }
+    status = await run_blocking(api_client.quota.status)
+    lines = ["📊 墨问API今日配额使用情况\n"]
+    for endpoint, info in status.items():
+        name = endpoint_names.get(endpoint, endpoint)
+        line = f"- {name}({endpoint}): 已用 {info['used']}/{info['limit']}，剩余 {info['remaining']}"
+        if info["in_flight"]:
+            line += f"（进行中 {info['in_flight']}）"
+        lines.append(line)
+    reset_at = next(iter(status.values()))["reset_at"] if status else ""
+    lines.append(f"\n配额重置时间: {reset_at}（北京时间）")
+    return "\n".join(lines)
+
+async def format_outbox_counts(api_client: MowenAPI) -> Optional[str]:
+    """待发送队列的统计信息，队列为空或未启用时返回None"""
+    if api_client.outbox is None:
+        return None
+    counts = await run_blocking(api_client.outbox.counts, api_client.account_id)
+    pending, failed = counts.get(OUTBOX_PENDING, 0), counts.get(OUTBOX_FAILED, 0)
+    if not pending and not failed:
+        return None
+    return f"📮 本地待发送队列：等待重发 {pending} 条，失败 {failed} 条"
+
+async def format_outbox_entry(api_client: MowenAPI, entry_id: str) -> str:
+    """待发送队列中一条记录的当前状态"""
+    status = None
+    if api_client.outbox is not None:
+        status = await run_blocking(api_client.outbox.status, entry_id)
+    if status is None:
+        return f"队列记录 {entry_id}: 已不在队列中（已发送成功或被之后的编辑取代）"
+    state, last_error = status
+    if state == OUTBOX_FAILED:
+        return f"队列记录 {entry_id}: ❌ 发送失败，不再重试（{last_error}）"
+    if state == OUTBOX_SENDING:
+        return f"队列记录 {entry_id}: 🔄 正在发送"
+    return f"队列记录 {entry_id}: ⏳ 等待自动重发" + (f"（上次失败原因: {last_error}）" if last_error else "")
+
+@mcp.tool()
+async def get_job_status(
+    job_id: Optional[str] = Field(default=None, description="后台任务ID（create_note/edit_note 的 background 模式返回），不填则列出最近的任务")
+) -> str:
+    """
+    查询后台任务的进度和结果
+    
+    create_note/edit_note 使用 background=True 时会立即返回任务ID，
+    通过这个工具查看每个文件的上传进度，任务完成后返回笔记ID。
+    
+    示例调用：
+    get_job_status(job_id="3f2c9a0d41b64e8a")
+    """
+    try:
+        api_client = get_mowen_api()
+        manager = get_job_manager(api_client.config)
+        # 多租户模式下只能查看自己提交的任务
+        owner = api_client.account_id
+    except RuntimeError as e:
+        return f"错误：{str(e)}"
+    
+    status_names = {
+        "queued": "⏳ 排队中",
+        "running": "🔄 执行中",
+        "succeeded": "✅ 已完成",
+        "failed": "❌ 失败",
+        "deferred": "📮 已转入待发送队列",
+    }
+    file_state_names = {"pending": "等待上传", "uploading": "上传中", "done": "已上传", "failed": "失败"}
+    
+    if not job_id:
+        jobs = manager.jobs(owner)[-20:]
+        outbox_line = await format_outbox_counts(api_client)
+        if not jobs:
+            return "\n".join(filter(None, ["ℹ️ 当前没有后台任务", outbox_line]))
+        lines = [f"📋 最近的后台任务（进行中 {manager.pending(owner)} 个）\n"]
+        for job in reversed(jobs):
+            line = f"- {job.job_id} {status_names.get(job.status, job.status)} {job.description}"
+            if job.note_id:
+                line += f"，笔记ID: {job.note_id}"
+            lines.append(line)
+        if outbox_line:
+            lines.append(f"\n{outbox_line}")
+        return "\n".join(lines)
+    
+    job = manager.get(job_id, owner)
+    if job is None:
+        return f"❌ 未找到任务 {job_id}（任务可能已过期或服务器已重启）"
+    
+    lines = [f"任务ID: {job.job_id}", f"状态: {status_names.get(job.status, job.status)}", f"内容: {job.description}"]
+    if job.files:
+        done = sum(1 for progress in job.files.values() if progress.state == FILE_DONE)
+        lines.append(f"\n文件上传进度: {done}/{len(job.files)}")
+        for progress in job.files.values():
+            line = f"- 段落{progress.index}: {file_state_names.get(progress.state, progress.state)} {progress.source_path}"
+            if progress.error:
+                line += f"（{progress.error.splitlines()[0]}）"
+            lines.append(line)
+    if job.status == JOB_SUCCEEDED:
+        lines.append(f"\n笔记ID: {job.note_id or 'N/A'}")
+        if job.message:
+            lines.append(job.message)
+    elif job.status == JOB_FAILED:
+        lines.append(f"\n错误信息: {job.error}")
+    elif job.status == JOB_DEFERRED:
+        lines.append("\n" + await format_outbox_entry(api_client, job.outbox_entry_id))
+    if job.finished_at and job.started_at:
+        lines.append(f"耗时: {job.finished_at - job.started_at:.1f}秒")
+    return "\n".join(lines)
+
 # 添加参数验证辅助函数
 def validate_rich_note_paragraphs(paragraphs: List[Dict[str, Any]]) -> bool:
-    """验证富文本笔记段落格式"""
+    """验证富文本笔记段落格式（需要具体出错位置时直接调用 compile_paragraphs）"""
     try:
-        for para in paragraphs:
-            para_type = para.get("type", "paragraph")
-            
-            if para_type == "note":
-                # 内链笔记节点验证
-                if "note_id" not in para or not isinstance(para["note_id"], str):
-                    return False
-            elif para_type == "file":
-                # 文件段落验证
-                if "file_type" not in para or para["file_type"] not in ["image", "audio", "pdf"]:
-                    return False
-                if "source_type" not in para or para["source_type"] not in ["local", "url"]:
-                    return False
-                if "source_path" not in para or not isinstance(para["source_path"], str):
-                    return False
-                # metadata是可选的
-                if "metadata" in para and not isinstance(para["metadata"], dict):
-                    return False
-            elif para_type in ["paragraph", "quote"] or "texts" in para:
-                # 文本段落验证（普通段落或引用段落）
-                if "texts" not in para:
-                    return False
-                for text in para["texts"]:
-                    if "text" not in text or not isinstance(text["text"], str):
-                        return False
-                    # 验证可选字段
-                    if "bold" in text and not isinstance(text["bold"], bool):
-                        return False
-                    if "highlight" in text and not isinstance(text["highlight"], bool):
-                        return False
-                    if "link" in text and not isinstance(text["link"], str):
-                        return False
-            # 如果都不匹配，可能是处理后的文件节点，跳过验证
-        return True
-    except:
+        compile_paragraphs(paragraphs)
+    except NoteAtomError:
         return False
+    return True
+
+def init_clients(config: Config) -> Optional[LocalState]:
+    """
+    按配置创建全局API客户端，多租户模式下创建租户客户端池
+    
+    HTTP传输的每个worker进程各自调用一次，连接池不跨进程共享。
+    
+    返回: 多租户模式下所有租户共用的本地状态（单租户时为None）
+    """
+    global mowen_api, tenant_pool
+    if not config.multi_tenant:
+        # 初始化API客户端
+        mowen_api = MowenAPI(config.api_key, config.base_url, config)
+        logger.info("墨问API客户端初始化完成")
+        return None
+    
+    # 各租户共用本地状态，连接池、限频器和配额按API密钥分开
+    shared_state = LocalState.open(config, get_codec(config.json_codec))
+    tenant_pool = TenantPool(
+        lambda api_key: MowenAPI(api_key, config.base_url, config, state=shared_state),
+        max_tenants=config.tenant_max,
+        idle_ttl=config.tenant_idle_ttl,
+    )
+    logger.info(f"多租户模式：API密钥从请求头读取，最多保留 {config.tenant_max} 个租户")
+    return shared_state
 
-def main():
+@asynccontextmanager
+async def server_lifespan(config: Config, shared_state: Optional[LocalState] = None) -> AsyncIterator[None]:
+    """启动后台维护任务，退出时发送未完成的编辑并释放连接池（各种传输方式共用）"""
+    background = []
+    if config.outbox_enabled:
+        # 启动时先发送上次进程退出前未完成的笔记写入
+        background.append(asyncio.create_task(run_outbox_flusher(config.outbox_flush_interval)))
+    if tenant_pool is not None:
+        background.append(asyncio.create_task(tenant_pool.run_reaper()))
+    try:
+        yield
+    finally:
+        # 发送合并窗口中尚未发送的编辑
+        await asyncio.gather(*(api_client.edit_coalescer.drain() for api_client in active_api_clients()))
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        if job_manager is not None:
+            await job_manager.aclose()
+        if tenant_pool is not None:
+            await tenant_pool.aclose()
+        if mowen_api is not None:
+            await mowen_api.aclose()
+        if shared_state is not None:
+            shared_state.shutdown()
+        logger.info("墨问API连接池已关闭")
+
+async def _run_server(config: Config, shared_state: Optional[LocalState] = None) -> None:
+    """在同一个事件循环中通过stdio运行MCP服务器，并在退出时释放连接池"""
+    async with server_lifespan(config, shared_state):
+        await mcp.run_stdio_async()
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """解析命令行参数，未指定的参数使用环境变量（MOWEN_TRANSPORT 等）中的配置"""
+    config = Config()
+    parser = argparse.ArgumentParser(prog="mowen-mcp-server", description="墨问笔记MCP服务器")
+    parser.add_argument(
+        "--transport", choices=TRANSPORTS, default=config.transport,
+        help="传输方式：stdio（默认，由MCP客户端启动）、streamable-http 或 sse（作为常驻网络服务）",
+    )
+    parser.add_argument("--host", default=config.host, help="HTTP传输监听的地址（默认 127.0.0.1）")
+    parser.add_argument("--port", type=int, default=config.port, help="HTTP传输监听的端口（默认 8000）")
+    parser.add_argument(
+        "--workers", type=int, default=config.workers,
+        help="HTTP传输的worker进程数（默认 1），每个worker有自己的墨问连接池",
+    )
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
     """主函数：启动MCP服务器"""
-    global mowen_api
+    args = parse_args(argv)
+    # 命令行参数写回环境变量，HTTP传输的worker进程从环境变量读取同样的配置
+    os.environ.update(
+        MOWEN_TRANSPORT=args.transport,
+        MOWEN_HOST=args.host,
+        MOWEN_PORT=str(args.port),
+        MOWEN_WORKERS=str(args.workers),
+    )
     
     # 获取API密钥
-    api_key = os.getenv("MOWEN_API_KEY")
-    if not api_key:
+    config = Config()
+    if not config.validate():
         logger.error("未设置API密钥。请先设置MOWEN_API_KEY环境变量。")
         return
     
-    # 初始化API客户端
-    mowen_api = MowenAPI(api_key)
-    logger.info("墨问API客户端初始化完成")
+    if config.transport != "stdio":
+        from .transport import serve_http
+        serve_http(config)
+        return
+    
+    if config.multi_tenant:
+        logger.error("stdio传输没有请求头，多租户模式需要使用 --transport streamable-http 或 sse")
+        return
+    shared_state = init_clients(config)
     
     # 启动服务器
     logger.info("正在启动墨问MCP服务社区版...")
-    mcp.run()
+    asyncio.run(_run_server(config, shared_state))
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,98 @@
+"""
+本地状态
+
+上传缓存、待发送队列、笔记副本和幂等记录都保存在 state_dir 下同一个SQLite数据库中，
+每条记录都带有账户标识（API密钥的摘要）。多租户模式下所有租户共用这里打开的一组连接和
+图片预处理进程池，各租户的数据按账户标识隔离，租户数增加时不会成倍占用连接和进程。
+"""
+
+import logging
+import sqlite3
+from dataclasses import dataclass
+from typing import Optional
+
+from .cache import UploadCache, UrlUploadCache
+from .codec import JSONCodec
+from .config import Config
+from .idempotency import IdempotencyStore
+from .imageprep import OUTPUT_FORMATS, ImageOptions, ImagePreprocessor, pillow_available
+from .mirror import NoteMirror
+from .outbox import Outbox
+
+logger = logging.getLogger("mowen-mcp-server")
+
+
+@dataclass
+class LocalState:
+    """本地状态存储，未启用或初始化失败的存储为None"""
+    upload_cache: Optional[UploadCache] = None
+    url_cache: Optional[UrlUploadCache] = None
+    outbox: Optional[Outbox] = None
+    image_preprocessor: Optional[ImagePreprocessor] = None
+    mirror: Optional[NoteMirror] = None
+    idempotency: Optional[IdempotencyStore] = None
+
+    @classmethod
+    def open(cls, config: Config, codec: JSONCodec) -> "LocalState":
+        """按配置打开各个本地存储，单个存储初始化失败时只禁用该存储"""
+        state = cls()
+        db_path = config.state_dir / "cache.sqlite3"
+        if config.upload_cache_enabled:
+            try:
+                state.upload_cache = UploadCache(
+                    db_path,
+                    ttl=config.upload_cache_ttl,
+                    max_entries=config.upload_cache_max_entries,
+                )
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"⚠️ 上传缓存初始化失败，已禁用: {e}")
+        if config.url_cache_enabled:
+            try:
+                state.url_cache = UrlUploadCache(
+                    db_path,
+                    max_age=config.url_cache_max_age,
+                    max_entries=config.url_cache_max_entries,
+                )
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"⚠️ URL上传缓存初始化失败，已禁用: {e}")
+        if config.outbox_enabled:
+            try:
+                state.outbox = Outbox(db_path)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"⚠️ 本地待发送队列初始化失败，已禁用: {e}")
+        if config.image_preprocess:
+            if config.image_format not in OUTPUT_FORMATS:
+                logger.warning(f"⚠️ 不支持的MOWEN_IMAGE_FORMAT: {config.image_format}，使用webp")
+                config.image_format = "webp"
+            if not pillow_available():
+                logger.warning("⚠️ 已开启MOWEN_IMAGE_PREPROCESS但未安装Pillow，图片将原样上传（pip install 'mowen-mcp-server[images]'）")
+            else:
+                try:
+                    state.image_preprocessor = ImagePreprocessor(
+                        config.state_dir / "images",
+                        ImageOptions(
+                            max_dimension=config.image_max_dimension,
+                            format=config.image_format,
+                            quality=config.image_quality,
+                        ),
+                        min_bytes=config.image_min_bytes,
+                        workers=config.image_workers,
+                    )
+                except OSError as e:
+                    logger.warning(f"⚠️ 图片预处理缓存目录初始化失败，已禁用: {e}")
+        if config.mirror_enabled:
+            try:
+                state.mirror = NoteMirror(db_path, codec, max_entries=config.mirror_max_entries)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"⚠️ 笔记本地副本初始化失败，已禁用: {e}")
+        if config.idempotency_window > 0:
+            try:
+                state.idempotency = IdempotencyStore(db_path, window=config.idempotency_window)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"⚠️ 幂等记录初始化失败，已禁用: {e}")
+        return state
+
+    def shutdown(self) -> None:
+        """关闭图片预处理进程池"""
+        if self.image_preprocessor is not None:
+            self.image_preprocessor.shutdown()
@@ -0,0 +1,52 @@
+"""本地SQLite存储的公共工具"""
+
+import asyncio
+import functools
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+# 本地状态（配额、缓存、待发送队列、副本、幂等记录）的数据库操作都在这一个线程中按顺序执行：
+# 等待其他进程的写锁时不阻塞事件循环，各存储的连接也不会被两个线程同时使用
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mowen-state")
+
+
+def connect(path: Path, timeout: float = 30.0) -> sqlite3.Connection:
+    """
+    打开本地状态数据库
+
+    - 自动创建所在目录
+    - 使用 WAL 日志模式，多个进程可以同时读写同一个数据库
+    - 自动提交模式，需要事务时显式 BEGIN
+    - timeout: 等待其他进程释放写锁的最长时间（秒），超时抛出 sqlite3.OperationalError
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=timeout, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+@contextmanager
+def transaction(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """
+    写事务：开始时即获取写锁（BEGIN IMMEDIATE），其他进程的写事务排队等待，
+    用于跨进程的“读取-修改-写入”
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """在本地状态线程中执行阻塞的数据库操作"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
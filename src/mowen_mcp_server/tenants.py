@@ -0,0 +1,164 @@
+"""
+多租户模式
+
+单租户时整个进程使用 MOWEN_API_KEY 对应的一个客户端，团队中每个用户都要单独运行一个进程。
+开启多租户模式后，API密钥来自每个MCP请求的HTTP请求头，服务器按密钥维护客户端的LRU：
+
+- 每个租户有自己的连接池、限频器、重试预算和配额统计，互不影响
+- 本地状态（上传缓存、待发送队列等）共用一份，数据按账户标识隔离
+- 超过 max_tenants 时淘汰最久没有使用的空闲租户，空闲超过 idle_ttl 的租户定期关闭
+
+正在发送请求或有等待合并发送的编辑的租户不会被淘汰；被淘汰的租户下次请求时重新创建。
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Generic, List, Optional, Protocol, Set, TypeVar
+
+logger = logging.getLogger("mowen-mcp-server")
+
+# 携带API密钥的请求头：X-Mowen-Api-Key: <密钥> 或 Authorization: Bearer <密钥>
+API_KEY_HEADER = "x-mowen-api-key"
+
+
+class TenantClient(Protocol):
+    """租户客户端需要提供的接口（MowenAPI）"""
+
+    # 最近一次请求结束的时间（time.monotonic）
+    last_active: float
+
+    @property
+    def busy(self) -> bool: ...
+
+    async def aclose(self) -> None: ...
+
+
+ClientT = TypeVar("ClientT", bound=TenantClient)
+
+
+def api_key_from_headers(headers) -> Optional[str]:
+    """从HTTP请求头中取出墨问API密钥，没有时返回None"""
+    api_key = headers.get(API_KEY_HEADER)
+    if not api_key:
+        scheme, _, token = headers.get("authorization", "").partition(" ")
+        api_key = token if scheme.lower() == "bearer" else None
+    if not api_key:
+        return None
+    return api_key.strip() or None
+
+
+@dataclass
+class _Tenant(Generic[ClientT]):
+    client: ClientT
+    last_used: float
+
+
+class TenantPool(Generic[ClientT]):
+    """API密钥 -> 租户客户端的LRU"""
+
+    def __init__(
+        self,
+        factory: Callable[[str], ClientT],
+        max_tenants: int = 32,
+        idle_ttl: float = 900.0,
+        min_idle: float = 60.0,
+    ):
+        """
+        参数:
+        - factory: 为API密钥创建客户端
+        - max_tenants: 最多同时保留的租户数
+        - idle_ttl: 租户空闲超过这个时间（秒）后关闭
+        - min_idle: 租户数超过上限时，只淘汰空闲超过这个时间（秒）的租户，
+          避免刚取出客户端、还没有发出请求的租户被淘汰；没有可淘汰的租户时暂时超出上限
+        """
+        self.factory = factory
+        self.max_tenants = max(1, max_tenants)
+        self.idle_ttl = idle_ttl
+        self.min_idle = min(min_idle, idle_ttl)
+        self._tenants: "OrderedDict[str, _Tenant[ClientT]]" = OrderedDict()
+        self._closing: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._tenants)
+
+    def get(self, api_key: str) -> ClientT:
+        """取出API密钥对应的客户端，不存在时创建"""
+        now = time.monotonic()
+        tenant = self._tenants.get(api_key)
+        if tenant is not None:
+            self._tenants.move_to_end(api_key)
+            tenant.last_used = now
+            return tenant.client
+        tenant = _Tenant(self.factory(api_key), now)
+        self._tenants[api_key] = tenant
+        logger.info(f"👤 新租户接入，当前租户数 {len(self._tenants)}")
+        self._evict_overflow(now)
+        return tenant.client
+
+    def clients(self) -> List[ClientT]:
+        """当前保留的所有租户客户端"""
+        return [tenant.client for tenant in self._tenants.values()]
+
+    def _idle_for(self, tenant: "_Tenant[ClientT]", now: float) -> Optional[float]:
+        """租户的空闲时间，忙碌时返回None"""
+        if tenant.client.busy:
+            return None
+        return now - max(tenant.last_used, tenant.client.last_active)
+
+    def _evict_overflow(self, now: float) -> None:
+        """租户数超过上限时按最久未使用的顺序淘汰空闲租户"""
+        overflow = len(self._tenants) - self.max_tenants
+        if overflow <= 0:
+            return
+        for api_key, tenant in list(self._tenants.items()):
+            if overflow <= 0:
+                break
+            idle = self._idle_for(tenant, now)
+            if idle is not None and idle >= self.min_idle:
+                self._remove(api_key)
+                overflow -= 1
+        if overflow > 0:
+            logger.warning(f"⚠️ 租户数 {len(self._tenants)} 超过上限 {self.max_tenants}，暂时没有可淘汰的空闲租户")
+
+    def _remove(self, api_key: str) -> None:
+        tenant = self._tenants.pop(api_key)
+        task = asyncio.create_task(tenant.client.aclose())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def evict_idle(self) -> int:
+        """关闭空闲超过 idle_ttl 的租户，返回关闭的租户数"""
+        now = time.monotonic()
+        expired = [
+            api_key for api_key, tenant in self._tenants.items()
+            if (self._idle_for(tenant, now) or 0.0) >= self.idle_ttl
+        ]
+        for api_key in expired:
+            self._remove(api_key)
+        if expired:
+            logger.info(f"👤 关闭空闲租户 {len(expired)} 个，当前租户数 {len(self._tenants)}")
+        await self._wait_closing()
+        return len(expired)
+
+    async def run_reaper(self) -> None:
+        """定期关闭空闲租户"""
+        interval = max(1.0, min(60.0, self.idle_ttl / 2))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.evict_idle()
+            except Exception as e:
+                logger.error(f"❌ 清理空闲租户失败: {e}")
+
+    async def _wait_closing(self) -> None:
+        if self._closing:
+            await asyncio.gather(*list(self._closing), return_exceptions=True)
+
+    async def aclose(self) -> None:
+        """关闭所有租户"""
+        for api_key in list(self._tenants):
+            self._remove(api_key)
+        await self._wait_closing()
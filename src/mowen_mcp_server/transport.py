@@ -0,0 +1,162 @@
+"""
+HTTP传输（streamable-http/sse）
+
+stdio 传输下每个MCP客户端会话都要启动一个新的Python进程，承担解释器启动和导入的开销，
+连接池也随进程结束而丢失。HTTP传输把服务器作为常驻服务运行，可以放在负载均衡之后供多个客户端共用：
+
+- 由 uvicorn 启动 workers 个进程，每个进程调用 create_app 创建自己的墨问客户端和连接池
+- 多个 worker 时使用无状态的 streamable-http 会话，同一会话的请求可以由任意 worker 处理
+- 收到 SIGTERM/SIGINT 后停止接受新连接，等待进行中的请求完成（最多 shutdown_timeout 秒），
+  然后发送合并窗口中尚未发送的编辑并关闭连接池
+
+访问控制：单租户模式下所有请求都使用运营者的 MOWEN_API_KEY，因此监听非本机地址时必须设置
+MOWEN_HTTP_TOKEN，每个请求都要携带 Authorization: Bearer <令牌>；多租户模式下每个请求携带自己的
+墨问API密钥。Host 请求头始终按允许列表校验（本机地址、监听地址和 MOWEN_HTTP_ALLOWED_HOSTS）。
+
+后台任务和编辑合并只在各自的 worker 进程内进行；多 worker 时用 get_job_status 查询后台任务
+可能落到其他 worker 上而查不到，需要后台任务时建议使用单 worker 或开启会话粘滞的负载均衡。
+"""
+
+import hmac
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
+
+import uvicorn
+from mcp.server.transport_security import TransportSecuritySettings
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .config import Config
+from .server import init_clients, mcp, server_lifespan
+
+logger = logging.getLogger("mowen-mcp-server")
+
+# 本机地址：监听这些地址时只有本机可以访问
+_LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+# 监听所有地址
+_WILDCARD_HOSTS = ("0.0.0.0", "::", "")
+
+
+def _host_patterns(host: str) -> List[str]:
+    """Host 请求头的允许值：不带端口（经过反向代理的默认端口）和任意端口"""
+    host = f"[{host}]" if ":" in host and not host.startswith("[") else host
+    return [host, f"{host}:*"]
+
+
+def security_settings(config: Config) -> TransportSecuritySettings:
+    """按监听地址和 MOWEN_HTTP_ALLOWED_HOSTS 生成 DNS 重绑定防护的允许列表"""
+    hosts = list(_LOOPBACK_HOSTS)
+    if config.host not in _LOOPBACK_HOSTS + _WILDCARD_HOSTS:
+        hosts.append(config.host)
+    allowed_hosts: List[str] = []
+    allowed_origins: List[str] = []
+    for host in hosts:
+        patterns = _host_patterns(host)
+        allowed_hosts.extend(patterns)
+        allowed_origins.extend(f"{scheme}://{pattern}" for scheme in ("http", "https") for pattern in patterns)
+    for host in config.http_allowed_hosts:
+        # 配置中的值可能已经带端口
+        patterns = [host] if ":" in host and not host.startswith("[") else _host_patterns(host)
+        allowed_hosts.extend(patterns)
+        allowed_origins.extend(f"{scheme}://{pattern}" for scheme in ("http", "https") for pattern in patterns)
+    return TransportSecuritySettings(
+        enable_dns_rebinding_protection=True,
+        allowed_hosts=allowed_hosts,
+        allowed_origins=allowed_origins,
+    )
+
+
+def exposure_error(config: Config) -> Optional[str]:
+    """HTTP传输的访问控制配置不安全时返回错误信息"""
+    if config.host in _LOOPBACK_HOSTS or config.multi_tenant or config.http_token:
+        return None
+    return (
+        f"监听非本机地址 {config.host} 时，任何能访问该端口的人都可以用 MOWEN_API_KEY 操作笔记。"
+        "请设置 MOWEN_HTTP_TOKEN（客户端携带 Authorization: Bearer <令牌>），"
+        "或开启 MOWEN_MULTI_TENANT 让每个请求携带自己的墨问API密钥"
+    )
+
+
+class BearerTokenMiddleware:
+    """要求每个HTTP请求携带 Authorization: Bearer <令牌>，否则返回401"""
+
+    def __init__(self, app: ASGIApp, token: str):
+        self.app = app
+        self._expected = f"Bearer {token}".encode("utf-8")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            provided = dict(scope.get("headers") or []).get(b"authorization", b"")
+            if not hmac.compare_digest(provided, self._expected):
+                response = JSONResponse(
+                    {"error": "unauthorized", "message": "缺少或错误的访问令牌（Authorization: Bearer <MOWEN_HTTP_TOKEN>）"},
+                    status_code=401,
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+def create_app() -> Starlette:
+    """
+    创建当前 worker 进程的 ASGI 应用（uvicorn 在每个 worker 进程中调用）
+
+    配置从环境变量读取，命令行参数已经由 main 写回环境变量。
+    """
+    config = Config()
+    error = exposure_error(config)
+    if error is not None:
+        raise RuntimeError(error)
+    mcp.settings.host = config.host
+    mcp.settings.port = config.port
+    mcp.settings.stateless_http = config.http_stateless or config.workers > 1
+    mcp.settings.transport_security = security_settings(config)
+
+    shared_state = init_clients(config)
+    app = mcp.sse_app() if config.transport == "sse" else mcp.streamable_http_app()
+    mcp_lifespan = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app: Starlette) -> AsyncIterator[None]:
+        # 外层先启动后台维护任务，退出时在MCP会话全部关闭之后再释放连接池
+        async with server_lifespan(config, shared_state):
+            async with mcp_lifespan(app):
+                yield
+
+    app.router.lifespan_context = lifespan
+    if config.http_token:
+        if config.multi_tenant:
+            # 多租户模式下 Authorization 请求头携带的是各用户的墨问API密钥
+            logger.warning("⚠️ 多租户模式下不使用 MOWEN_HTTP_TOKEN，每个请求的墨问API密钥即为凭证")
+        else:
+            app.add_middleware(BearerTokenMiddleware, token=config.http_token)
+    return app
+
+
+def serve_http(config: Config) -> None:
+    """以 streamable-http 或 sse 传输运行服务器，直到收到退出信号"""
+    if config.transport == "sse" and config.workers > 1:
+        # SSE 的事件流和消息请求必须由同一个进程处理
+        logger.error("sse 传输不支持多个worker，请使用 --transport streamable-http 或 --workers 1")
+        return
+    error = exposure_error(config)
+    if error is not None:
+        logger.error(error)
+        return
+    path = mcp.settings.sse_path if config.transport == "sse" else mcp.settings.streamable_http_path
+    logger.info(
+        f"正在启动墨问MCP服务社区版（{config.transport}）: http://{config.host}:{config.port}{path}，"
+        f"worker 数 {config.workers}"
+    )
+    uvicorn.run(
+        "mowen_mcp_server.transport:create_app",
+        factory=True,
+        host=config.host,
+        port=config.port,
+        workers=max(1, config.workers),
+        timeout_graceful_shutdown=config.shutdown_timeout,
+        log_level=logging.getLevelName(logger.getEffectiveLevel()).lower(),
+    )
@@ -0,0 +1,48 @@
+"""
+测试公共夹具
+
+每个测试使用独立的临时状态目录（MOWEN_STATE_DIR），请求发往 benchmarks/stub_server.py 中的本地替身服务器，
+不会读写 ~/.mowen-mcp-server，也不会访问真实的墨问API。
+"""
+
+from pathlib import Path
+from typing import AsyncIterator
+
+import pytest
+from stub_server import StubMowenServer
+
+from mowen_mcp_server import server
+from mowen_mcp_server.config import Config
+
+
+@pytest.fixture(autouse=True)
+def state_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """临时状态目录，并关闭限频、缩短重试等待，让测试快速完成"""
+    path = tmp_path / "state"
+    monkeypatch.setenv("MOWEN_API_KEY", "test-key")
+    monkeypatch.setenv("MOWEN_STATE_DIR", str(path))
+    monkeypatch.setenv("MOWEN_RATE_LIMIT_INTERVAL", "0")
+    monkeypatch.setenv("MOWEN_RETRY_BASE_DELAY", "0.01")
+    monkeypatch.setenv("MOWEN_RETRY_MAX_DELAY", "0.02")
+    return path
+
+
+@pytest.fixture
+def config(state_dir: Path) -> Config:
+    return Config()
+
+
+@pytest.fixture
+async def stub() -> AsyncIterator[StubMowenServer]:
+    async with StubMowenServer(handshake_delay=0) as stub_server:
+        yield stub_server
+
+
+@pytest.fixture
+async def api(stub: StubMowenServer, config: Config, monkeypatch: pytest.MonkeyPatch) -> AsyncIterator[server.MowenAPI]:
+    """指向替身服务器的客户端，同时作为MCP工具使用的全局客户端"""
+    client = server.MowenAPI("test-key", stub.base_url, config)
+    monkeypatch.setattr(server, "mowen_api", client)
+    yield client
+    await client.aclose()
+
@@ -0,0 +1,107 @@
+"""create_note 的幂等保护：重复请求不会重复创建笔记"""
+
+import asyncio
+
+import pytest
+
+from mowen_mcp_server import server
+from mowen_mcp_server.noteatom import compile_paragraphs
+from mowen_mcp_server.outbox import NoteDeferredError, NoteUnconfirmedError
+
+SETTINGS = {"autoPublish": False, "tags": []}
+
+
+def paragraphs(text: str):
+    return compile_paragraphs([{"texts": [{"text": text}]}])
+
+
+def tool_text(result) -> str:
+    content = result[0] if isinstance(result, tuple) else result
+    return content[0].text
+
+
+def defer_creates(api, stub) -> None:
+    """让下一次创建的每次尝试都被限频拦截，最终转入待发送队列"""
+    stub.failures["note/create"] = [429] * api.retry.policy("note/create").max_attempts
+
+
+async def test_repeated_tool_call_creates_one_note(api, stub):
+    arguments = {"paragraphs": [{"texts": [{"text": "hello"}]}]}
+
+    first = tool_text(await server.mcp.call_tool("create_note", arguments))
+    second = tool_text(await server.mcp.call_tool("create_note", arguments))
+
+    assert first.startswith("✅ 笔记创建成功")
+    assert second.startswith("✅ 笔记已创建（重复请求")
+    assert stub.count("note/create") == 1
+
+
+async def test_concurrent_duplicates_share_one_request(api, stub):
+    stub.response_delay = 0.2
+
+    results = await asyncio.gather(
+        *(server.create_note_once(api, paragraphs("hello"), SETTINGS) for _ in range(3))
+    )
+
+    assert {result["noteId"] for _, result in results} == {"stub-note-id"}
+    assert stub.count("note/create") == 1
+
+
+async def test_explicit_key_overrides_content(api, stub):
+    await server.create_note_once(api, paragraphs("a"), SETTINGS, idempotency_key="k1")
+    body, result = await server.create_note_once(api, paragraphs("b"), SETTINGS, idempotency_key="k1")
+    await server.create_note_once(api, paragraphs("a"), SETTINGS, idempotency_key="k2")
+
+    assert body is None and result["noteId"] == "stub-note-id"
+    assert stub.count("note/create") == 2
+
+
+async def test_duplicate_of_queued_create_waits_for_replay(api, stub):
+    defer_creates(api, stub)
+    with pytest.raises(NoteDeferredError) as first:
+        await server.create_note_once(api, paragraphs("queued"), SETTINGS)
+    sent = stub.count("note/create")
+
+    with pytest.raises(NoteDeferredError) as duplicate:
+        await server.create_note_once(api, paragraphs("queued"), SETTINGS)
+    assert duplicate.value.entry_id == first.value.entry_id
+    assert stub.count("note/create") == sent
+
+    api.outbox._conn.execute("UPDATE note_outbox SET next_attempt_at=0")
+    assert await server.flush_outbox(api) == 1
+    body, result = await server.create_note_once(api, paragraphs("queued"), SETTINGS)
+    assert body is None and result["noteId"] == "stub-note-id"
+    assert stub.count("note/create") == sent + 1
+
+
+async def test_duplicate_of_unconfirmed_create_is_refused(api, stub):
+    stub.response_delay = 5
+    task = asyncio.create_task(server.create_note_once(api, paragraphs("lost"), SETTINGS))
+    while not stub.count("note/create"):
+        await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    stub.response_delay = 0
+
+    # 原请求可能已经创建了笔记，不能再自动创建一篇
+    with pytest.raises(NoteUnconfirmedError):
+        await server.create_note_once(api, paragraphs("lost"), SETTINGS)
+    assert stub.count("note/create") == 1
+
+    # 换一个幂等键表示调用方确认需要重新创建
+    await server.create_note_once(api, paragraphs("lost"), SETTINGS, idempotency_key="retry-1")
+    assert stub.count("note/create") == 2
+
+
+async def test_permanently_failed_replay_allows_new_create(api, stub):
+    defer_creates(api, stub)
+    with pytest.raises(NoteDeferredError):
+        await server.create_note_once(api, paragraphs("rejected"), SETTINGS)
+
+    stub.failures["note/create"] = [400]
+    api.outbox._conn.execute("UPDATE note_outbox SET next_attempt_at=0")
+    assert await server.flush_outbox(api) == 0
+
+    body, result = await server.create_note_once(api, paragraphs("rejected"), SETTINGS)
+    assert body is not None and result["noteId"] == "stub-note-id"
@@ -0,0 +1,84 @@
+"""基于笔记本地副本的修改工具：append_to_note、insert_paragraphs、replace_paragraphs"""
+
+import pytest
+
+from mowen_mcp_server import server
+
+
+def tool_text(result) -> str:
+    content = result[0] if isinstance(result, tuple) else result
+    return content[0].text
+
+
+def texts(*values: str):
+    return [{"texts": [{"text": value}]} for value in values]
+
+
+def mirror_texts(api, note_id: str):
+    """本地副本中每个段落的文字"""
+    body = api.mirror.get(api.account_id, note_id)
+    return ["".join(node.get("text", "") for node in paragraph.get("content") or ()) for paragraph in body["content"]]
+
+
+@pytest.fixture
+async def note(api, stub) -> str:
+    """通过本服务器创建的笔记，本地有内容副本"""
+    text = tool_text(await server.mcp.call_tool("create_note", {"paragraphs": texts("a", "b", "c")}))
+    assert text.startswith("✅ 笔记创建成功")
+    return "stub-note-id"
+
+
+async def test_append_sends_full_content(api, stub, note):
+    text = tool_text(await server.mcp.call_tool("append_to_note", {"note_id": note, "paragraphs": texts("d")}))
+
+    assert text.startswith("✅ 已追加 1 段")
+    assert mirror_texts(api, note) == ["a", "b", "c", "d"]
+    assert stub.count("note/edit") == 1
+
+
+async def test_insert_and_replace(api, stub, note):
+    await server.mcp.call_tool("insert_paragraphs", {"note_id": note, "position": 1, "paragraphs": texts("x")})
+    assert mirror_texts(api, note) == ["a", "x", "b", "c"]
+
+    await server.mcp.call_tool(
+        "replace_paragraphs", {"note_id": note, "start": 2, "count": 2, "paragraphs": texts("y")}
+    )
+    assert mirror_texts(api, note) == ["a", "x", "y"]
+
+    await server.mcp.call_tool("replace_paragraphs", {"note_id": note, "start": 0, "paragraphs": []})
+    assert mirror_texts(api, note) == ["x", "y"]
+    assert stub.count("note/edit") == 3
+
+
+async def test_out_of_range_index_is_rejected(api, stub, note):
+    text = tool_text(
+        await server.mcp.call_tool("insert_paragraphs", {"note_id": note, "position": 4, "paragraphs": texts("x")})
+    )
+
+    assert text.startswith("❌ 段落下标超出范围")
+    assert stub.count("note/edit") == 0
+
+
+async def test_unchanged_edit_is_skipped(api, stub, note):
+    text = tool_text(
+        await server.mcp.call_tool("replace_paragraphs", {"note_id": note, "start": 1, "paragraphs": texts("b")})
+    )
+
+    assert text.startswith("✅ 笔记内容没有变化")
+    assert stub.count("note/edit") == 0
+
+
+async def test_unknown_note_has_no_mirror(api, stub):
+    text = tool_text(await server.mcp.call_tool("append_to_note", {"note_id": "other", "paragraphs": texts("d")}))
+
+    assert text.startswith("❌ 本地没有笔记 other 的内容副本")
+    assert stub.count("note/edit") == 0
+
+
+async def test_disabled_mirror(api, stub, monkeypatch):
+    monkeypatch.setattr(api, "mirror", None)
+
+    text = tool_text(await server.mcp.call_tool("append_to_note", {"note_id": "n", "paragraphs": texts("d")}))
+
+    assert text.startswith("❌ 笔记本地副本未启用")
+    assert stub.count("note/edit") == 0
@@ -0,0 +1,130 @@
+"""本地待发送队列：租约、崩溃后的重放，以及不会重复发送正在处理或已经发出的写入"""
+
+import asyncio
+import time
+
+import pytest
+
+from mowen_mcp_server import server
+from mowen_mcp_server.noteatom import compile_paragraphs
+from mowen_mcp_server.outbox import (
+    _OWNER,
+    OUTBOX_FAILED,
+    OUTBOX_PENDING,
+    OUTBOX_SENDING,
+    UNCONFIRMED_CREATE,
+    NoteDeferredError,
+    Outbox,
+)
+
+# 当前主机上不存在的进程，模拟已经退出的服务器进程
+DEAD_OWNER = _OWNER.rpartition(":")[0] + ":999999999"
+
+
+def paragraphs(text: str):
+    return compile_paragraphs([{"texts": [{"text": text}]}])
+
+
+def make_due(outbox: Outbox) -> None:
+    """跳过退避等待，让所有待发送记录立即到期"""
+    outbox._conn.execute("UPDATE note_outbox SET next_attempt_at=0")
+
+
+async def test_deferred_edit_is_replayed_once(api, stub):
+    stub.failures["note/edit"] = [503] * api.retry.policy("note/edit").max_attempts
+
+    with pytest.raises(NoteDeferredError) as excinfo:
+        await server.write_note(api, "edit_note", paragraphs("v1"), note_id="note-1")
+
+    assert api.outbox.status(excinfo.value.entry_id)[0] == OUTBOX_PENDING
+    make_due(api.outbox)
+    assert await server.flush_outbox(api) == 1
+    assert api.outbox.status(excinfo.value.entry_id) is None
+    # 队列已经清空，再次检查不会重发
+    sent = stub.count("note/edit")
+    assert await server.flush_outbox(api) == 0
+    assert stub.count("note/edit") == sent
+
+
+async def test_entry_being_processed_is_not_claimed(api):
+    outbox = api.outbox
+    entry = outbox.add(api.account_id, "edit_note", paragraphs("v1"), note_id="note-1")
+    far_future = time.time() + 3600
+
+    async with outbox.hold(entry):
+        # 即使租约已经过期，当前进程正在处理的记录也不会被再次领取
+        assert outbox.claim(api.account_id, now=far_future) is None
+
+    assert outbox.claim(api.account_id, now=far_future).entry_id == entry.entry_id
+
+
+async def test_heartbeat_keeps_lease_alive(state_dir):
+    path = state_dir / "cache.sqlite3"
+    outbox = Outbox(path, lease=0.3)
+    # 另一个进程打开的同一个队列
+    other = Outbox(path, lease=0.3)
+    held = outbox.add("acc", "edit_note", paragraphs("held"), note_id="note-1")
+    idle = outbox.add("acc", "edit_note", paragraphs("idle"), note_id="note-2")
+
+    async with outbox.hold(held):
+        await asyncio.sleep(0.6)
+        claimed = other.claim("acc")
+        # 没有续约的记录租约已过期，可以被领取；持有中的记录一直在续约
+        assert claimed is not None and claimed.entry_id == idle.entry_id
+        assert other.claim("acc") is None
+
+
+async def test_create_interrupted_after_sending_is_not_replayed(api, stub):
+    # 上一个进程把创建请求标记为发送中后退出，结果未知
+    outbox = api.outbox
+    entry = outbox.add(api.account_id, "create_note", paragraphs("v1"), settings={})
+    outbox.mark_sending(entry)
+    outbox._conn.execute("UPDATE note_outbox SET owner=? WHERE entry_id=?", (DEAD_OWNER, entry.entry_id))
+
+    assert await server.flush_outbox(api) == 0
+
+    assert stub.count("note/create") == 0
+    assert outbox.status(entry.entry_id) == (OUTBOX_FAILED, UNCONFIRMED_CREATE)
+
+
+async def test_create_in_flight_in_live_process_is_left_alone(api, stub):
+    outbox = api.outbox
+    entry = outbox.add(api.account_id, "create_note", paragraphs("v1"), settings={})
+    outbox.mark_sending(entry)
+
+    assert await server.flush_outbox(api) == 0
+
+    assert stub.count("note/create") == 0
+    assert outbox.status(entry.entry_id)[0] == OUTBOX_SENDING
+
+
+async def test_cancelled_create_is_marked_unconfirmed(api, stub):
+    stub.response_delay = 5
+    task = asyncio.create_task(server.write_note(api, "create_note", paragraphs("v1"), settings={}))
+    while not stub.count("note/create"):
+        await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    counts = api.outbox.counts(api.account_id)
+    assert counts == {OUTBOX_FAILED: 1}
+    stub.response_delay = 0
+    make_due(api.outbox)
+    assert await server.flush_outbox(api) == 0
+    assert stub.count("note/create") == 1
+
+
+async def test_successful_edit_drops_older_pending_edits(api, stub):
+    stub.failures["note/edit"] = [503] * api.retry.policy("note/edit").max_attempts
+    with pytest.raises(NoteDeferredError):
+        await server.write_note(api, "edit_note", paragraphs("old"), note_id="note-1")
+
+    await server.write_note(api, "edit_note", paragraphs("new"), note_id="note-1")
+
+    # 旧的编辑如果之后重发会覆盖新内容
+    assert api.outbox.counts(api.account_id) == {}
+    make_due(api.outbox)
+    sent = stub.count("note/edit")
+    assert await server.flush_outbox(api) == 0
+    assert stub.count("note/edit") == sent
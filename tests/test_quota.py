@@ -0,0 +1,106 @@
+"""每日配额统计：共用配额项、低优先级预留、失败归还和多进程预占"""
+
+import multiprocessing
+from pathlib import Path
+
+import pytest
+
+from mowen_mcp_server.errors import MowenAPIError
+from mowen_mcp_server.quota import QuotaExceededError, QuotaTracker
+
+
+def admit_many(path: str, attempts: int) -> int:
+    """在子进程中尽量多地预占并确认 note/create 配额，返回成功的次数"""
+    quota = QuotaTracker(Path(path), limits={"note/create": 60})
+    admitted = 0
+    for i in range(attempts):
+        try:
+            quota.admit("note/create")
+        except QuotaExceededError:
+            continue
+        if i % 5 == 0:
+            quota.release("note/create")
+        else:
+            quota.commit("note/create")
+            admitted += 1
+    quota.close()
+    return admitted
+
+
+def test_upload_endpoints_share_one_counter(state_dir):
+    quota = QuotaTracker(state_dir / "quota.sqlite3", limits={"upload": 3})
+
+    for endpoint in ("upload/prepare", "upload/url", "upload/prepare"):
+        quota.admit(endpoint)
+        quota.commit(endpoint)
+
+    with pytest.raises(QuotaExceededError):
+        quota.admit("upload/url")
+    assert quota.remaining("upload/prepare") == 0
+    assert quota.status()["upload"]["used"] == 3
+
+
+def test_counts_survive_restart(state_dir):
+    path = state_dir / "quota.sqlite3"
+    quota = QuotaTracker(path)
+    quota.admit("note/edit")
+    quota.commit("note/edit")
+    quota.close()
+
+    assert QuotaTracker(path).remaining("note/edit") == 999
+
+
+def test_low_priority_keeps_reserve():
+    quota = QuotaTracker(limits={"note/edit": 10}, low_priority_reserve=0.2)
+    for _ in range(8):
+        quota.admit("note/edit", "low")
+        quota.commit("note/edit")
+
+    with pytest.raises(QuotaExceededError, match="预留给高优先级调用"):
+        quota.admit("note/edit", "low")
+    quota.admit("note/edit", "high")
+    assert quota.remaining("note/edit") == 1
+
+
+def test_in_flight_reservation_is_refunded_on_release():
+    quota = QuotaTracker(limits={"note/set": 5})
+    quota.admit("note/set")
+
+    status = quota.status()["note/set"]
+    assert (status["used"], status["in_flight"], status["remaining"]) == (0, 1, 4)
+    quota.release("note/set")
+    assert quota.status()["note/set"]["remaining"] == 5
+
+
+def test_mark_exhausted_uses_server_answer():
+    quota = QuotaTracker()
+    quota.mark_exhausted("upload/url")
+
+    with pytest.raises(QuotaExceededError, match="今日配额已用完"):
+        quota.admit("upload/prepare")
+
+
+def test_concurrent_processes_never_exceed_limit(state_dir):
+    path = state_dir / "quota.sqlite3"
+    QuotaTracker(path).close()
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(4) as pool:
+        admitted = sum(pool.starmap(admit_many, [(str(path), 50)] * 4))
+
+    status = QuotaTracker(path, limits={"note/create": 60}).status()["note/create"]
+    assert admitted == 60
+    assert status["used"] == 60 and status["in_flight"] == 0
+
+
+async def test_client_rejects_locally_and_refunds_failures(api, stub):
+    api.quota.limits["upload"] = 2
+
+    stub.failures["upload/url"] = [400]
+    with pytest.raises(MowenAPIError):
+        await api.upload_file_url(1, "https://example.com/a.png")
+    await api.upload_file_url(1, "https://example.com/a.png")
+    await api.upload_file_url(1, "https://example.com/b.png")
+    with pytest.raises(QuotaExceededError):
+        await api.upload_file_url(1, "https://example.com/c.png")
+
+    assert stub.count("upload/url") == 3
@@ -0,0 +1,98 @@
+"""按端点限频：进程内令牌桶和多进程共用的SQLite时间表"""
+
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from mowen_mcp_server import server
+from mowen_mcp_server.config import Config
+from mowen_mcp_server.ratelimit import EndpointRateLimiter, SharedEndpointRateLimiter
+
+INTERVAL = 0.1
+
+
+async def test_requests_to_one_endpoint_are_spaced():
+    limiter = EndpointRateLimiter(interval=INTERVAL)
+    start = time.monotonic()
+
+    await asyncio.gather(*(limiter.acquire("note/edit") for _ in range(3)))
+    await limiter.acquire("note/create")
+
+    assert 2 * INTERVAL - 0.01 <= time.monotonic() - start < 3 * INTERVAL
+
+
+def test_processes_share_one_schedule(state_dir):
+    path = state_dir / "ratelimit.sqlite3"
+    first = SharedEndpointRateLimiter(path, "account", interval=1.0)
+    second = SharedEndpointRateLimiter(path, "account", interval=1.0)
+    other_account = SharedEndpointRateLimiter(path, "other", interval=1.0)
+
+    waits = [first.reserve("note/edit"), second.reserve("note/edit"), first.reserve("note/edit")]
+
+    assert waits[0] == 0
+    assert waits[1] == pytest.approx(1.0, abs=0.05)
+    assert waits[2] == pytest.approx(2.0, abs=0.05)
+    assert second.reserve("note/create") == 0
+    assert other_account.reserve("note/edit") == 0
+
+
+def test_burst_and_penalty(state_dir):
+    limiter = SharedEndpointRateLimiter(state_dir / "ratelimit.sqlite3", "account", interval=1.0, burst=2)
+
+    assert limiter.reserve("note/set") == 0
+    assert limiter.reserve("note/set") == 0
+    assert limiter.reserve("note/set") == pytest.approx(1.0, abs=0.05)
+
+    limiter.penalize("note/edit")
+    assert limiter.reserve("note/edit") == pytest.approx(1.0, abs=0.05)
+
+
+async def test_closed_limiter_falls_back_to_process(state_dir):
+    limiter = SharedEndpointRateLimiter(state_dir / "ratelimit.sqlite3", "account", interval=INTERVAL)
+    limiter.close()
+    start = time.monotonic()
+
+    await limiter.acquire("note/edit")
+    await limiter.acquire("note/edit")
+    limiter.penalize("note/edit")
+
+    assert time.monotonic() - start >= INTERVAL - 0.01
+
+
+async def test_waiting_for_write_lock_does_not_block_loop(state_dir):
+    path = state_dir / "ratelimit.sqlite3"
+    limiter = SharedEndpointRateLimiter(path, "account", interval=INTERVAL, busy_timeout=0.3)
+    # 模拟另一个进程长时间持有写锁
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    ticks = 0
+
+    async def tick() -> None:
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticker = asyncio.create_task(tick())
+    try:
+        await limiter.acquire("note/edit")
+    finally:
+        ticker.cancel()
+        other.rollback()
+        other.close()
+        limiter.close()
+
+    assert ticks >= 10
+
+
+async def test_client_spaces_requests(stub, monkeypatch):
+    monkeypatch.setenv("MOWEN_RATE_LIMIT_INTERVAL", str(INTERVAL))
+    async with server.MowenAPI("test-key", stub.base_url, Config()) as api:
+        assert isinstance(api.rate_limiter, SharedEndpointRateLimiter)
+        start = time.monotonic()
+        await asyncio.gather(*(api.set_note_privacy(f"note-{i}", "public") for i in range(3)))
+
+    assert time.monotonic() - start >= 2 * INTERVAL - 0.01
+    assert stub.count("note/set") == 3
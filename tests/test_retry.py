@@ -0,0 +1,77 @@
+"""重试引擎：只在安全时重试，并受重试预算限制"""
+
+import httpx
+import pytest
+
+from mowen_mcp_server.errors import MowenAPIError
+from mowen_mcp_server.retry import RetryBudget, RetryController, RetryPolicy
+
+BODY = {"type": "doc", "content": [{"type": "paragraph", "content": [{"type": "text", "text": "retry"}]}]}
+
+
+async def test_idempotent_endpoint_retries_server_errors(api, stub):
+    stub.failures["note/edit"] = [503, 502]
+
+    result = await api.edit_note("note-1", BODY)
+
+    assert result == {"noteId": "stub-note-id"}
+    assert stub.count("note/edit") == 3
+
+
+async def test_create_is_not_retried_after_server_error(api, stub):
+    # 5xx 时请求可能已经被处理，重试 note/create 可能多建一篇笔记
+    stub.failures["note/create"] = [503]
+
+    with pytest.raises(MowenAPIError) as excinfo:
+        await api.create_note(BODY)
+
+    assert excinfo.value.status_code == 503
+    assert stub.count("note/create") == 1
+
+
+async def test_create_is_retried_after_rate_limit(api, stub):
+    # 429 表示请求在处理前就被拦截，任何端点都可以重试
+    stub.failures["note/create"] = [429]
+
+    await api.create_note(BODY)
+
+    assert stub.count("note/create") == 2
+
+
+async def test_gives_up_after_max_attempts(api, stub):
+    stub.failures["note/edit"] = [503] * 5
+
+    with pytest.raises(MowenAPIError):
+        await api.edit_note("note-1", BODY)
+
+    assert stub.count("note/edit") == api.retry.policy("note/edit").max_attempts
+
+
+def test_transport_errors_follow_idempotency():
+    create = RetryPolicy(idempotent=False)
+    edit = RetryPolicy()
+    request = httpx.Request("POST", "http://stub/")
+
+    assert create.should_retry(httpx.ConnectError("refused", request=request))
+    assert not create.should_retry(httpx.ReadTimeout("timeout", request=request))
+    assert edit.should_retry(httpx.ReadTimeout("timeout", request=request))
+    assert not edit.should_retry(MowenAPIError(400, "PARAMS", "bad request"))
+
+
+async def test_budget_stops_retries():
+    controller = RetryController(
+        default=RetryPolicy(max_attempts=5, base_delay=0), budget=RetryBudget(ratio=0.1, max_tokens=1)
+    )
+    attempts = 0
+
+    async def attempt():
+        nonlocal attempts
+        attempts += 1
+        raise MowenAPIError(503, "STUB", "unavailable")
+
+    with pytest.raises(MowenAPIError):
+        await controller.run("note/edit", attempt)
+
+    # 预算只够一次重试
+    assert attempts == 2
+    assert controller.budget.tokens < 1